@@ -0,0 +1,298 @@
+import os
+import socket
+import threading
+
+from dotenv import load_dotenv
+
+from bale_client import BaleClient
+from db import Database
+from jalali_calendar import BookingCalendar
+from migrations import migrate
+from reminders import ReminderService, parse_leads
+from repositories import create_repository
+from schedule import load_schedule_book
+from send_queue import SendQueue
+from sessions import create_session_store
+
+# منطقه زمانی ثابت (تهران)
+USER_TIMEZONE = "Asia/Tehran"
+
+
+# تنظیمات ربات از متغیرهای محیطی؛ env یک دیکشنری (مثلا os.environ) است
+class Config:
+    def __init__(self, env):
+        self.bot_token = env.get("BALETOKEN")
+        # فقط برای اجرای ربات لازم است و در اولین خواندن admin_user_id بررسی می‌شود
+        self._admin_user_id = env.get("ADMIN_USER_ID")
+        # آدرس API بله؛ برای تست بار می‌تواند به سرور جایگزین (fakebale.py) اشاره کند
+        self.bale_api_base = env.get("BALE_API_BASE", "https://tapi.bale.ai").rstrip("/")
+        self.base_url = f"{self.bale_api_base}/bot{self.bot_token}"
+        self.bale_connect_timeout = float(env.get("BALE_CONNECT_TIMEOUT", "5"))
+        self.bale_read_timeout = float(env.get("BALE_READ_TIMEOUT", "15"))
+        self.bale_max_retries = int(env.get("BALE_MAX_RETRIES", "3"))
+        self.bale_pool_size = int(env.get("BALE_POOL_SIZE", "20"))
+
+        # متریک‌های داخلی ربات (در صورت تعیین METRICS_PORT روی http://METRICS_HOST:METRICS_PORT/metrics)
+        self.metrics_host = env.get("METRICS_HOST", "127.0.0.1")
+        self.metrics_port = int(env.get("METRICS_PORT", "0"))
+        # کسری از رویدادهای پرتکرار (مثل تحویل هر پیام) که در لاگ ثبت می‌شوند
+        self.log_sample_rate = float(env.get("LOG_SAMPLE_RATE", "0.05"))
+
+        # صف خروجی پیام‌ها
+        self.send_workers = int(env.get("SEND_WORKERS", "4"))
+        self.send_global_rate = float(env.get("SEND_GLOBAL_RATE", "30"))
+        self.send_global_burst = int(env.get("SEND_GLOBAL_BURST", "30"))
+        self.send_chat_rate = float(env.get("SEND_CHAT_RATE", "1"))
+        self.send_chat_burst = int(env.get("SEND_CHAT_BURST", "3"))
+        self.send_max_attempts = int(env.get("SEND_MAX_ATTEMPTS", "5"))
+
+        # پایگاه داده
+        self.db_path = env.get("DB_PATH", "barbershop.db")
+        self.db_busy_timeout = int(env.get("DB_BUSY_TIMEOUT", "5000"))
+        self.db_cache_size = int(env.get("DB_CACHE_SIZE", "-20000"))
+        self.db_synchronous = env.get("DB_SYNCHRONOUS", "NORMAL")
+        # محل نگهداری آرایشگرها، نوبت‌ها و رزروها: sqlite (همان DB_PATH)، postgres (DATABASE_URL) یا memory
+        # برای اجرای چند نمونه ربات روی چند سرور با داده مشترک postgres لازم است
+        self.storage_backend = env.get("STORAGE_BACKEND", "sqlite")
+        self.database_url = env.get("DATABASE_URL")
+        self.db_pool_size = int(env.get("DB_POOL_SIZE", "10"))
+
+        # برنامه کاری آرایشگرها، مدت خدمات و تعداد روزهای قابل رزرو
+        self.schedule_file = env.get("SCHEDULE_FILE")
+        self.booking_horizon_days = env.get("BOOKING_HORIZON_DAYS")
+
+        # ذخیره‌ساز وضعیت گفتگوی هر کاربر: memory، sqlite (فایل SESSION_DB_PATH) یا repository (مخزن داده؛
+        # پیش‌فرض با STORAGE_BACKEND=postgres تا وضعیت گفتگو بین نمونه‌های ربات مشترک باشد)
+        self.session_backend = env.get(
+            "SESSION_BACKEND", "repository" if self.storage_backend == "postgres" else "memory"
+        )
+        self.session_ttl = int(env.get("SESSION_TTL", "21600"))
+        self.session_max_size = int(env.get("SESSION_MAX_SIZE", "10000"))
+        self.session_db_path = env.get("SESSION_DB_PATH", self.db_path)
+
+        # تنظیمات پردازش همزمان آپدیت‌ها
+        self.dispatcher_workers = int(env.get("DISPATCHER_WORKERS", "8"))
+        self.dispatcher_max_pending = int(env.get("DISPATCHER_MAX_PENDING", "1000"))
+        self.stats_log_interval = int(env.get("STATS_LOG_INTERVAL", "60"))
+        # تعداد پروسس‌های کارگر؛ با بیشتر از ۱ آپدیت‌ها بر اساس chat_id بین پروسس‌ها پخش می‌شوند
+        self.worker_processes = int(env.get("WORKER_PROCESSES", "1"))
+
+        # نحوه دریافت آپدیت‌ها: polling (getUpdates) یا webhook
+        self.bot_mode = env.get("BOT_MODE", "polling")
+        self.webhook_url = env.get("WEBHOOK_URL")
+        self.webhook_host = env.get("WEBHOOK_HOST", "0.0.0.0")
+        self.webhook_port = int(env.get("WEBHOOK_PORT", "8080"))
+        self.webhook_path = env.get("WEBHOOK_PATH", "/webhook")
+        self.webhook_secret = env.get("WEBHOOK_SECRET")
+        # مدت نگهداری شناسه آپدیت‌های پردازش‌شده برای جلوگیری از پردازش تکراری (ثانیه)
+        self.processed_updates_ttl = int(env.get("PROCESSED_UPDATES_TTL", "86400"))
+        # شناسه این نمونه ربات (برای هر نمونه باید یکتا باشد) و مدتی (ثانیه) که بعد از آن آپدیتی که پردازشش
+        # در نمونه دیگری تمام نشده دوباره پردازش می‌شود
+        self.node_id = env.get("NODE_ID") or socket.gethostname()
+        self.update_claim_lease = int(env.get("UPDATE_CLAIM_LEASE", "300"))
+        # حداکثر تاخیر بین تلاش‌های مجدد getUpdates بعد از خطا (ثانیه)
+        self.poll_backoff_max = float(env.get("POLL_BACKOFF_MAX", "60"))
+        # فاصله اجرای کارهای نگهداری (بایگانی نوبت‌های گذشته و پاکسازی سوابق) به ثانیه
+        self.maintenance_interval = int(env.get("MAINTENANCE_INTERVAL", "3600"))
+        self.archive_batch_size = int(env.get("ARCHIVE_BATCH_SIZE", "500"))
+        # فایل آرایشگرها، اندازه هر دسته در ورود اطلاعات و فاصله گزارش پیشرفت به ادمین (ثانیه)
+        self.barbers_csv_path = env.get("BARBERS_CSV_PATH", "barbers.csv")
+        self.import_chunk_size = int(env.get("IMPORT_CHUNK_SIZE", "500"))
+        self.import_progress_interval = float(env.get("IMPORT_PROGRESS_INTERVAL", "5"))
+        # هندلرهایی که بیشتر از این مدت (ثانیه) طول بکشند در لاگ ثبت می‌شوند
+        self.slow_route_threshold = float(env.get("SLOW_ROUTE_THRESHOLD", "0.5"))
+
+        # یادآوری نوبت‌ها: فاصله یادآوری‌ها تا شروع نوبت (h ساعت، m دقیقه؛ خالی یعنی بدون یادآوری)
+        self.reminder_leads = env.get("REMINDER_LEADS", "24h,1h")
+        # فاصله صف کردن یادآوری‌های جدید و فاصله ارسال دسته‌ها (ثانیه)
+        self.reminder_plan_interval = int(env.get("REMINDER_PLAN_INTERVAL", "60"))
+        self.reminder_send_interval = int(env.get("REMINDER_SEND_INTERVAL", "5"))
+        # حداکثر نرخ ارسال یادآوری‌ها (پیام در ثانیه، بخشی از SEND_GLOBAL_RATE؛ در حالت چند پروسسی از سهم کارگرها کم می‌شود) و اندازه هر دسته
+        self.reminder_rate = float(env.get("REMINDER_RATE", "10"))
+        self.reminder_batch_size = int(env.get("REMINDER_BATCH_SIZE", "200"))
+        # مدتی (ثانیه) که یادآوری برداشته‌شده تا ثبت نتیجه ارسال در اختیار این نمونه ربات می‌ماند
+        self.reminder_lease = int(env.get("REMINDER_LEASE", "600"))
+        self.reminder_max_attempts = int(env.get("REMINDER_MAX_ATTEMPTS", "3"))
+        # مدت نگهداری سوابق یادآوری‌های تمام شده (ثانیه)
+        self.reminder_retention = int(env.get("REMINDER_RETENTION", "604800"))
+
+    # سهم هر پروسس از SEND_GLOBAL_RATE وقتی workers پروسس کارگر اجرا می‌شوند: (نرخ، burst)
+    # پروسس ناظر (supervisor=True) فقط یادآوری‌ها را ارسال می‌کند؛ سهم آن (REMINDER_RATE، حداکثر نصف کل)
+    # کنار گذاشته و باقیمانده بین کارگرها تقسیم می‌شود تا مجموع نرخ ارسال از SEND_GLOBAL_RATE بیشتر نشود
+    def send_rate_share(self, workers, supervisor=False):
+        reserved = min(self.reminder_rate, self.send_global_rate / 2) if self.reminder_leads.strip() else 0
+        rate = reserved if supervisor else (self.send_global_rate - reserved) / workers
+        burst = max(1, int(self.send_global_burst * rate / self.send_global_rate))
+        return rate, burst
+
+    @property
+    def admin_user_id(self):
+        if self._admin_user_id is None:
+            raise ValueError("متغیر محیطی ADMIN_USER_ID در فایل .env تعریف نشده است.")
+        return int(self._admin_user_id)
+
+
+# تابع برای خواندن تنظیمات؛ بدون env ابتدا فایل .env بارگذاری می‌شود
+def load_config(env=None):
+    if env is None:
+        load_dotenv()
+        env = os.environ
+    return Config(env)
+
+
+# شی برنامه: تنظیمات، پایگاه داده، کلاینت API و سایر منابع مشترک در اولین استفاده ساخته می‌شوند
+# پس import کردن ماژول‌های ربات هیچ فایل یا اتصالی باز نمی‌کند
+# deliver(method, payload) ارسال‌کننده صف خروجی است؛ api_observer، query_observer و reminder_observer برای متریک‌ها هستند
+class App:
+    def __init__(self, config=None, deliver=None, api_observer=None, query_observer=None, reminder_observer=None):
+        self.deliver = deliver
+        self.api_observer = api_observer
+        self.query_observer = query_observer
+        self.reminder_observer = reminder_observer
+        self._lock = threading.RLock()
+        self._resources = {}
+        if config is not None:
+            self._resources["config"] = config
+
+    # منبع name را در صورت نیاز با factory می‌سازد (فقط یک بار، حتی با چند ترد همزمان)
+    def _resource(self, name, factory):
+        resource = self._resources.get(name)
+        if resource is None:
+            with self._lock:
+                resource = self._resources.get(name)
+                if resource is None:
+                    resource = self._resources[name] = factory()
+        return resource
+
+    def created(self, name):
+        return name in self._resources
+
+    @property
+    def config(self):
+        return self._resource("config", load_config)
+
+    # کلاینت مشترک برای همه درخواست‌های API بله
+    @property
+    def bale(self):
+        def create():
+            config = self.config
+            return BaleClient(
+                config.base_url,
+                connect_timeout=config.bale_connect_timeout,
+                read_timeout=config.bale_read_timeout,
+                max_retries=config.bale_max_retries,
+                pool_size=config.bale_pool_size,
+                observer=self.api_observer,
+            )
+
+        return self._resource("bale", create)
+
+    # صف خروجی پیام‌ها با محدودیت نرخ سراسری و محدودیت نرخ هر چت
+    @property
+    def outbox(self):
+        def create():
+            config = self.config
+            return SendQueue(
+                self.deliver,
+                workers=config.send_workers,
+                global_rate=config.send_global_rate,
+                global_burst=config.send_global_burst,
+                chat_rate=config.send_chat_rate,
+                chat_burst=config.send_chat_burst,
+                max_attempts=config.send_max_attempts,
+            )
+
+        return self._resource("outbox", create)
+
+    # اتصال به پایگاه داده (هر ترد اتصال جداگانه دارد)؛ اسکیما در اولین استفاده به‌روز می‌شود
+    # اگر نسخه اسکیما به‌روز باشد migrate فقط یک PRAGMA می‌خواند
+    @property
+    def db(self):
+        def create():
+            config = self.config
+            db = Database(
+                config.db_path,
+                busy_timeout=config.db_busy_timeout,
+                cache_size=config.db_cache_size,
+                synchronous=config.db_synchronous,
+                query_observer=self.query_observer,
+            )
+            migrate(db.connection())
+            return db
+
+        return self._resource("db", create)
+
+    # مخزن داده آرایشگرها، نوبت‌ها، رزروها و پرداخت‌ها
+    @property
+    def repository(self):
+        def create():
+            config = self.config
+            return create_repository(
+                config.storage_backend,
+                db=self.db if config.storage_backend == "sqlite" else None,
+                dsn=config.database_url,
+                pool_size=config.db_pool_size,
+            )
+
+        return self._resource("repository", create)
+
+    @property
+    def sessions(self):
+        def create():
+            config = self.config
+            return create_session_store(
+                config.session_backend,
+                ttl=config.session_ttl,
+                max_size=config.session_max_size,
+                db_path=config.session_db_path,
+                repository=self.repository if config.session_backend == "repository" else None,
+            )
+
+        return self._resource("sessions", create)
+
+    # برنامه کاری آرایشگرها (پیش‌فرض: ۸ تا ۱۴ و ۱۶ تا ۲۱، نوبت یک ساعته، VIP دو نوبت پشت سر هم و رزرو تا ۳ روز)
+    @property
+    def schedules(self):
+        return self._resource(
+            "schedules",
+            lambda: load_schedule_book(self.config.schedule_file, self.config.booking_horizon_days),
+        )
+
+    # تقویم مشترک روزهای قابل رزرو (تاریخ‌های شمسی روزانه یک بار محاسبه می‌شوند)
+    @property
+    def calendar(self):
+        return self._resource(
+            "calendar", lambda: BookingCalendar(USER_TIMEZONE, horizon=self.schedules.horizon)
+        )
+
+    # یادآوری نوبت‌ها (صف یادآوری‌ها در همان مخزن داده رزروها نگهداری می‌شود)
+    @property
+    def reminders(self):
+        def create():
+            config = self.config
+            return ReminderService(
+                self.repository,
+                self.calendar,
+                self.outbox,
+                parse_leads(config.reminder_leads),
+                rate=config.reminder_rate,
+                batch_size=config.reminder_batch_size,
+                lease=config.reminder_lease,
+                max_attempts=config.reminder_max_attempts,
+                lookahead=2 * config.reminder_plan_interval,
+                observer=self.reminder_observer,
+            )
+
+        return self._resource("reminders", create)
+
+    # توقف صف خروجی (بعد از ارسال پیام‌های باقیمانده) و بستن اتصال‌های پایگاه داده
+    # نتیجه یادآوری‌های ارسال شده قبل از بستن مخزن ثبت می‌شود تا بعد از اجرای دوباره تکرار نشوند
+    def close(self, timeout=None):
+        if self.created("outbox"):
+            self.outbox.stop(timeout)
+        if self.created("reminders"):
+            self.reminders.join(timeout)
+        if self.created("repository") and hasattr(self.repository, "close"):
+            self.repository.close()
+        if self.created("db"):
+            self.db.close_all()
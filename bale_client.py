@@ -0,0 +1,146 @@
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+JSON_HEADERS = {"Content-Type": "application/json; charset=utf-8"}
+
+
+# قاعده مشترک تلاش مجدد بعد از خطا (کلاینت API و صف خروجی)
+# خطاهای 4xx (به جز 429) با ارسال مجدد درست نمی‌شوند و بعد از تایم‌اوت خواندن، درخواست ممکن است
+# به سرور رسیده باشد؛ پس ارسال مجدد آن فقط برای متدهای idempotent (GET) مجاز است
+def is_retryable(error, idempotent=False):
+    if isinstance(error, requests.exceptions.HTTPError):
+        response = error.response
+        return response is not None and (response.status_code == 429 or response.status_code >= 500)
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.Timeout):
+        return idempotent
+    return isinstance(error, requests.exceptions.ConnectionError)
+
+
+# کلاینت مشترک API بله با اتصال‌های ماندگار (keep-alive)، تایم‌اوت و تلاش مجدد
+# observer(متد، مدت کل، خطا) در صورت تعیین بعد از هر فراخوانی صدا زده می‌شود
+class BaleClient:
+    def __init__(
+        self,
+        base_url,
+        connect_timeout=5,
+        read_timeout=15,
+        max_retries=3,
+        backoff_base=0.5,
+        backoff_max=10,
+        pool_size=20,
+        observer=None,
+    ):
+        self.base_url = base_url
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.observer = observer
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    # فراخوانی یک متد API؛ در صورت خطای نهایی RequestException پرتاب می‌شود
+    # data: بدنه JSON از پیش ساخته‌شده (bytes) به جای payload
+    def call(self, method, payload=None, params=None, http_method="POST", read_timeout=None, data=None):
+        url = f"{self.base_url}/{method}"
+        timeout = (self.connect_timeout, read_timeout or self.read_timeout)
+        # ارسال مجدد درخواست POST بعد از ReadTimeout ممکن است پیام تکراری بفرستد
+        idempotent = http_method == "GET"
+        attempt = 0
+        start = time.monotonic()
+
+        while True:
+            try:
+                response = self.session.request(
+                    http_method,
+                    url,
+                    json=payload,
+                    data=data,
+                    params=params,
+                    headers=JSON_HEADERS if data is not None else None,
+                    timeout=timeout,
+                )
+            except requests.exceptions.RequestException as e:
+                if not is_retryable(e, idempotent) or attempt >= self.max_retries:
+                    self._record(method, start, attempt, error=True)
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"{method} failed ({e}), retrying in {delay:.2f}s")
+            else:
+                status = response.status_code
+                if status == 429 and attempt < self.max_retries:
+                    delay = self._retry_after(response) or self._backoff(attempt)
+                    logger.warning(f"{method} rate limited, retrying in {delay:.2f}s")
+                elif status >= 500 and attempt < self.max_retries:
+                    delay = self._backoff(attempt)
+                    logger.warning(f"{method} returned {status}, retrying in {delay:.2f}s")
+                else:
+                    try:
+                        response.raise_for_status()
+                        result = response.json()
+                    except requests.exceptions.RequestException:
+                        self._record(method, start, attempt, error=True)
+                        raise
+                    self._record(method, start, attempt)
+                    return result
+
+            attempt += 1
+            time.sleep(delay)
+
+    # تاخیر نمایی با jitter کامل
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    # خواندن retry_after از بدنه پاسخ یا هدر Retry-After
+    def _retry_after(self, response):
+        try:
+            return float(response.json()["parameters"]["retry_after"])
+        except (ValueError, KeyError, TypeError):
+            pass
+        try:
+            return float(response.headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            return None
+
+    def _record(self, method, start, retries, error=False):
+        latency = time.monotonic() - start
+        with self._lock:
+            stats = self._stats.setdefault(
+                method,
+                {"calls": 0, "errors": 0, "retries": 0, "total_latency": 0.0, "max_latency": 0.0},
+            )
+            stats["calls"] += 1
+            stats["retries"] += retries
+            stats["total_latency"] += latency
+            stats["max_latency"] = max(stats["max_latency"], latency)
+            if error:
+                stats["errors"] += 1
+        if self.observer:
+            self.observer(method, latency, error)
+
+    # آمار تاخیر و تعداد تلاش‌های مجدد به تفکیک متد
+    def stats(self):
+        with self._lock:
+            return {
+                method: dict(
+                    stats,
+                    avg_latency=stats["total_latency"] / stats["calls"],
+                )
+                for method, stats in self._stats.items()
+            }
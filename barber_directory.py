@@ -0,0 +1,48 @@
+import threading
+import time
+
+# حداکثر فاصله بررسی نسخه آرایشگرها در پایگاه داده (ثانیه)
+VERSION_CHECK_INTERVAL = 5.0
+
+
+# کش اطلاعات آرایشگرها (id -> نام، آدرس، شماره کارت و ...)
+# بعد از هر تغییر در جدول barbers در همین پروسس باید invalidate صدا زده شود
+# version() (در صورت تعیین) نسخه آرایشگرها در پایگاه داده را برمی‌گرداند؛ هر check_interval ثانیه
+# بررسی می‌شود و با تغییر آن (مثلا ورود از CSV در پروسس کارگر یا سرور دیگر) کش دوباره خوانده می‌شود
+class BarberDirectory:
+    def __init__(self, loader, version=None, check_interval=VERSION_CHECK_INTERVAL):
+        self.loader = loader  # تابعی که لیست دیکشنری آرایشگرها را از پایگاه داده می‌خواند
+        self.version = version
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._barbers = None
+        self._version = None
+        self._next_check = 0.0
+
+    def _load(self):
+        barbers = self._barbers
+        if barbers is not None and (self.version is None or time.monotonic() < self._next_check):
+            return barbers
+        with self._lock:
+            if self.version is not None and time.monotonic() >= self._next_check:
+                # نسخه قبل از خواندن آرایشگرها خوانده می‌شود تا تغییر همزمان در بررسی بعدی دیده شود
+                version = self.version()
+                self._next_check = time.monotonic() + self.check_interval
+                if version != self._version:
+                    self._barbers = None
+                    self._version = version
+            if self._barbers is None:
+                self._barbers = {barber["id"]: barber for barber in self.loader()}
+            return self._barbers
+
+    def get(self, barber_id):
+        return self._load().get(barber_id)
+
+    # همه آرایشگرها به ترتیب id
+    def all(self):
+        return list(self._load().values())
+
+    def invalidate(self):
+        with self._lock:
+            self._barbers = None
+            self._next_check = 0.0
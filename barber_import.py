@@ -0,0 +1,142 @@
+import csv
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+CSV_COLUMNS = ("name", "phone", "address", "user_id", "card_number")
+IMPORT_CHUNK_SIZE = 500
+# حداکثر تعداد خطاهایی که در گزارش به ادمین نمایش داده می‌شود
+MAX_REPORTED_ERRORS = 10
+
+
+# خطای ورود اطلاعات آرایشگرها؛ errors لیست خطاهای ردیف‌ها است
+class BarberImportError(ValueError):
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} خطا در فایل آرایشگرها")
+        self.errors = errors
+
+
+# تابع برای اعتبارسنجی یک ردیف CSV؛ خروجی: (ردیف تمیز شده، خطا)
+def _validate_row(row):
+    values = {column: (row.get(column) or "").strip() for column in CSV_COLUMNS}
+    if not values["name"]:
+        return None, "نام خالی است"
+    if not values["user_id"].isdigit():
+        return None, f"شناسه کاربری نامعتبر است: {values['user_id']}"
+    if re.match(r"^09\d{9}$", values["phone"]) is None:
+        return None, f"شماره تماس نامعتبر است: {values['phone']}"
+    if re.match(r"^\d{16}$", values["card_number"]) is None:
+        return None, f"شماره کارت نامعتبر است: {values['card_number']}"
+    return (
+        values["name"],
+        values["phone"],
+        values["address"],
+        int(values["user_id"]),
+        values["card_number"],
+    ), None
+
+
+def _chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+# تابع برای خواندن و اعتبارسنجی همه ردیف‌های CSV (بدون تراکنش)؛ خروجی: لیست ردیف‌های تمیز شده
+# اگر حتی یک ردیف نامعتبر باشد BarberImportError برمی‌گردد
+# progress(ردیف‌های خوانده‌شده) بعد از هر chunk_size ردیف صدا زده می‌شود
+def read_barbers(file_path, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    errors = []
+    seen = set()
+    rows = []
+    with open(file_path, mode="r", encoding="utf-8", newline="") as file:
+        reader = csv.DictReader(file)
+        missing = [column for column in CSV_COLUMNS if column not in (reader.fieldnames or ())]
+        if missing:
+            raise BarberImportError([f"ستون‌های {', '.join(missing)} در فایل وجود ندارد"])
+
+        for line_number, row in enumerate(reader, start=2):
+            values, error = _validate_row(row)
+            if values and values[3] in seen:
+                error = f"شناسه کاربری تکراری است: {values[3]}"
+            if error:
+                errors.append(f"ردیف {line_number}: {error}")
+            else:
+                seen.add(values[3])
+                rows.append(values)
+            if progress and (line_number - 1) % chunk_size == 0:
+                progress(line_number - 1)
+
+    if errors:
+        raise BarberImportError(errors)
+    return rows
+
+
+# تابع برای ورود آرایشگرها از CSV
+# فایل ابتدا بدون تراکنش خوانده و اعتبارسنجی می‌شود (read_barbers) و تراکنش مخزن داده (repositories.py)
+# فقط برای مقایسه با آرایشگرهای فعلی و نوشتن دسته‌ای ردیف‌های جدید یا تغییرکرده باز می‌شود
+# آرایشگرهایی که در فایل نیستند فقط با remove_missing حذف می‌شوند (نوبت‌های خالی آنها هم حذف می‌شود؛
+# نوبت‌های رزرو شده دست نمی‌خورند)؛ در غیر این صورت تعدادشان در missing برمی‌گردد
+# نوبت‌ها فقط برای آرایشگرهای جدید ساخته می‌شوند و در صورت تغییر، نسخه آرایشگرها یکی زیاد می‌شود
+# اگر حتی یک ردیف نامعتبر باشد هیچ تغییری ذخیره نمی‌شود و BarberImportError برمی‌گردد
+def import_barbers(
+    repository,
+    file_path,
+    dates,
+    schedules,
+    chunk_size=IMPORT_CHUNK_SIZE,
+    progress=None,
+    remove_missing=False,
+):
+    rows = read_barbers(file_path, chunk_size, progress)
+    result = {
+        "rows": len(rows),
+        "added": 0,
+        "changed": 0,
+        "unchanged": 0,
+        "removed": 0,
+        "missing": 0,
+        "slots_created": 0,
+    }
+    added = []
+
+    with repository.transaction():
+        existing = repository.barber_records()
+        pending = []
+        for values in rows:
+            user_id = values[3]
+            current = existing.get(user_id)
+            if current is None:
+                added.append(user_id)
+                result["added"] += 1
+            elif current != values[:3] + values[4:]:
+                result["changed"] += 1
+            else:
+                result["unchanged"] += 1
+                continue
+            pending.append(values)
+        for chunk in _chunks(pending, chunk_size):
+            repository.upsert_barbers(chunk)
+
+        seen = {values[3] for values in rows}
+        missing = [user_id for user_id in existing if user_id not in seen]
+        if remove_missing:
+            for chunk in _chunks(missing, chunk_size):
+                repository.remove_barbers(chunk)
+            result["removed"] = len(missing)
+        else:
+            result["missing"] = len(missing)
+
+        for chunk in _chunks(added, chunk_size):
+            barber_ids = repository.barber_ids(chunk)
+            result["slots_created"] += repository.generate_slots(dates, schedules, barber_ids)
+
+        # کش آرایشگرها در همه پروسس‌ها و نمونه‌های ربات با تغییر نسخه دوباره خوانده می‌شود
+        if result["added"] or result["changed"] or result["removed"]:
+            repository.bump_barbers_version()
+
+    if progress:
+        progress(result["rows"])
+    logger.info(f"Barber import finished: {result}")
+    return result
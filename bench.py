@@ -0,0 +1,235 @@
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from migrations import migrate
+from slots import generate_slots, book_slot
+
+# ساعات و تاریخ‌های نمونه برای بنچمارک
+BENCH_HOURS = [
+    "08:00", "09:00", "10:00", "11:00", "12:00", "13:00",
+    "16:00", "17:00", "18:00", "19:00", "20:00",
+]
+BENCH_DATES = ["1403-01-01", "1403-01-02", "1403-01-03"]
+
+# کوئری‌های پرتکرار ربات و ایندکسی که هر کدام باید از آن استفاده کنند
+HOT_QUERIES = [
+    (
+        "show_available_slots",
+        "SELECT date, time FROM appointments WHERE barber_id=? AND status='خالی' AND date IN (?, ?, ?)",
+        (1, *BENCH_DATES),
+        "idx_appointments_barber_status",
+    ),
+    (
+        "show_empty_appointments",
+        "SELECT a.date, a.time, b.name FROM appointments a LEFT JOIN barbers b ON b.id = a.barber_id"
+        " WHERE a.status='خالی' ORDER BY a.date, a.time",
+        (),
+        "idx_appointments_status_date",
+    ),
+    (
+        "show_booked_appointments",
+        "SELECT a.date, a.time, a.name, b.name FROM appointments a LEFT JOIN barbers b ON b.id = a.barber_id"
+        " WHERE a.status='رزرو' ORDER BY a.date, a.time",
+        (),
+        "idx_appointments_status_date",
+    ),
+    (
+        "admin report filtered by barber",
+        "SELECT a.date, a.time, b.name FROM appointments a LEFT JOIN barbers b ON b.id = a.barber_id"
+        " WHERE a.status='خالی' AND a.barber_id=? ORDER BY a.date, a.time, a.id LIMIT 20 OFFSET 0",
+        (1,),
+        "idx_appointments_barber_status",
+    ),
+    (
+        "handle_message /start",
+        "SELECT date, time FROM appointments WHERE user_id=? ORDER BY date, time LIMIT 1",
+        (1,),
+        "idx_appointments_user",
+    ),
+    (
+        "cancel_appointment",
+        "SELECT barber_id, date, time FROM user_appointments WHERE user_id=? AND status='رزرو'",
+        (1,),
+        "idx_user_appointments_user_status",
+    ),
+    (
+        "cancel_appointment update",
+        "UPDATE appointments SET user_id=NULL, name=NULL, phone=NULL, service=NULL, status='خالی' WHERE date=? AND time=? AND barber_id=?",
+        ("1403-01-01", "08:00", 1),
+        "idx_appointments_slot",
+    ),
+    (
+        "show_my_appointment",
+        "SELECT ua.date, ua.time, b.name FROM user_appointments ua LEFT JOIN barbers b ON b.id = ua.barber_id"
+        " WHERE ua.user_id=? AND ua.status='رزرو' ORDER BY ua.date, ua.time",
+        (1,),
+        "idx_user_appointments_user_status",
+    ),
+    (
+        "pay_online",
+        "SELECT barber_id FROM user_appointments WHERE user_id=? AND status='رزرو'",
+        (1,),
+        "idx_user_appointments_user_status",
+    ),
+]
+
+
+# تابع برای ساخت یک پایگاه داده موقت با تعداد مشخصی آرایشگر
+def create_bench_db(barbers):
+    conn = sqlite3.connect(":memory:")
+    migrate(conn)
+    conn.executemany(
+        "INSERT INTO barbers (name, phone, address, user_id, card_number) VALUES (?, ?, ?, ?, ?)",
+        (
+            (f"barber {i}", "09120000000", "address", i, "6037990000000000")
+            for i in range(1, barbers + 1)
+        ),
+    )
+    conn.commit()
+    return conn
+
+
+# روش قدیمی: یک SELECT و یک INSERT برای هر نوبت (فقط برای مقایسه)
+def legacy_generate_slots(cursor, dates, hours):
+    cursor.execute("SELECT id FROM barbers")
+    for (barber_id,) in cursor.fetchall():
+        for date in dates:
+            for hour in hours:
+                cursor.execute(
+                    "SELECT * FROM appointments WHERE date=? AND time=? AND barber_id=?",
+                    (date, hour, barber_id),
+                )
+                if not cursor.fetchone():
+                    cursor.execute(
+                        "INSERT INTO appointments (date, time, status, barber_id) VALUES (?, ?, ?, ?)",
+                        (date, hour, "خالی", barber_id),
+                    )
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+# بنچمارک ساخت نوبت‌ها: اجرای اول (جدول خالی) و اجرای دوم (همه نوبت‌ها موجود)
+def bench_slot_generation(barbers):
+    results = {}
+    for name, func in (("bulk", generate_slots), ("legacy", legacy_generate_slots)):
+        conn = create_bench_db(barbers)
+        cursor = conn.cursor()
+        cold, _ = timed(func, cursor, BENCH_DATES, BENCH_HOURS)
+        conn.commit()
+        warm, _ = timed(func, cursor, BENCH_DATES, BENCH_HOURS)
+        conn.commit()
+        rows = cursor.execute("SELECT COUNT(*) FROM appointments").fetchone()[0]
+        results[name] = {"cold": cold, "warm": warm, "rows": rows}
+        conn.close()
+    return results
+
+
+# خروجی EXPLAIN QUERY PLAN یک کوئری به صورت یک رشته
+def query_plan(conn, query, params):
+    return " | ".join(row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall())
+
+
+# بررسی EXPLAIN QUERY PLAN کوئری‌های پرتکرار؛ لیست کوئری‌هایی که از ایندکس مورد انتظار استفاده نمی‌کنند
+def check_query_plans(conn):
+    failures = []
+    for name, query, params, index in HOT_QUERIES:
+        details = query_plan(conn, query, params)
+        uses_index = f"INDEX {index}" in details
+        print(f"  {'ok  ' if uses_index else 'FAIL'} {name}: {details}")
+        if not uses_index:
+            failures.append(name)
+    return failures
+
+
+# تست فشار رزرو: تعداد زیادی ترد (هر کدام با اتصال جداگانه) همزمان یک نوبت را رزرو می‌کنند
+# دقیقا یک رزرو باید موفق شود و فقط یک ردیف در user_appointments ثبت شود
+def bench_booking_race(attempts):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "race.db")
+        conn = sqlite3.connect(path)
+        migrate(conn)
+        conn.execute("INSERT INTO barbers (name, user_id) VALUES ('barber', 1)")
+        generate_slots(conn.cursor(), BENCH_DATES[:1], BENCH_HOURS[:1])
+        conn.commit()
+        conn.close()
+
+        barrier = threading.Barrier(attempts)
+        results = []
+        errors = []
+
+        def book(user_id):
+            worker_conn = sqlite3.connect(path, timeout=60)
+            try:
+                barrier.wait()
+                results.append(
+                    book_slot(
+                        worker_conn, user_id, 1, BENCH_DATES[0], [BENCH_HOURS[0]],
+                        "service_haircut", f"user {user_id}", "09120000000",
+                    )
+                )
+            except Exception as e:
+                errors.append(e)
+            finally:
+                worker_conn.close()
+
+        threads = [threading.Thread(target=book, args=(i,)) for i in range(attempts)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        conn = sqlite3.connect(path)
+        bookings = conn.execute("SELECT COUNT(*) FROM user_appointments").fetchone()[0]
+        conn.close()
+    return {
+        "elapsed": elapsed,
+        "succeeded": results.count(True),
+        "conflicts": results.count(False),
+        "errors": len(errors),
+        "bookings": bookings,
+    }
+
+
+def run(args):
+    print("query plans:")
+    conn = create_bench_db(args.barbers)
+    generate_slots(conn.cursor(), BENCH_DATES, BENCH_HOURS)
+    conn.execute("ANALYZE")
+    failures = check_query_plans(conn)
+    conn.close()
+
+    results = bench_slot_generation(args.barbers)
+    print(f"slot generation, {args.barbers} barbers:")
+    for name, result in results.items():
+        print(
+            f"  {name:<7} cold {result['cold'] * 1000:8.1f} ms"
+            f"  warm {result['warm'] * 1000:8.1f} ms  rows {result['rows']}"
+        )
+
+    race = bench_booking_race(args.race)
+    race_ok = race["succeeded"] == 1 and race["bookings"] == 1 and not race["errors"]
+    print(
+        f"booking race, {args.race} concurrent attempts on one slot: "
+        f"{'ok' if race_ok else 'FAIL'} {race['elapsed'] * 1000:.1f} ms, "
+        f"{race['succeeded']} booked, {race['conflicts']} conflicts, {race['errors']} errors"
+    )
+    if not race_ok:
+        failures.append("booking race")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="بنچمارک عملیات پایگاه داده ربات")
+    parser.add_argument("--barbers", type=int, default=1000)
+    parser.add_argument("--race", type=int, default=300)
+    raise SystemExit(run(parser.parse_args()))
@@ -0,0 +1,58 @@
+import time
+
+
+# تابع برای شروع پردازش آپدیت توسط owner (شناسه نمونه ربات)؛ اگر پردازش آن قبلا تمام شده یا نمونه دیگری
+# کمتر از lease ثانیه پیش آن را شروع کرده باشد False برمی‌گرداند
+# پردازشی که تمام نشده (مثلا به دلیل از کار افتادن پروسس) بعد از lease ثانیه دوباره قابل شروع است
+def claim_update(conn, update_id, owner, lease):
+    now = time.time()
+    cursor = conn.execute(
+        """
+        INSERT INTO processed_updates (update_id, received_at, owner) VALUES (?, ?, ?)
+        ON CONFLICT(update_id) DO UPDATE SET received_at=excluded.received_at, owner=excluded.owner
+        WHERE processed_updates.finished_at IS NULL AND processed_updates.received_at < ?
+        """,
+        (update_id, now, owner, now - lease),
+    )
+    return cursor.rowcount == 1
+
+
+# تابع برای ثبت پایان پردازش آپدیت؛ فقط بعد از اجرای کامل هندلر صدا زده می‌شود
+def finish_update(conn, update_id):
+    conn.execute("UPDATE processed_updates SET finished_at=? WHERE update_id=?", (time.time(), update_id))
+
+
+# تابع برای آزاد کردن آپدیت‌هایی که پردازششان شروع شده ولی تمام نشده تا دوباره پردازش شوند
+# (آپدیت‌های owner بعد از ری‌استارت همان نمونه، یا update_ids بعد از از کار افتادن پروسس کارگر)
+def release_updates(conn, owner=None, update_ids=None):
+    query = "DELETE FROM processed_updates WHERE finished_at IS NULL"
+    params = []
+    if owner is not None:
+        query += " AND owner=?"
+        params.append(owner)
+    if update_ids is not None:
+        query += f" AND update_id IN ({','.join('?' * len(update_ids))})"
+        params.extend(update_ids)
+    return conn.execute(query, params).rowcount
+
+
+# تابع برای حذف سوابق قدیمی آپدیت‌های پردازش‌شده
+def prune_processed_updates(conn, max_age):
+    cursor = conn.execute(
+        "DELETE FROM processed_updates WHERE received_at < ?", (time.time() - max_age,)
+    )
+    return cursor.rowcount
+
+
+# تابع برای خواندن یک مقدار از جدول bot_state
+def get_state(conn, key, default=None):
+    row = conn.execute("SELECT value FROM bot_state WHERE key=?", (key,)).fetchone()
+    return row[0] if row else default
+
+
+# تابع برای ذخیره یک مقدار در جدول bot_state
+def set_state(conn, key, value):
+    conn.execute(
+        "INSERT INTO bot_state (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+        (key, str(value)),
+    )
@@ -0,0 +1,224 @@
+import logging
+import multiprocessing
+import signal
+import threading
+import time
+import zlib
+
+from dispatcher import UpdateDispatcher, get_update_chat_id
+
+logger = logging.getLogger(__name__)
+
+# فاصله بررسی زنده بودن پروسس‌های کارگر (ثانیه)
+MONITOR_INTERVAL = 1.0
+# حداکثر زمان انتظار برای اتمام کار هر کارگر هنگام توقف (ثانیه)
+DRAIN_TIMEOUT = 30.0
+
+_STOP = None
+
+
+# شماره shard هر چت؛ crc32 در همه پروسس‌ها و اجراها یکسان است (برخلاف hash رشته‌ها)
+def shard_for(chat_id, shards):
+    if chat_id is None:
+        return 0
+    return zlib.crc32(str(chat_id).encode("ascii")) % shards
+
+
+# ناظر پروسس‌های کارگر: هر کارگر آپدیت‌های چت‌های یک shard را پردازش می‌کند
+# پس ترتیب آپدیت‌های هر کاربر حفظ می‌شود و پردازش روی چند هسته پخش می‌شود
+# رابط آن مثل UpdateDispatcher است (submit، completed_watermark، stats و shutdown)
+# تا run_polling و run_webhook بدون تغییر از آن استفاده کنند
+# آپدیت‌ها تا تایید کارگر نگه داشته می‌شوند؛ اگر کارگری از کار بیفتد دوباره راه‌اندازی
+# و آپدیت‌های تایید نشده‌اش دوباره ارسال می‌شوند
+# release(update_ids) در صورت تعیین قبل از ارسال دوباره صدا زده می‌شود تا شروع پردازش آنها توسط
+# کارگر از کار افتاده پاک شود (آپدیت‌هایی که پردازششان تمام شده با claim_update رد می‌شوند)
+class ClusterSupervisor:
+    def __init__(self, workers, max_pending=1000, drain_timeout=DRAIN_TIMEOUT, release=None):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.drain_timeout = drain_timeout
+        self.release = release
+        # spawn به جای fork: پروسس ناظر تردهای زیادی (زمان‌بند، کلاینت HTTP) دارد
+        self._context = multiprocessing.get_context("spawn")
+        self._acks = self._context.Queue()
+        self._inboxes = [None] * workers
+        self._processes = [None] * workers
+        self._unacked = [{} for _ in range(workers)]  # update_id -> آپدیت، به ترتیب ارسال
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        self._outstanding = set()
+        self._last_submitted = 0
+        self._pending = 0
+        self._processed = 0
+        self._restarts = 0
+        self._max_pending_seen = 0
+        self._stopping = threading.Event()
+        self._threads = []
+        self._stopped = False
+
+    def start(self):
+        with self._lock:
+            for shard in range(self.workers):
+                self._start_worker(shard)
+        for target, name in ((self._collect_acks, "cluster-acks"), (self._monitor, "cluster-monitor")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Cluster started with {self.workers} worker processes")
+
+    # باید با قفل صدا زده شود؛ هر کارگر صف ورودی تازه می‌گیرد تا صف کارگر قبلی
+    # (که ممکن است وسط خواندن از بین رفته باشد) دوباره استفاده نشود
+    def _start_worker(self, shard):
+        inbox = self._context.Queue()
+        process = self._context.Process(
+            target=run_worker,
+            args=(shard, self.workers, inbox, self._acks),
+            name=f"bot-worker-{shard}",
+            daemon=True,
+        )
+        process.start()
+        self._inboxes[shard] = inbox
+        self._processes[shard] = process
+        for update in self._unacked[shard].values():
+            inbox.put(update)
+
+    # افزودن آپدیت به صف shard آن؛ اگر تعداد آپدیت‌های تایید نشده زیاد باشد منتظر می‌ماند
+    def submit(self, update):
+        shard = shard_for(get_update_chat_id(update), self.workers)
+        update_id = update["update_id"]
+        with self._not_full:
+            while self._pending >= self.max_pending:
+                self._not_full.wait()
+            self._pending += 1
+            self._max_pending_seen = max(self._max_pending_seen, self._pending)
+            self._outstanding.add(update_id)
+            self._last_submitted = max(self._last_submitted, update_id)
+            self._unacked[shard][update_id] = update
+            self._inboxes[shard].put(update)
+
+    # دریافت تایید پردازش آپدیت‌ها از کارگرها
+    def _collect_acks(self):
+        while True:
+            ack = self._acks.get()
+            if ack is _STOP:
+                return
+            shard, update_id = ack
+            with self._not_full:
+                if self._unacked[shard].pop(update_id, None) is None:
+                    continue
+                self._outstanding.discard(update_id)
+                self._pending -= 1
+                self._processed += 1
+                self._not_full.notify()
+
+    # راه‌اندازی دوباره کارگرهایی که متوقف شده‌اند
+    def _monitor(self):
+        while not self._stopping.wait(MONITOR_INTERVAL):
+            with self._lock:
+                if self._stopping.is_set():
+                    return
+                for shard, process in enumerate(self._processes):
+                    if process.is_alive():
+                        continue
+                    self._restarts += 1
+                    logger.error(
+                        f"Worker {shard} exited with code {process.exitcode}, restarting "
+                        f"({len(self._unacked[shard])} updates to redeliver)"
+                    )
+                    process.join()
+                    if self.release is not None and self._unacked[shard]:
+                        try:
+                            self.release(list(self._unacked[shard]))
+                        except Exception:
+                            logger.exception(f"Error releasing updates of worker {shard}")
+                    self._start_worker(shard)
+
+    # بزرگترین update_id که پردازش آن و همه آپدیت‌های قبل از آن تمام شده است
+    def completed_watermark(self):
+        with self._lock:
+            if self._outstanding:
+                return min(self._outstanding) - 1
+            return self._last_submitted
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": self._pending,
+                "pending_by_worker": [len(unacked) for unacked in self._unacked],
+                "processed": self._processed,
+                "restarts": self._restarts,
+                "alive": sum(process.is_alive() for process in self._processes),
+                "max_pending_seen": self._max_pending_seen,
+                "workers": self.workers,
+            }
+
+    # توقف مرتب: هر کارگر آپدیت‌های صفش و پیام‌های خروجی‌اش را تمام می‌کند و خارج می‌شود
+    # کارگرهایی که در drain_timeout تمام نشوند متوقف می‌شوند
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._stopping.set()
+            for inbox in self._inboxes:
+                inbox.put(_STOP)
+        deadline = time.monotonic() + (self.drain_timeout if wait else 0)
+        for shard, process in enumerate(self._processes):
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning(f"Worker {shard} did not stop in time, terminating")
+                process.terminate()
+                process.join()
+        self._acks.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        logger.info(f"Cluster stopped: {self.stats()}")
+
+
+# حلقه اصلی هر پروسس کارگر؛ آپدیت‌ها با UpdateDispatcher (ترتیب هر چت حفظ می‌شود) پردازش می‌شوند
+# کارگر زمان‌بند و دریافت آپدیت ندارد؛ این کارها فقط در پروسس ناظر انجام می‌شوند
+def run_worker(shard, shards, inbox, acks):
+    # Ctrl+C به همه پروسس‌های گروه می‌رسد؛ توقف کارگرها را ناظر مدیریت می‌کند
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO, format=f"%(levelname)s:worker-{shard}:%(name)s:%(message)s")
+    import main
+
+    app = main.app
+    config = app.config
+    # محدودیت نرخ سراسری ارسال (بعد از کنار گذاشتن سهم یادآوری‌های پروسس ناظر) بین کارگرها تقسیم می‌شود
+    config.send_global_rate, config.send_global_burst = config.send_rate_share(shards)
+    if config.metrics_port:
+        config.metrics_port += 1 + shard
+        main.start_metrics_server(config)
+
+    def handle(update):
+        try:
+            main.process_update(update)
+        finally:
+            acks.put((shard, update["update_id"]))
+
+    dispatcher = UpdateDispatcher(
+        handle,
+        max_workers=config.dispatcher_workers,
+        max_pending=config.dispatcher_max_pending,
+    )
+    main.DISPATCHER_PENDING.set_function(lambda: dispatcher.stats()["pending"])
+
+    def log_stats():
+        while True:
+            time.sleep(config.stats_log_interval)
+            main.log_stats(dispatcher)
+
+    threading.Thread(target=log_stats, name="stats", daemon=True).start()
+    try:
+        while True:
+            try:
+                update = inbox.get()
+            except (EOFError, OSError):
+                break
+            if update is _STOP:
+                break
+            dispatcher.submit(update)
+    finally:
+        dispatcher.shutdown(wait=True)
+        app.close(DRAIN_TIMEOUT)
@@ -0,0 +1,116 @@
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+# کرسری که زمان اجرای هر کوئری را به query_observer اتصال گزارش می‌دهد
+# (زمان خواندن ردیف‌ها بعد از execute جزو آن نیست)
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self.connection.query_observer(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self.connection.query_observer(sql, time.perf_counter() - start)
+
+
+class TimedConnection(sqlite3.Connection):
+    query_observer = None
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+# لایه اتصال به SQLite: هر ترد اتصال مخصوص خودش را دارد
+# اتصال‌ها در حالت autocommit هستند و تراکنش‌ها با transaction() به صورت صریح باز می‌شوند
+# query_observer(sql, مدت) در صورت تعیین بعد از اجرای هر کوئری صدا زده می‌شود
+class Database:
+    def __init__(
+        self,
+        path,
+        busy_timeout=5000,
+        cache_size=-20000,
+        synchronous="NORMAL",
+        query_observer=None,
+    ):
+        self.path = path
+        self.query_observer = query_observer
+        self.busy_timeout = busy_timeout
+        self.cache_size = cache_size
+        self.synchronous = synchronous
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout / 1000,
+            isolation_level=None,
+            check_same_thread=False,
+            factory=TimedConnection if self.query_observer else sqlite3.Connection,
+        )
+        if self.query_observer:
+            conn.query_observer = self.query_observer
+        # WAL باعث می‌شود نویسنده‌ها جلوی خواننده‌ها را نگیرند
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute(f"PRAGMA cache_size={int(self.cache_size)}")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    # اتصال ترد فعلی (در صورت نیاز ساخته می‌شود)
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def cursor(self):
+        return self.connection().cursor()
+
+    # تراکنش نوشتن؛ تراکنش‌های تو در تو به تراکنش بیرونی می‌پیوندند
+    @contextmanager
+    def transaction(self):
+        conn = self.connection()
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+    def close_all(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.warning(f"Error closing connection: {e}")
+        self._local = threading.local()
@@ -0,0 +1,117 @@
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+# تابع برای پیدا کردن chat_id مربوط به هر آپدیت
+# callback_query دکمه‌های پیام‌های inline کلید message ندارد و چت آن None است
+def get_update_chat_id(update):
+    if "message" in update:
+        return update["message"]["chat"]["id"]
+    if "callback_query" in update:
+        message = update["callback_query"].get("message")
+        return message["chat"]["id"] if message else None
+    return None
+
+
+# توزیع‌کننده آپدیت‌ها روی چند ترد
+# آپدیت‌های هر چت به ترتیب و پشت سر هم اجرا می‌شوند، اما چت‌های مختلف موازی پردازش می‌شوند
+class UpdateDispatcher:
+    def __init__(self, handler, max_workers=8, max_pending=1000):
+        self.handler = handler
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="dispatcher"
+        )
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        self._idle = threading.Condition(self._lock)
+        self._queues = {}  # chat_id -> deque آپدیت‌های در انتظار
+        self._pending = 0
+        self._in_flight = 0
+        self._processed = 0
+        self._errors = 0
+        self._max_pending_seen = 0
+        self._outstanding = set()  # update_id آپدیت‌هایی که هنوز پردازش آنها تمام نشده
+        self._last_submitted = 0
+
+    # افزودن آپدیت به صف؛ اگر صف پر باشد تا خالی شدن جا منتظر می‌ماند
+    def submit(self, update):
+        chat_id = get_update_chat_id(update)
+        with self._not_full:
+            while self._pending >= self.max_pending:
+                self._not_full.wait()
+            self._pending += 1
+            self._max_pending_seen = max(self._max_pending_seen, self._pending)
+            update_id = update.get("update_id")
+            if update_id is not None:
+                self._outstanding.add(update_id)
+                self._last_submitted = max(self._last_submitted, update_id)
+            queue = self._queues.get(chat_id)
+            if queue is not None:
+                # این چت در حال پردازش است؛ آپدیت پشت آپدیت‌های قبلی قرار می‌گیرد
+                queue.append(update)
+                return
+            self._queues[chat_id] = deque([update])
+        self._executor.submit(self._drain, chat_id)
+
+    # پردازش ترتیبی همه آپدیت‌های یک چت
+    def _drain(self, chat_id):
+        while True:
+            with self._lock:
+                queue = self._queues[chat_id]
+                if not queue:
+                    del self._queues[chat_id]
+                    if not self._queues:
+                        self._idle.notify_all()
+                    return
+                update = queue.popleft()
+                self._in_flight += 1
+
+            try:
+                self.handler(update)
+            except Exception:
+                logger.exception(f"Error handling update {update.get('update_id')}")
+                with self._lock:
+                    self._errors += 1
+
+            with self._not_full:
+                self._outstanding.discard(update.get("update_id"))
+                self._in_flight -= 1
+                self._pending -= 1
+                self._processed += 1
+                self._not_full.notify()
+
+    # بزرگترین update_id که پردازش آن و همه آپدیت‌های قبل از آن تمام شده است
+    def completed_watermark(self):
+        with self._lock:
+            if self._outstanding:
+                return min(self._outstanding) - 1
+            return self._last_submitted
+
+    # آمار صف برای مانیتورینگ
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": self._pending,
+                "in_flight": self._in_flight,
+                "active_chats": len(self._queues),
+                "processed": self._processed,
+                "errors": self._errors,
+                "max_pending_seen": self._max_pending_seen,
+                "max_workers": self.max_workers,
+            }
+
+    # انتظار تا پردازش همه آپدیت‌های صف
+    def join(self, timeout=None):
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._queues, timeout)
+
+    def shutdown(self, wait=True):
+        if wait:
+            self.join()
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,241 @@
+import argparse
+import itertools
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)
+
+GET_UPDATES_LIMIT = 100
+
+
+# سرور جایگزین API بله برای تست بار و اجرای آفلاین ربات
+# getUpdates (با long polling)، sendMessage و sendInvoice را پشتیبانی می‌کند
+# latency و jitter (ثانیه) به هر پاسخ اضافه می‌شود؛ error_rate کسری از درخواست‌های ارسال
+# است که با خطای 500 و rate_limit_rate کسری که با 429 (retry_after) پاسخ داده می‌شوند
+# on_send(method, payload) برای هر درخواست ارسال موفق صدا زده می‌شود
+class FakeBaleServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        latency=0.0,
+        jitter=0.0,
+        error_rate=0.0,
+        rate_limit_rate=0.0,
+        on_send=None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.on_send = on_send
+        self._updates = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._has_updates = threading.Condition(self._lock)
+        self._stats = {}
+        super().__init__((host, port), FakeBaleHandler)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    # افزودن یک آپدیت به صف getUpdates؛ update_id به صورت خودکار تعیین می‌شود
+    def push_update(self, update):
+        with self._has_updates:
+            update = dict(update, update_id=next(self._update_ids))
+            self._updates.append(update)
+            self._has_updates.notify_all()
+        return update["update_id"]
+
+    def push_message(self, chat_id, text, user_id=None):
+        return self.push_update(
+            {
+                "message": {
+                    "message_id": next(self._message_ids),
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"},
+                    "from": {"id": user_id or chat_id},
+                    "text": text,
+                }
+            }
+        )
+
+    def push_callback(self, chat_id, data, user_id=None):
+        return self.push_update(
+            {
+                "callback_query": {
+                    "id": str(next(self._message_ids)),
+                    "from": {"id": user_id or chat_id},
+                    "data": data,
+                    "message": {
+                        "message_id": next(self._message_ids),
+                        "date": int(time.time()),
+                        "chat": {"id": chat_id, "type": "private"},
+                    },
+                }
+            }
+        )
+
+    # آپدیت‌های offset به بعد؛ آپدیت‌های قبل از offset تایید شده و حذف می‌شوند
+    def get_updates(self, offset, limit, timeout):
+        deadline = time.monotonic() + timeout
+        with self._has_updates:
+            while True:
+                if offset:
+                    self._updates = [update for update in self._updates if update["update_id"] >= offset]
+                if self._updates:
+                    return self._updates[:limit]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._has_updates.wait(remaining)
+
+    def pending_updates(self):
+        with self._lock:
+            return len(self._updates)
+
+    def record(self, method, outcome):
+        with self._lock:
+            stats = self._stats.setdefault(method, {})
+            stats[outcome] = stats.get(outcome, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {method: dict(stats) for method, stats in self._stats.items()}
+
+
+class FakeBaleHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # بدون این گزینه هدر و بدنه پاسخ جدا ارسال می‌شوند و الگوریتم Nagle هر پاسخ را حدود ۴۰ میلی‌ثانیه معطل می‌کند
+    disable_nagle_algorithm = True
+
+    def _respond(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _method(self):
+        # مسیر: /bot<token>/<method>
+        return urlparse(self.path).path.rsplit("/", 1)[-1]
+
+    def _delay(self):
+        server = self.server
+        delay = server.latency + random.uniform(0, server.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def do_GET(self):
+        method = self._method()
+        query = {key: values[-1] for key, values in parse_qs(urlparse(self.path).query).items()}
+        self._handle(method, query)
+
+    def do_POST(self):
+        method = self._method()
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._respond(400, {"ok": False, "error_code": 400, "description": "Bad Request"})
+            return
+        self._handle(method, payload)
+
+    def _handle(self, method, payload):
+        server = self.server
+        if method == "getUpdates":
+            try:
+                offset = int(payload.get("offset") or 0)
+                limit = int(payload.get("limit") or GET_UPDATES_LIMIT)
+                timeout = float(payload.get("timeout") or 0)
+            except ValueError:
+                self._respond(400, {"ok": False, "error_code": 400, "description": "Bad Request"})
+                return
+            updates = server.get_updates(offset, limit, timeout)
+            server.record(method, "ok")
+            self._respond(200, {"ok": True, "result": updates})
+            return
+
+        self._delay()
+        roll = random.random()
+        if roll < server.error_rate:
+            server.record(method, "error")
+            self._respond(500, {"ok": False, "error_code": 500, "description": "Internal Server Error"})
+            return
+        if roll < server.error_rate + server.rate_limit_rate:
+            server.record(method, "rate_limited")
+            self._respond(
+                429,
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": "Too Many Requests",
+                    "parameters": {"retry_after": 1},
+                },
+            )
+            return
+
+        if method in ("sendMessage", "sendInvoice"):
+            if "chat_id" not in payload:
+                server.record(method, "bad_request")
+                self._respond(400, {"ok": False, "error_code": 400, "description": "chat_id is required"})
+                return
+            result = {
+                "message_id": next(server._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": payload["chat_id"]},
+                "text": payload.get("text", ""),
+            }
+        else:
+            # setWebhook، deleteWebhook و سایر متدها فقط تایید می‌شوند
+            result = True
+        server.record(method, "ok")
+        self._respond(200, {"ok": True, "result": result})
+        if server.on_send is not None and result is not True:
+            server.on_send(method, payload)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def run(args):
+    logging.basicConfig(level=logging.INFO)
+    server = FakeBaleServer(
+        args.host,
+        args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        on_send=lambda method, payload: logger.info(f"{method} -> {payload.get('chat_id')}"),
+    )
+    logger.info(f"Fake Bale API listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+# اجرای مستقل سرور (مثلا: python fakebale.py --port 8081 --latency 0.05 --error-rate 0.01)
+# ربات با BALE_API_BASE=http://127.0.0.1:8081 به آن وصل می‌شود
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="سرور جایگزین API بله برای تست آفلاین")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    raise SystemExit(run(parser.parse_args()))
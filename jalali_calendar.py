@@ -0,0 +1,73 @@
+import threading
+from datetime import datetime, time as dtime, timedelta
+
+import jdatetime
+import pytz
+
+DAY_LABELS = ("امروز", "فردا", "پس‌فردا")
+
+
+# تابع برای تبدیل تاریخ میلادی به شمسی
+def to_jalali(date):
+    return jdatetime.date.fromgregorian(date=date).strftime("%Y-%m-%d")
+
+
+# تابع برای تبدیل تاریخ شمسی (مثلا 1403-01-15) به میلادی
+def from_jalali(date):
+    year, month, day = (int(part) for part in date.split("-"))
+    return jdatetime.date(year, month, day).togregorian()
+
+
+# تقویم روزهای قابل رزرو؛ تاریخ‌های شمسی فقط یک بار در روز (با شروع روز جدید به وقت محلی) محاسبه می‌شوند
+class BookingCalendar:
+    def __init__(self, timezone, horizon=3):
+        self.tz = pytz.timezone(timezone)
+        self.horizon = horizon
+        self._lock = threading.Lock()
+        self._today = None
+        self._days = []
+
+    def now(self):
+        return datetime.now(self.tz)
+
+    # لیست روزهای قابل رزرو: (برچسب، تاریخ شمسی)
+    def days(self, now=None):
+        today = (now or self.now()).date()
+        if today != self._today:
+            with self._lock:
+                if today != self._today:
+                    self._days = [
+                        (
+                            DAY_LABELS[i] if i < len(DAY_LABELS) else to_jalali(date),
+                            to_jalali(date),
+                        )
+                        for i, date in enumerate(
+                            today + timedelta(days=i) for i in range(self.horizon)
+                        )
+                    ]
+                    self._today = today
+        return self._days
+
+    # تاریخ‌های شمسی روزهای قابل رزرو
+    def dates(self):
+        return [date for _, date in self.days()]
+
+    def today(self):
+        return self.days()[0][1]
+
+    # زودترین ساعت شروع قابل رزرو در تاریخ date؛ برای روزهای بعد محدودیتی نیست (None)
+    def earliest_time(self, date):
+        now = self.now()
+        if date != self.days(now)[0][1]:
+            return None
+        return f"{now.hour:02d}:{now.minute:02d}"
+
+    # زمان یونیکس شروع نوبت با تاریخ شمسی date و ساعت hour (مثلا 09:30) به وقت محلی
+    def timestamp(self, date, hour):
+        hours, minutes = (int(part) for part in hour.split(":"))
+        return self.tz.localize(datetime.combine(from_jalali(date), dtime(hours, minutes))).timestamp()
+
+    # (تاریخ شمسی، ساعت) زمان یونیکس timestamp به وقت محلی؛ قابل مقایسه با ستون‌های date و time نوبت‌ها
+    def slot_at(self, timestamp):
+        local = datetime.fromtimestamp(timestamp, self.tz)
+        return to_jalali(local.date()), f"{local.hour:02d}:{local.minute:02d}"
@@ -0,0 +1,111 @@
+import json
+from collections import namedtuple
+
+HOME_BUTTON = ("بازگشت به صفحه اصلی", "start")
+
+# بدنه JSON آماده ارسال یک درخواست؛ chat_id برای لاگ و آمار نگه داشته می‌شود
+EncodedPayload = namedtuple("EncodedPayload", ("chat_id", "body"))
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _markup(rows):
+    return _dumps(
+        {
+            "inline_keyboard": [
+                [{"text": text, "callback_data": data} for text, data in row] for row in rows
+            ]
+        }
+    )
+
+
+# کیبورد ثابت و تغییرناپذیر؛ JSON آن (با و بدون دکمه بازگشت به صفحه اصلی) یک بار ساخته می‌شود
+# rows: لیست ردیف‌ها، هر ردیف لیستی از (متن دکمه، callback_data)
+class Keyboard:
+    __slots__ = ("rows", "json", "json_with_home")
+
+    def __init__(self, rows):
+        self.rows = tuple(tuple(tuple(button) for button in row) for row in rows)
+        self.json = _markup(self.rows)
+        self.json_with_home = _markup(self.rows + ((HOME_BUTTON,),))
+
+
+HOME_KEYBOARD = Keyboard([])
+
+
+# تابع برای ساخت JSON کیبورد همراه با دکمه بازگشت به صفحه اصلی، بدون تغییر کیبورد ورودی
+# reply_markup می‌تواند Keyboard، دیکشنری inline_keyboard یا None باشد
+def markup_with_home(reply_markup):
+    if reply_markup is None:
+        return HOME_KEYBOARD.json_with_home
+    if isinstance(reply_markup, Keyboard):
+        return reply_markup.json_with_home
+    home_row = [{"text": HOME_BUTTON[0], "callback_data": HOME_BUTTON[1]}]
+    return _dumps({"inline_keyboard": reply_markup["inline_keyboard"] + [home_row]})
+
+
+# تابع برای ساخت بدنه sendMessage بدون ساختن دیکشنری میانی
+def encode_message(chat_id, text, reply_markup=None):
+    body = f'{{"chat_id":{_dumps(chat_id)},"text":{_dumps(text)},"reply_markup":{markup_with_home(reply_markup)}}}'
+    return EncodedPayload(chat_id, body.encode("utf-8"))
+
+
+# پیام ثابت (متن و کیبورد)؛ همه بدنه درخواست به جز chat_id از قبل ساخته شده است
+class Template:
+    __slots__ = ("text", "keyboard", "_suffix")
+
+    def __init__(self, text, keyboard=None):
+        self.text = text
+        self.keyboard = keyboard
+        self._suffix = f',"text":{_dumps(text)},"reply_markup":{markup_with_home(keyboard)}}}'.encode("utf-8")
+
+    def encode(self, chat_id):
+        return EncodedPayload(chat_id, b'{"chat_id":' + _dumps(chat_id).encode("utf-8") + self._suffix)
+
+
+# کیبوردها و پیام‌های ثابت ربات
+SERVICE_KEYBOARD = Keyboard(
+    [
+        [("اصلاح", "service_haircut")],
+        [("خدمات VIP", "service_vip")],
+    ]
+)
+ADMIN_KEYBOARD = Keyboard(
+    [
+        [("نمایش نوبت‌های خالی", "show_empty")],
+        [("نمایش نوبت‌های رزرو شده", "show_booked")],
+        [("بروزرسانی آرایشگرها", "update_barbers")],
+    ]
+)
+BARBER_OPTIONS_KEYBOARD = Keyboard(
+    [
+        [("📅 اولین نوبت خالی", "first_available")],
+        [("📋 مشاهده جدول نوبت‌ها", "show_table")],
+    ]
+)
+EXISTING_APPOINTMENT_KEYBOARD = Keyboard(
+    [
+        [("مشاهده نوبت من", "show_my_appointment"), ("لغو نوبت", "cancel_appointment")],
+        [("نوبت جدید", "new_appointment")],
+    ]
+)
+PAYMENT_KEYBOARD = Keyboard(
+    [
+        [("💳 پرداخت آنلاین", "pay_online")],
+        [("💵 پرداخت حضوری", "pay_in_person")],
+    ]
+)
+MY_APPOINTMENT_KEYBOARD = Keyboard(
+    [
+        [("مشاهده نوبت من", "show_my_appointment")],
+        [("لغو نوبت", "cancel_appointment")],
+    ]
+)
+CONFIRM_FIRST_KEYBOARD = Keyboard([[("✅ تایید", "confirm_first")]])
+
+SERVICE_MENU = Template("لطفا نوع خدمت را انتخاب کنید:", SERVICE_KEYBOARD)
+ADMIN_MENU = Template("لطفا نوع نوبت‌ها را انتخاب کنید:", ADMIN_KEYBOARD)
+BARBER_OPTIONS_MENU = Template("🔽 لطفا یکی از گزینه‌های زیر را انتخاب کنید:", BARBER_OPTIONS_KEYBOARD)
+HOME_MENU = Template("به صفحه اصلی بازگشتید:", MY_APPOINTMENT_KEYBOARD)
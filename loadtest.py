@@ -0,0 +1,361 @@
+import argparse
+import csv
+import os
+import random
+import re
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import Counter
+
+from barber_import import import_barbers
+from db import Database
+from fakebale import FakeBaleServer
+from jalali_calendar import BookingCalendar
+from migrations import migrate
+from repositories import SQLiteRepository
+from schedule import load_schedule_book
+
+# مراحل روند کامل رزرو که هر کاربر شبیه‌سازی‌شده طی می‌کند
+STEPS = ("start", "service", "barber", "table", "slot", "name", "phone", "pay")
+TABLE_ROW = re.compile(r"^(\d+)\. ", re.MULTILINE)
+QUERY_COUNT = re.compile(r'^bot_db_query_duration_seconds_count\{query="([^"]*)"\} (\d+)$', re.MULTILINE)
+
+# تنظیمات ربات در تست بار؛ محدودیت نرخ ارسال برداشته می‌شود تا زمان پردازش خود ربات اندازه‌گیری شود
+BOT_ENV = {
+    "BALETOKEN": "loadtest",
+    "ADMIN_USER_ID": "1",
+    "SEND_GLOBAL_RATE": "100000",
+    "SEND_GLOBAL_BURST": "100000",
+    "SEND_CHAT_RATE": "1000",
+    "SEND_CHAT_BURST": "1000",
+    "LOG_SAMPLE_RATE": "0",
+    "STATS_LOG_INTERVAL": "3600",
+}
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+# یک کاربر شبیه‌سازی‌شده؛ هر مرحله با یک آپدیت شروع و با رسیدن پاسخ مورد انتظار تمام می‌شود
+class SimulatedUser:
+    def __init__(self, chat_id, pay):
+        self.chat_id = chat_id
+        self.pay = pay
+        self.lock = threading.Lock()
+        self.step = 0
+        self.step_started = None
+        self.flow_started = None
+        self.barber_id = None
+        self.slots = []
+        self.outcome = None
+
+
+# شبیه‌ساز کاربران: پاسخ‌های ربات را از سرور جایگزین می‌گیرد و مرحله بعد هر کاربر را ارسال می‌کند
+class LoadSimulator:
+    def __init__(self, server, users, concurrency, pay="in_person", step_timeout=30):
+        self.server = server
+        self.concurrency = concurrency
+        self.step_timeout = step_timeout
+        self._users = {100000 + i: SimulatedUser(100000 + i, pay) for i in range(users)}
+        self._waiting = list(self._users.values())
+        self._active = set()
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self.step_latencies = {step: [] for step in STEPS}
+        self.flow_latencies = []
+        self.outcomes = Counter()
+        self.updates_sent = 0
+
+    def start(self):
+        self._refill()
+
+    def wait(self, timeout):
+        deadline = time.monotonic() + timeout
+        while not self._done.wait(1):
+            self._expire_stalled()
+            if time.monotonic() >= deadline:
+                return False
+        return True
+
+    def _refill(self):
+        with self._lock:
+            starting = []
+            while self._waiting and len(self._active) < self.concurrency:
+                user = self._waiting.pop()
+                self._active.add(user.chat_id)
+                starting.append(user)
+            if not self._waiting and not self._active:
+                self._done.set()
+        for user in starting:
+            with user.lock:
+                user.flow_started = time.monotonic()
+                self._send_step(user)
+
+    def _finish(self, user, outcome):
+        user.outcome = outcome
+        with self._lock:
+            self.outcomes[outcome] += 1
+            if outcome == "booked":
+                self.flow_latencies.append(time.monotonic() - user.flow_started)
+            self._active.discard(user.chat_id)
+
+    def _expire_stalled(self):
+        now = time.monotonic()
+        for chat_id in list(self._active):
+            user = self._users[chat_id]
+            with user.lock:
+                if user.outcome is None and now - user.step_started > self.step_timeout:
+                    self._finish(user, f"timeout:{STEPS[user.step]}")
+        self._refill()
+
+    def _send_step(self, user):
+        step = STEPS[user.step]
+        chat_id = user.chat_id
+        user.step_started = time.monotonic()
+        if step == "start":
+            self.server.push_message(chat_id, "/start")
+        elif step == "service":
+            self.server.push_callback(chat_id, "service_haircut")
+        elif step == "barber":
+            self.server.push_callback(chat_id, f"select_barber_{user.barber_id}")
+        elif step == "table":
+            user.slots = []
+            self.server.push_callback(chat_id, "show_table")
+        elif step == "slot":
+            self.server.push_message(chat_id, random.choice(user.slots))
+        elif step == "name":
+            self.server.push_message(chat_id, f"User {chat_id}")
+        elif step == "phone":
+            self.server.push_message(chat_id, f"0912{chat_id % 10000000:07d}")
+        elif step == "pay":
+            self.server.push_callback(chat_id, "pay_online" if user.pay == "online" else "pay_in_person")
+        with self._lock:
+            self.updates_sent += 1
+
+    # بررسی پاسخ ربات؛ خروجی: None (مرحله ادامه دارد)، "next" یا نتیجه نهایی کاربر
+    def _check_reply(self, user, method, text, callbacks):
+        step = STEPS[user.step]
+        if step == "start":
+            return "next" if "service_haircut" in callbacks else None
+        if step == "service":
+            barbers = [data for data in callbacks if data.startswith("select_barber_")]
+            if not barbers:
+                return None
+            user.barber_id = random.choice(barbers).rsplit("_", 1)[1]
+            return "next"
+        if step == "barber":
+            return "next" if "show_table" in callbacks else None
+        if step == "table":
+            user.slots.extend(TABLE_ROW.findall(text))
+            if text.startswith("نوبت خالی"):
+                return "no_slots"
+            return "next" if text.startswith("لطفا شماره ردیف") and user.slots else None
+        if step == "slot":
+            return "next" if "نام" in text else None
+        if step == "name":
+            return "next" if "شماره تماس" in text else None
+        if step == "phone":
+            if text.startswith("⚠️"):
+                return "conflict"
+            return "next" if "pay_in_person" in callbacks else None
+        if step == "pay":
+            if user.pay == "online":
+                return "booked" if text.startswith("لطفا پرداخت") else None
+            return "booked" if "cancel_appointment" in callbacks else None
+        return None
+
+    # برای هر درخواست ارسال به سرور جایگزین صدا زده می‌شود
+    def on_send(self, method, payload):
+        user = self._users.get(payload.get("chat_id"))
+        if user is None:
+            return
+        markup = payload.get("reply_markup") or {}
+        callbacks = [
+            button.get("callback_data", "")
+            for row in markup.get("inline_keyboard", [])
+            for button in row
+        ]
+        text = payload.get("text", "")
+        finished = False
+        with user.lock:
+            if user.outcome is not None:
+                return
+            result = self._check_reply(user, method, text, callbacks)
+            if result is None:
+                return
+            self.step_latencies[STEPS[user.step]].append(time.monotonic() - user.step_started)
+            if result == "next" and user.step + 1 < len(STEPS):
+                user.step += 1
+                self._send_step(user)
+            else:
+                self._finish(user, result)
+                finished = True
+        if finished:
+            self._refill()
+
+
+# ساخت پایگاه داده آزمایشی با barbers آرایشگر
+def create_loadtest_db(path, barbers):
+    csv_path = os.path.join(os.path.dirname(path), "barbers.csv")
+    with open(csv_path, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(("name", "phone", "address", "user_id", "card_number"))
+        for i in range(barbers):
+            writer.writerow((f"Barber {i}", "09120000000", "Tehran", 5000 + i, "6037997156537954"))
+    db = Database(path)
+    migrate(db.connection())
+    schedules = load_schedule_book(os.getenv("SCHEDULE_FILE"), os.getenv("BOOKING_HORIZON_DAYS"))
+    calendar = BookingCalendar("Asia/Tehran", horizon=schedules.horizon)
+    import_barbers(SQLiteRepository(db), csv_path, calendar.dates(), schedules)
+    db.close_all()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# تعداد کوئری‌ها به تفکیک برچسب، جمع همه پروسس‌های ربات
+def scrape_query_counts(urls):
+    counts = Counter()
+    for url in urls:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            text = response.read().decode("utf-8")
+        counts.update({label: int(count) for label, count in QUERY_COUNT.findall(text)})
+    return counts
+
+
+def wait_for_bot(urls, bot, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if bot.poll() is not None:
+            raise RuntimeError(f"ربات با کد {bot.returncode} متوقف شد")
+        try:
+            return scrape_query_counts(urls)
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("ربات در زمان مقرر آماده نشد")
+
+
+def run(args):
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, "loadtest.db")
+        create_loadtest_db(db_path, args.barbers)
+
+        server = FakeBaleServer(
+            latency=args.latency,
+            jitter=args.jitter,
+            error_rate=args.error_rate,
+            rate_limit_rate=args.rate_limit_rate,
+        )
+        simulator = LoadSimulator(server, args.users, args.concurrency, args.pay, args.step_timeout)
+        server.on_send = simulator.on_send
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        metrics_port = free_port()
+        # با چند پروسس کارگر، متریک‌های کارگر i روی پورت بعدی (METRICS_PORT + 1 + i) هستند
+        processes = args.workers + 1 if args.workers > 1 else 1
+        metrics_urls = [f"http://127.0.0.1:{metrics_port + i}/metrics" for i in range(processes)]
+        env = dict(os.environ, **BOT_ENV)
+        env.update(
+            BALE_API_BASE=server.base_url,
+            DB_PATH=db_path,
+            SESSION_DB_PATH=db_path,
+            METRICS_PORT=str(metrics_port),
+            WORKER_PROCESSES=str(args.workers),
+        )
+        env.update(item.split("=", 1) for item in args.env)
+        log_path = os.path.join(directory, "bot.log")
+        with open(log_path, "w") as log:
+            bot = subprocess.Popen(
+                [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")],
+                env=env,
+                cwd=directory,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+            )
+            try:
+                queries_before = wait_for_bot(metrics_urls, bot)
+                start = time.monotonic()
+                simulator.start()
+                completed = simulator.wait(args.timeout)
+                elapsed = time.monotonic() - start
+                queries_after = scrape_query_counts(metrics_urls)
+            finally:
+                bot.send_signal(signal.SIGTERM)
+                try:
+                    bot.wait(30)
+                except subprocess.TimeoutExpired:
+                    bot.kill()
+                server.shutdown()
+
+        if bot.returncode not in (0, -signal.SIGTERM):
+            with open(log_path) as log:
+                print(log.read()[-3000:])
+
+    queries = {
+        label: queries_after.get(label, 0) - queries_before.get(label, 0) for label in queries_after
+    }
+    total_queries = sum(queries.values())
+    booked = simulator.outcomes["booked"]
+    print(
+        f"{args.users} users, concurrency {args.concurrency}, {args.barbers} barbers, "
+        f"{args.workers} worker process(es), "
+        f"api latency {args.latency * 1000:.0f}+{args.jitter * 1000:.0f} ms, "
+        f"error rate {args.error_rate:.1%}"
+    )
+    print(f"outcomes: {dict(simulator.outcomes)}{'' if completed else ' (timed out)'}")
+    print(
+        f"throughput: {simulator.updates_sent / elapsed:.1f} updates/s, "
+        f"{booked / elapsed:.1f} bookings/s over {elapsed:.1f} s"
+    )
+    print("latency (ms):          p50      p90      p99      max")
+    rows = [(step, simulator.step_latencies[step]) for step in STEPS]
+    rows.append(("full booking", simulator.flow_latencies))
+    for name, values in rows:
+        if not values:
+            continue
+        print(
+            f"  {name:<16} {percentile(values, 0.5) * 1000:8.1f} {percentile(values, 0.9) * 1000:8.1f}"
+            f" {percentile(values, 0.99) * 1000:8.1f} {max(values) * 1000:8.1f}"
+        )
+    print(
+        f"db queries: {total_queries} total, "
+        f"{total_queries / max(simulator.updates_sent, 1):.1f} per update, "
+        f"{total_queries / max(booked, 1):.1f} per booking"
+    )
+    for label, count in sorted(queries.items(), key=lambda item: -item[1])[: args.top_queries]:
+        print(f"  {label:<32} {count}")
+    print(f"fake api: {server.stats()}")
+    return 0 if completed and booked else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="تست بار روند کامل رزرو با سرور جایگزین API بله")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--barbers", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=1, help="تعداد پروسس‌های کارگر ربات")
+    parser.add_argument("--pay", choices=("in_person", "online"), default="in_person")
+    parser.add_argument("--latency", type=float, default=0.0, help="تاخیر هر پاسخ API (ثانیه)")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--step-timeout", type=float, default=30)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--top-queries", type=int, default=10)
+    parser.add_argument(
+        "--env", action="append", default=[], help="تنظیم متغیر محیطی ربات (KEY=VALUE)"
+    )
+    raise SystemExit(run(parser.parse_args()))
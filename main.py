@@ -1,191 +1,174 @@
-import sqlite3
+import argparse
 import re
 import time
-from datetime import datetime, timedelta
-import pytz
 import requests
-from dotenv import load_dotenv
-import os
 import logging
-import jdatetime
 import uuid
-import csv
-
-# بارگذاری متغیرهای محیطی از فایل .env
-load_dotenv()
-BOT_TOKEN = os.getenv("BALETOKEN")
-ADMIN_USER_ID = os.getenv("ADMIN_USER_ID")
-if ADMIN_USER_ID is None:
-    raise ValueError("متغیر محیطی ADMIN_USER_ID در فایل .env تعریف نشده است.")
-ADMIN_USER_ID = int(ADMIN_USER_ID)
-BASE_URL = f"https://tapi.bale.ai/bot{BOT_TOKEN}"
-
-# اتصال به پایگاه داده
-conn = sqlite3.connect("barbershop.db", check_same_thread=False)
-cursor = conn.cursor()
-
-# ایجاد جدول نوبت‌ها
-cursor.execute(
-    """
-CREATE TABLE IF NOT EXISTS appointments (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER,
-    barber_id INTEGER,
-    date TEXT,
-    time TEXT,
-    service TEXT,
-    name TEXT,
-    phone TEXT,
-    status TEXT DEFAULT 'خالی',
-    payment_status TEXT DEFAULT 'پرداخت نشده',
-    tracking_code TEXT,
-    FOREIGN KEY(barber_id) REFERENCES barbers(id)
+import threading
+import random
+import signal
+from app import App
+from dispatcher import UpdateDispatcher, get_update_chat_id
+from cluster import ClusterSupervisor
+from migrations import migrate
+from webhook import WebhookServer
+from scheduler import Scheduler
+from router import Router
+from metrics import Registry, MetricsServer, query_label, log_event
+from barber_directory import BarberDirectory
+from barber_import import import_barbers, BarberImportError, MAX_REPORTED_ERRORS
+from keyboards import (
+    EncodedPayload,
+    Template,
+    encode_message,
+    SERVICE_MENU,
+    ADMIN_MENU,
+    BARBER_OPTIONS_MENU,
+    HOME_MENU,
+    EXISTING_APPOINTMENT_KEYBOARD,
+    PAYMENT_KEYBOARD,
+    CONFIRM_FIRST_KEYBOARD,
 )
-"""
+from reports import (
+    render_report_page,
+    report_callback,
+    parse_report_callback,
+    report_keyboard,
+    report_filter_keyboard,
+    parse_report_filter_callback,
+    REPORTS,
 )
 
-# ایجاد جدول آرایشگرها
-cursor.execute(
-    """
-CREATE TABLE IF NOT EXISTS barbers (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    name TEXT,
-    phone TEXT,
-    address TEXT,
-    user_id INTEGER UNIQUE,  -- اضافه کردن UNIQUE به user_id
-    card_number TEXT
+logger = logging.getLogger(__name__)
+
+LONG_POLL_TIMEOUT = 30
+
+# متریک‌های داخلی ربات
+metrics = Registry()
+HANDLER_LATENCY = metrics.histogram(
+    "bot_handler_duration_seconds", "Handler latency by route", ["route"]
 )
-"""
+QUERY_LATENCY = metrics.histogram(
+    "bot_db_query_duration_seconds", "SQLite statement latency by statement and table", ["query"]
 )
-
-# ایجاد جدول user_appointments برای ذخیره‌سازی اطلاعات کاربران و نوبت‌ها
-cursor.execute(
-    """
-CREATE TABLE IF NOT EXISTS user_appointments (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER,
-    barber_id INTEGER,
-    date TEXT,
-    time TEXT,
-    service TEXT,
-    name TEXT,
-    phone TEXT,
-    status TEXT DEFAULT 'رزرو',
-    payment_status TEXT DEFAULT 'پرداخت نشده',
-    tracking_code TEXT
+API_LATENCY = metrics.histogram(
+    "bot_api_request_duration_seconds",
+    "Bale API call latency including retries",
+    ["method", "outcome"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
 )
-"""
+BOOKINGS = metrics.counter("bot_bookings_total", "Booking attempts by result", ["result"])
+CANCELLATIONS = metrics.counter("bot_cancellations_total", "Cancellation requests by result", ["result"])
+PAYMENTS = metrics.counter("bot_payment_attempts_total", "Payment attempts", ["method", "result"])
+ERRORS = metrics.counter("bot_errors_total", "Errors by component", ["component"])
+UPDATE_LAG = metrics.gauge(
+    "bot_update_lag_seconds", "Delay between a message being sent and its processing"
 )
-conn.commit()
-
-# تعریف ساعات کاری
-working_hours = [
-    "08:00",
-    "09:00",
-    "10:00",
-    "11:00",
-    "12:00",
-    "13:00",
-    "16:00",
-    "17:00",
-    "18:00",
-    "19:00",
-    "20:00",
-]
-
-# منطقه زمانی ثابت (تهران)
-USER_TIMEZONE = "Asia/Tehran"
-
-# تنظیمات لاگ‌گیری
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+DISPATCHER_PENDING = metrics.gauge("bot_dispatcher_pending", "Updates waiting or in progress")
+OUTBOX_PENDING = metrics.gauge("bot_outbox_pending", "Outgoing requests waiting to be sent")
+REMINDERS = metrics.counter("bot_reminders_total", "Booking reminders by kind and result", ["kind", "result"])
+JOB_LATENCY = metrics.histogram(
+    "bot_job_duration_seconds",
+    "Scheduled job run time",
+    ["job"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900),
+)
+JOB_FAILURES = metrics.counter("bot_job_failures_total", "Scheduled job runs that raised", ["job"])
+
+
+def observe_api_call(method, duration, error):
+    API_LATENCY.observe(duration, method=method, outcome="error" if error else "ok")
+    if error:
+        ERRORS.inc(component="api")
+
 
+def observe_query(sql, duration):
+    QUERY_LATENCY.observe(duration, query=query_label(sql))
 
-# تابع برای تبدیل تاریخ میلادی به شمسی
-def to_jalali(date):
-    return jdatetime.date.fromgregorian(date=date).strftime("%Y-%m-%d")
+
+def observe_job(name, duration, error):
+    JOB_LATENCY.observe(duration, job=name)
+    if error:
+        JOB_FAILURES.inc(job=name)
+
+
+# تابع برای ارسال یک درخواست از صف خروجی به API بله
+def deliver(method, payload):
+    if isinstance(payload, EncodedPayload):
+        result = app.bale.call(method, data=payload.body)
+        chat_id = payload.chat_id
+    else:
+        result = app.bale.call(method, payload)
+        chat_id = payload["chat_id"]
+    log_event(logger, "delivered", app.config.log_sample_rate, method=method, chat_id=chat_id)
+    return result
+
+
+# شی برنامه؛ تنظیمات (.env)، پایگاه داده، کلاینت API و صف خروجی در اولین استفاده ساخته می‌شوند
+# برای اجرا با تنظیمات دیگر (مثلا در تست‌ها) می‌توان قبل از اولین استفاده app را جایگزین کرد
+app = App(
+    deliver=deliver,
+    api_observer=observe_api_call,
+    query_observer=observe_query,
+    reminder_observer=lambda kind, result: REMINDERS.inc(kind=kind, result=result),
+)
+
+
+# کش اطلاعات آرایشگرها؛ بعد از بروزرسانی از CSV باطل می‌شود و پروسس‌های کارگر و نمونه‌های دیگر ربات
+# تغییر را با نسخه آرایشگرها در مخزن داده (حداکثر بعد از چند ثانیه) می‌بینند
+barber_directory = BarberDirectory(
+    lambda: app.repository.list_barbers(),
+    version=lambda: app.repository.barbers_version(),
+)
 
 
 # تابع برای به‌روزرسانی جدول نوبت‌ها
 def update_appointments_table():
-    today = datetime.now(pytz.timezone(USER_TIMEZONE)).date()
-    dates = [today + timedelta(days=i) for i in range(3)]
-    dates_str = [to_jalali(date) for date in dates]
-
-    # حذف نوبت‌های قدیمی
-    cursor.execute("DELETE FROM appointments WHERE date NOT IN (?, ?, ?)", dates_str)
-    conn.commit()
-
-    # دریافت لیست آرایشگرها
-    cursor.execute("SELECT id FROM barbers")
-    barbers = cursor.fetchall()
-
-    # ایجاد نوبت‌ها برای هر آرایشگر
-    for barber in barbers:
-        barber_id = barber[0]
-        for date in dates_str:
-            for time in working_hours:
-                cursor.execute(
-                    "SELECT * FROM appointments WHERE date=? AND time=? AND barber_id=?",
-                    (date, time, barber_id),
-                )
-                if not cursor.fetchone():
-                    cursor.execute(
-                        "INSERT INTO appointments (date, time, status, barber_id) VALUES (?, ?, ?, ?)",
-                        (date, time, "خالی", barber_id),  # تنظیم barber_id برای هر نوبت
-                    )
-    conn.commit()
-
-
-# تابع برای فیلتر کردن زمان‌های گذشته
-def filter_past_times(date):
-    user_tz = pytz.timezone(USER_TIMEZONE)
-    now = datetime.now(user_tz)
-
-    # اگر تاریخ امروز باشد، زمان‌های گذشته را فیلتر کن
-    if date == to_jalali(now.date()):
-        current_time = now.strftime("%H:%M")
-        return [time for time in working_hours if time >= current_time]
-
-    # برای فردا و پس‌فردا، همه زمان‌ها را برگردان
-    return working_hours
-
-
-# تابع برای ارسال پیام به کاربر
+    dates_str = app.calendar.dates()
+
+    # حذف نوبت‌های قدیمی و ایجاد نوبت‌های جدید در یک تراکنش
+    repository = app.repository
+    with repository.transaction():
+        repository.delete_past_slots(dates_str[0])
+        created = repository.generate_slots(dates_str, app.schedules)
+    logger.info(f"Appointments table updated: {created} slots created")
+
+
+# حداکثر طول متن هر پیام؛ جدول‌های طولانی (مثلا برای چند هفته) در چند پیام ارسال می‌شوند
+MAX_MESSAGE_LENGTH = 4000
+
+
+# تابع برای تقسیم متن طولانی به چند بخش از مرز خطوط
+def split_text(text, limit=MAX_MESSAGE_LENGTH):
+    parts = []
+    current = ""
+    for line in text.splitlines(keepends=True):
+        if current and len(current) + len(line) > limit:
+            parts.append(current)
+            current = ""
+        current += line
+    if current:
+        parts.append(current)
+    return parts
+
+
+# تابع برای ارسال پیام به کاربر (پیام در صف خروجی قرار می‌گیرد و Future برمی‌گردد)
+# text می‌تواند متن یا یک Template ثابت باشد؛ دکمه بازگشت به صفحه اصلی بدون تغییر reply_markup اضافه می‌شود
 def send_message(chat_id, text, reply_markup=None):
-    if reply_markup is None:
-        reply_markup = {
-            "inline_keyboard": [
-                [{"text": "بازگشت به صفحه اصلی", "callback_data": "start"}]
-            ]
-        }
+    if isinstance(text, Template):
+        payload = text.encode(chat_id)
     else:
-        reply_markup["inline_keyboard"].append(
-            [{"text": "بازگشت به صفحه اصلی", "callback_data": "start"}]
-        )
-
-    url = f"{BASE_URL}/sendMessage"
-    payload = {"chat_id": chat_id, "text": text, "reply_markup": reply_markup}
-    try:
-        response = requests.post(url, json=payload)
-        response.raise_for_status()
-        logger.info(f"Message sent to {chat_id}: {text}")
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error sending message to {chat_id}: {e}")
-        return None
+        payload = encode_message(chat_id, text, reply_markup)
+    return app.outbox.submit(chat_id, "sendMessage", payload)
 
 
-# تابع برای ارسال فاکتور پرداخت
+# تابع برای ارسال فاکتور پرداخت (فاکتور در صف خروجی قرار می‌گیرد و Future برمی‌گردد)
 def send_invoice(chat_id, amount, description, barber_id):
-    cursor.execute("SELECT card_number FROM barbers WHERE id=?", (barber_id,))
-    barber = cursor.fetchone()
+    barber = barber_directory.get(barber_id)
     if not barber:
         send_message(chat_id, "خطا در دریافت اطلاعات آرایشگر.")
         return None
-    print(barber)
-    card_number = barber[0]
-    url = f"{BASE_URL}/sendInvoice"
+    card_number = barber["card_number"]
     payload = {
         "chat_id": chat_id,
         "title": "پرداخت هزینه خدمت",
@@ -195,68 +178,109 @@ def send_invoice(chat_id, amount, description, barber_id):
         "currency": "IRR",
         "prices": [{"label": "هزینه خدمت", "amount": amount}],
     }
-    try:
-        response = requests.post(url, json=payload)
-        response.raise_for_status()
-        logger.info(f"Invoice sent to {chat_id}")
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error sending invoice to {chat_id}: {e}")
-        return None
+    return app.outbox.submit(chat_id, "sendInvoice", payload)
 
 
 # تابع برای دریافت آخرین آپدیت‌ها
 def get_updates(offset=None):
-    url = f"{BASE_URL}/getUpdates"
-    params = {"timeout": 30, "offset": offset}
+    params = {"timeout": LONG_POLL_TIMEOUT, "offset": offset}
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        return response.json()
+        # تایم‌اوت خواندن باید از زمان long polling بیشتر باشد
+        return app.bale.call(
+            "getUpdates",
+            params=params,
+            http_method="GET",
+            read_timeout=LONG_POLL_TIMEOUT + app.bale.read_timeout,
+        )
     except requests.exceptions.RequestException as e:
         logger.error(f"Error getting updates: {e}")
         return {"ok": False, "result": []}
 
 
 # تابع برای بروزرسانی اطلاعات آرایشگرها از فایل CSV
-def update_barbers_from_csv(file_path):
-    with open(file_path, mode="r", encoding="utf-8") as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            cursor.execute(
-                """
-                INSERT INTO barbers (name, phone, address, user_id, card_number)
-                VALUES (?, ?, ?, ?, ?)
-                ON CONFLICT(user_id) DO UPDATE SET
-                name=excluded.name,
-                phone=excluded.phone,
-                address=excluded.address,
-                card_number=excluded.card_number
-                """,
-                (
-                    row["name"],
-                    row["phone"],
-                    row["address"],
-                    row["user_id"],
-                    row["card_number"],
-                ),
+# آرایشگرهایی که در فایل نیستند فقط با remove_missing حذف می‌شوند
+def update_barbers_from_csv(file_path, progress=None, remove_missing=False):
+    # فایل قبل از تراکنش اعتبارسنجی می‌شود و تراکنش فقط برای نوشتن دسته‌ای تغییرات باز می‌شود
+    result = import_barbers(
+        app.repository,
+        file_path,
+        app.calendar.dates(),
+        app.schedules,
+        app.config.import_chunk_size,
+        progress,
+        remove_missing,
+    )
+    barber_directory.invalidate()
+    return result
+
+
+# جلوگیری از اجرای همزمان دو بروزرسانی آرایشگرها
+barber_import_lock = threading.Lock()
+
+
+# تابع برای بروزرسانی آرایشگرها در پس‌زمینه و گزارش پیشرفت و نتیجه به ادمین
+# حذف آرایشگرهایی که در فایل نیستند فقط بعد از تایید ادمین (دکمه update_barbers_remove) انجام می‌شود
+def start_barber_import(chat_id, file_path=None, remove_missing=False):
+    if not barber_import_lock.acquire(blocking=False):
+        send_message(chat_id, "⏳ بروزرسانی آرایشگرها در حال انجام است. لطفا صبر کنید.")
+        return
+    file_path = file_path or app.config.barbers_csv_path
+    send_message(chat_id, "⏳ بروزرسانی آرایشگرها شروع شد...")
+    last_report = time.monotonic()
+
+    def progress(rows):
+        nonlocal last_report
+        if time.monotonic() - last_report >= app.config.import_progress_interval:
+            last_report = time.monotonic()
+            send_message(chat_id, f"⏳ {rows} ردیف پردازش شد...")
+
+    def run():
+        try:
+            result = update_barbers_from_csv(file_path, progress, remove_missing)
+        except BarberImportError as e:
+            errors = e.errors[:MAX_REPORTED_ERRORS]
+            if len(e.errors) > len(errors):
+                errors.append(f"... و {len(e.errors) - len(errors)} خطای دیگر")
+            send_message(
+                chat_id,
+                "❌ فایل آرایشگرها خطا دارد و هیچ تغییری ذخیره نشد:\n" + "\n".join(errors),
+            )
+        except Exception:
+            logger.exception("Barber import failed")
+            send_message(chat_id, "❌ خطا در بروزرسانی آرایشگرها.")
+        else:
+            text = (
+                "✅ اطلاعات آرایشگرها با موفقیت بروزرسانی شد.\n"
+                f"جدید: {result['added']}، تغییر کرده: {result['changed']}، "
+                f"حذف شده: {result['removed']}، بدون تغییر: {result['unchanged']}\n"
+                f"نوبت‌های ساخته شده: {result['slots_created']}"
             )
-        conn.commit()
-        update_appointments_table()
+            keyboard = None
+            if result["missing"]:
+                text += f"\n⚠️ {result['missing']} آرایشگر در فایل نیستند و حذف نشدند."
+                keyboard = {
+                    "inline_keyboard": [
+                        [{"text": "🗑 حذف آرایشگرهای غایب از فایل", "callback_data": "update_barbers_remove"}]
+                    ]
+                }
+            send_message(chat_id, text, reply_markup=keyboard)
+        finally:
+            barber_import_lock.release()
+
+    threading.Thread(target=run, name="barber-import", daemon=True).start()
 
 
 # تابع برای نمایش لیست آرایشگرها
 def show_barbers(chat_id):
-    cursor.execute("SELECT id, name, address FROM barbers")
-    barbers = cursor.fetchall()
+    barbers = barber_directory.all()
 
     if barbers:
         keyboard = {
             "inline_keyboard": [
                 [
                     {
-                        "text": f"{barber[1]} - {barber[2]}",
-                        "callback_data": f"select_barber_{barber[0]}",
+                        "text": f"{barber['name']} - {barber['address']}",
+                        "callback_data": f"select_barber_{barber['id']}",
                     }
                 ]
                 for barber in barbers
@@ -269,217 +293,402 @@ def show_barbers(chat_id):
         send_message(chat_id, "هیچ آرایشگری ثبت نشده است.")
 
 
-# تابع برای نمایش نوبت‌های خالی
-def show_available_slots(chat_id, barber_id):
-    available_slots = []
-    table = "جدول نوبت‌های خالی:\n"
-    index = 1
-    for date_label, date_value in [
-        ("امروز", to_jalali(datetime.now(pytz.timezone(USER_TIMEZONE)).date())),
+# تابع برای دریافت نوبت‌های خالی یک آرایشگر در روزهای قابل رزرو با یک کوئری
+# خروجی: لیست (برچسب روز، تاریخ، بلوک‌های length نوبتی خالی و پشت سر هم)
+# ساعت‌های گذشته امروز حذف می‌شوند
+def get_availability(barber_id, length=1):
+    days = app.calendar.days()
+    schedule = app.schedules.for_barber(barber_id)
+    free = app.repository.free_slots(barber_id, [date for _, date in days])
+    return [
         (
-            "فردا",
-            to_jalali(
-                (datetime.now(pytz.timezone(USER_TIMEZONE)) + timedelta(days=1)).date()
-            ),
-        ),
-        (
-            "پس‌فردا",
-            to_jalali(
-                (datetime.now(pytz.timezone(USER_TIMEZONE)) + timedelta(days=2)).date()
-            ),
-        ),
-    ]:
-        table += f"\n{date_label}:\n"
-        filtered_times = filter_past_times(date_value)  # فیلتر زمان‌ها بر اساس تاریخ
-        for time in filtered_times:
-            cursor.execute(
-                'SELECT * FROM appointments WHERE date=? AND time=? AND status="خالی" AND barber_id=?',
-                (date_value, time, barber_id),
-            )
-            if cursor.fetchone():
-                table += f"{index}. {time}\n"
-                available_slots.append((date_value, time))
-                index += 1
-
-    if available_slots:
-        context["user_data"]["available_slots"] = available_slots
-        send_message(chat_id, table)
-        send_message(chat_id, "لطفا شماره ردیف نوبت مدنظر خود را وارد کنید:")
-        context["user_data"]["awaiting_slot_selection"] = True
-    else:
-        send_message(chat_id, "نوبت خالی یافت نشد.")
+            date_label,
+            date_value,
+            schedule.free_blocks(free[date_value], length, app.calendar.earliest_time(date_value)),
+        )
+        for date_label, date_value in days
+    ]
 
 
-# تابع برای نمایش نوبت‌های خالی متوالی برای خدمات VIP
-def show_vip_available_slots(chat_id, barber_id):
+# تابع برای نمایش نوبت‌های خالی؛ برای خدمات چند نوبتی (مثل VIP) فقط نوبت‌های پشت سر هم نمایش داده می‌شوند
+def show_available_slots(chat_id, barber_id, user_data):
+    length = app.schedules.block_length(barber_id, user_data.get("service"))
     available_slots = []
-    table = "جدول نوبت‌های خالی متوالی (برای خدمات VIP):\n"
+    table = "جدول نوبت‌های خالی:\n" if length == 1 else "جدول نوبت‌های خالی متوالی:\n"
     index = 1
-    for date_label, date_value in [
-        ("امروز", to_jalali(datetime.now(pytz.timezone(USER_TIMEZONE)).date())),
-        (
-            "فردا",
-            to_jalali(
-                (datetime.now(pytz.timezone(USER_TIMEZONE)) + timedelta(days=1)).date()
-            ),
-        ),
-        (
-            "پس‌فردا",
-            to_jalali(
-                (datetime.now(pytz.timezone(USER_TIMEZONE)) + timedelta(days=2)).date()
-            ),
-        ),
-    ]:
+    for date_label, date_value, blocks in get_availability(barber_id, length):
         table += f"\n{date_label}:\n"
-        filtered_times = filter_past_times(date_value)  # فیلتر زمان‌ها بر اساس تاریخ
-        for i in range(len(filtered_times) - 1):
-            time1 = filtered_times[i]
-            time2 = filtered_times[i + 1]
-            if time1 == "13:00" and time2 == "16:00":
-                continue
-            cursor.execute(
-                'SELECT * FROM appointments WHERE date=? AND time=? AND status="خالی" AND barber_id=?',
-                (date_value, time1, barber_id),
-            )
-            slot1 = cursor.fetchone()
-            cursor.execute(
-                'SELECT * FROM appointments WHERE date=? AND time=? AND status="خالی" AND barber_id=?',
-                (date_value, time2, barber_id),
-            )
-            slot2 = cursor.fetchone()
-            if slot1 and slot2:
-                table += f"{index}. {time1} و {time2}\n"
-                available_slots.append((date_value, time1))
-                index += 1
+        for block in blocks:
+            table += f"{index}. {' و '.join(block)}\n"
+            available_slots.append((date_value, block[0]))
+            index += 1
 
     if available_slots:
-        context["user_data"]["available_slots"] = available_slots
-        send_message(chat_id, table)
+        user_data["available_slots"] = available_slots
+        for part in split_text(table):
+            send_message(chat_id, part)
         send_message(chat_id, "لطفا شماره ردیف نوبت مدنظر خود را وارد کنید:")
-        context["user_data"]["awaiting_slot_selection"] = True
+        enter_state(user_data, STATE_SLOT_SELECTION)
+    elif length == 1:
+        send_message(chat_id, "نوبت خالی یافت نشد.")
     else:
         send_message(chat_id, "نوبت خالی متوالی یافت نشد.")
 
 
+# ساعت‌های همه نوبت‌های پشت سر هم یک رزرو
+def booking_block(barber_id, start, service):
+    times = app.schedules.for_barber(barber_id).block(
+        start, app.schedules.block_length(barber_id, service)
+    )
+    return times or [start]
+
+
 # تابع برای لغو نوبت
 def cancel_appointment(user_id):
-    # دریافت اطلاعات نوبت کاربر از دیتابیس
-    cursor.execute(
-        "SELECT barber_id, date, time FROM user_appointments WHERE user_id=? AND status='رزرو'",
-        (user_id,),
-    )
-    appointment = cursor.fetchone()
+    return app.repository.cancel_booking(user_id, booking_block)
 
-    if appointment:
-        barber_id, date, time = appointment
-        # لغو نوبت در جدول appointments
-        cursor.execute(
-            "UPDATE appointments SET user_id=NULL, name=NULL, phone=NULL, service=NULL, status='خالی' WHERE date=? AND time=? AND barber_id=?",
-            (date, time, barber_id),
-        )
-        # لغو نوبت در جدول user_appointments
-        cursor.execute(
-            "UPDATE user_appointments SET status='لغو شده' WHERE user_id=? AND barber_id=? AND date=? AND time=?",
-            (user_id, barber_id, date, time),
-        )
-        conn.commit()
-        return True
-    return False
+
+# تابع برای ارسال یک صفحه از گزارش نوبت‌ها به ادمین
+def send_report(chat_id, kind, barber_id=None, date=None, page=0):
+    text, total_pages = render_report_page(app.repository, kind, barber_id, date, page)
+    if text is None:
+        send_message(chat_id, REPORTS[kind]["empty_text"])
+        return
+    page = min(page, total_pages - 1)
+    send_message(
+        chat_id, text, reply_markup=report_keyboard(kind, barber_id, date, page, total_pages)
+    )
 
 
 # تابع برای نمایش نوبت‌های خالی به ادمین
-def show_empty_appointments(chat_id):
-    cursor.execute(
-        "SELECT date, time, barber_id FROM appointments WHERE status='خالی' ORDER BY date, time"
-    )
-    appointments = cursor.fetchall()
-
-    if appointments:
-        table = "لیست نوبت‌های خالی:\n"
-        for date, time, barber_id in appointments:
-            cursor.execute("SELECT name FROM barbers WHERE id=?", (barber_id,))
-            barber_name = cursor.fetchone()[0]
-            table += f"{date} ساعت {time} - آرایشگر: {barber_name}\n"
-        send_message(chat_id, table)
-    else:
-        send_message(chat_id, "هیچ نوبت خالی وجود ندارد.")
+def show_empty_appointments(chat_id, barber_id=None, date=None, page=0):
+    send_report(chat_id, "empty", barber_id, date, page)
 
 
 # تابع برای نمایش نوبت‌های رزرو شده به ادمین
-def show_booked_appointments(chat_id):
-    cursor.execute(
-        "SELECT date, time, name, phone, service, payment_status, barber_id FROM appointments WHERE status='رزرو' ORDER BY date, time"
-    )
-    appointments = cursor.fetchall()
-
-    if appointments:
-        table = "لیست نوبت‌های رزرو شده:\n"
-        for date, time, name, phone, service, payment_status, barber_id in appointments:
-            cursor.execute("SELECT name FROM barbers WHERE id=?", (barber_id,))
-            barber_name = cursor.fetchone()[0]
-            service_fa = "اصلاح" if service == "service_haircut" else "خدمات VIP"
-            table += f"{date} ساعت {time} - {name} ({phone}) - {service_fa} - {payment_status} - آرایشگر: {barber_name}\n"
-        send_message(chat_id, table)
+def show_booked_appointments(chat_id, barber_id=None, date=None, page=0):
+    send_report(chat_id, "booked", barber_id, date, page)
+
+
+# تابع برای نمایش گزینه‌های فیلتر گزارش (آرایشگر یا تاریخ)؛ گزینه‌ها صفحه‌بندی می‌شوند
+def show_report_filter(chat_id, kind, field, other_filter, page=0):
+    if field == "barber":
+        date = None if other_filter == "0" else other_filter
+        options = [
+            (barber["name"], report_callback(kind, barber["id"], date)) for barber in barber_directory.all()
+        ]
+        clear_option = ("همه آرایشگرها", report_callback(kind, None, date))
     else:
-        send_message(chat_id, "هیچ نوبت رزرو شده‌ای وجود ندارد.")
+        barber_id = int(other_filter) or None
+        options = [
+            (f"{label} ({date})", report_callback(kind, barber_id, date)) for label, date in app.calendar.days()
+        ]
+        clear_option = ("همه تاریخ‌ها", report_callback(kind, barber_id))
+    keyboard, page, total_pages = report_filter_keyboard(kind, field, other_filter, options, clear_option, page)
+    text = "لطفا فیلتر گزارش را انتخاب کنید:"
+    if total_pages > 1:
+        text = f"لطفا فیلتر گزارش را انتخاب کنید (صفحه {page + 1} از {total_pages}):"
+    send_message(chat_id, text, reply_markup=keyboard)
+
+
+# تابع برای به‌روزرسانی وضعیت پرداخت رزرو کاربر
+def update_payment_status(user_id, barber_id, date, time, payment_status):
+    return app.repository.set_payment_status(user_id, barber_id, date, time, payment_status)
 
 
-# تابع برای ذخیره‌سازی اطلاعات کاربر و نوبت در جدول user_appointments
-def save_user_appointment(user_id, barber_id, date, time, service, name, phone):
-    cursor.execute(
-        """
-        INSERT INTO user_appointments (user_id, barber_id, date, time, service, name, phone)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-        """,
-        (user_id, barber_id, date, time, service, name, phone),
-    )
-    conn.commit()
+# تابع برای پردازش یک آپدیت (در تردهای dispatcher اجرا می‌شود)
+def process_update(update):
+    # هر آپدیت فقط یک بار پردازش می‌شود، حتی اگر چند نمونه از ربات آن را دریافت کنند
+    # پایان پردازش فقط بعد از اجرای کامل هندلر ثبت می‌شود؛ آپدیتی که پردازشش تمام نشده بعد از
+    # ری‌استارت یا ارسال دوباره به کارگر جدید (release_updates) دوباره پردازش می‌شود
+    config = app.config
+    if not app.repository.claim_update(update["update_id"], config.node_id, config.update_claim_lease):
+        log_event(logger, "duplicate_update", update_id=update["update_id"])
+        return
 
+    # تاخیر بین ارسال پیام توسط کاربر و شروع پردازش آن
+    sent_at = update.get("message", {}).get("date")
+    if sent_at:
+        UPDATE_LAG.set(max(0.0, time.time() - sent_at))
 
-# تابع برای به‌روزرسانی وضعیت پرداخت در جدول user_appointments
-def update_payment_status(user_id, barber_id, date, time, payment_status):
-    cursor.execute(
-        """
-        UPDATE user_appointments
-        SET payment_status=?
-        WHERE user_id=? AND barber_id=? AND date=? AND time=?
-        """,
-        (payment_status, user_id, barber_id, date, time),
+    chat_id = get_update_chat_id(update)
+    user_data = app.sessions.get(chat_id)
+    snapshot = dict(user_data)
+    try:
+        if "message" in update:
+            handle_message(update["message"], user_data)
+        elif "callback_query" in update:
+            handle_callback_query(update["callback_query"], user_data)
+    finally:
+        # فقط در صورت تغییر، وضعیت گفتگو ذخیره می‌شود
+        if user_data != snapshot:
+            app.sessions.save(chat_id, user_data)
+    app.repository.finish_update(update["update_id"])
+
+
+# تابع برای ثبت آمار دوره‌ای
+def log_stats(dispatcher):
+    logger.info(f"Dispatcher stats: {dispatcher.stats()}")
+    logger.info(f"Bale API stats: {app.bale.stats()}")
+    if app.created("outbox"):
+        logger.info(f"Send queue stats: {app.outbox.stats()}")
+    if app.created("reminders"):
+        logger.info(f"Reminder stats: {app.reminders.stats()}")
+    logger.info(f"Scheduler stats: {scheduler.stats()}")
+    for router in (message_routes, state_routes, callback_routes):
+        logger.info(f"Route stats ({router.name}): {router.stats()}")
+
+
+# تابع برای کارهای نگهداری دوره‌ای: بایگانی نوبت‌های گذشته و پاکسازی سوابق قدیمی
+def run_maintenance():
+    config = app.config
+    archived = app.repository.archive_bookings(app.calendar.today(), config.archive_batch_size)
+    pruned = app.repository.prune_processed_updates(config.processed_updates_ttl)
+    if hasattr(app.sessions, "purge_expired"):
+        app.sessions.purge_expired()
+    reminders = app.repository.prune_reminders(time.time() - config.reminder_retention)
+    logger.info(
+        f"Maintenance: {archived} appointments archived, {pruned} update ids pruned, {reminders} reminders pruned"
     )
-    conn.commit()
-
-
-# تابع برای دریافت اطلاعات نوبت کاربر از جدول user_appointments
-def get_user_appointment(user_id):
-    cursor.execute(
-        """
-        SELECT barber_id, date, time, service, name, phone, status, payment_status
-        FROM user_appointments
-        WHERE user_id=?
-        """,
-        (user_id,),
+
+
+# تابع برای صف کردن یادآوری نوبت‌های پیش رو
+def plan_reminders():
+    queued = app.reminders.plan()
+    if queued:
+        logger.info(f"Reminders queued: {queued}")
+
+
+# تابع برای ارسال یک دسته از یادآوری‌های سررسید شده
+def send_reminders():
+    app.reminders.send_due()
+
+
+# زمان‌بند کارهای پس‌زمینه (کارها در schedule_jobs ثبت می‌شوند)
+scheduler = Scheduler(observer=observe_job)
+
+
+# ثبت کارهای دوره‌ای: جابجایی بازه نوبت‌ها در نیمه‌شب، نگهداری دوره‌ای و یادآوری نوبت‌ها
+def schedule_jobs():
+    config = app.config
+    scheduler.daily("slot_rollover", app.calendar.tz, 0, 0, update_appointments_table)
+    scheduler.every("maintenance", config.maintenance_interval, run_maintenance)
+    if app.reminders.leads:
+        scheduler.every("reminder_plan", config.reminder_plan_interval, plan_reminders)
+        scheduler.every("reminder_send", config.reminder_send_interval, send_reminders, log=False)
+
+
+# تابع برای ذخیره آخرین آپدیتی که پردازش آن و همه آپدیت‌های قبلی تمام شده است
+def save_offset(dispatcher, saved_offset):
+    offset = dispatcher.completed_watermark()
+    if offset > saved_offset:
+        app.repository.set_state("last_update_id", offset)
+    return max(offset, saved_offset)
+
+
+# دریافت آپدیت‌ها با long polling
+# بعد از ری‌استارت از آخرین آپدیت ذخیره‌شده ادامه می‌دهد؛ آپدیت‌هایی که پردازششان قبلا
+# تمام شده با claim_update در process_update رد می‌شوند
+def run_polling(dispatcher):
+    saved_offset = int(app.repository.get_state("last_update_id", 0))
+    last_update_id = saved_offset
+    last_stats_log = time.monotonic()
+    failures = 0
+    logger.info(f"Resuming polling after update {last_update_id}")
+
+    try:
+        while True:
+            if time.monotonic() - last_stats_log >= app.config.stats_log_interval:
+                log_stats(dispatcher)
+                last_stats_log = time.monotonic()
+
+            updates = get_updates(last_update_id + 1)
+            if not updates["ok"]:
+                # تاخیر نمایی با jitter بعد از خطا
+                failures += 1
+                delay = random.uniform(0, min(app.config.poll_backoff_max, 2**failures))
+                logger.warning(f"getUpdates failed {failures} times, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            failures = 0
+
+            # آپدیت‌ها به صف سپرده می‌شوند تا درخواست getUpdates بعدی بدون انتظار ارسال شود
+            # اگر آپدیت‌های بیشتری در سرور باشند، long poll بلافاصله برمی‌گردد
+            for update in updates["result"]:
+                last_update_id = update["update_id"]
+                dispatcher.submit(update)
+
+            saved_offset = save_offset(dispatcher, saved_offset)
+    finally:
+        # قبل از خروج آپدیت‌های در حال پردازش تمام و آخرین offset ذخیره می‌شود
+        dispatcher.shutdown(wait=True)
+        save_offset(dispatcher, saved_offset)
+        logger.info(f"Polling stopped at update {dispatcher.completed_watermark()}")
+
+
+# دریافت آپدیت‌ها از طریق وب‌هوک
+def run_webhook(dispatcher):
+    config = app.config
+    if not config.webhook_url:
+        raise ValueError("متغیر محیطی WEBHOOK_URL برای حالت webhook تعریف نشده است.")
+    if not config.webhook_secret:
+        logger.warning("WEBHOOK_SECRET is not set, webhook requests are not authenticated")
+
+    server = WebhookServer(
+        config.webhook_host,
+        config.webhook_port,
+        config.webhook_path,
+        config.webhook_secret,
+        dispatcher.submit,
     )
-    return cursor.fetchone()
+    threading.Thread(target=server.serve_forever, name="webhook", daemon=True).start()
+    logger.info(f"Webhook server listening on {config.webhook_host}:{config.webhook_port}{config.webhook_path}")
+
+    payload = {"url": config.webhook_url}
+    if config.webhook_secret:
+        payload["secret_token"] = config.webhook_secret
+    app.bale.call("setWebhook", payload)
+
+    try:
+        while True:
+            time.sleep(config.stats_log_interval)
+            log_stats(dispatcher)
+    finally:
+        server.shutdown()
+        dispatcher.shutdown(wait=True)
 
 
-# تابع اصلی
-def main():
+# با SIGTERM (مثلا docker stop) ربات به صورت مرتب متوقف می‌شود
+def handle_sigterm(signum, frame):
+    raise SystemExit(0)
+
+
+# سرور متریک‌ها (در صورت تعیین METRICS_PORT)
+def start_metrics_server(config):
+    OUTBOX_PENDING.set_function(lambda: app.outbox.stats()["pending"] if app.created("outbox") else 0)
+    if not config.metrics_port:
+        return
+    metrics_server = MetricsServer(config.metrics_host, config.metrics_port, metrics)
+    threading.Thread(target=metrics_server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"Metrics available on http://{config.metrics_host}:{config.metrics_port}/metrics")
+
+
+# اجرای ربات (دستور run)
+# با چند پروسس کارگر، این پروسس فقط آپدیت‌ها را دریافت و بین کارگرها پخش می‌کند و کارهای زمان‌بندی شده را اجرا می‌کند
+# (متریک‌های کارگر i روی METRICS_PORT + 1 + i هستند)
+def run_bot(args=None):
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    config = app.config
+    # دستورات دیگر (مثل migrate) به ADMIN_USER_ID نیاز ندارند؛ پس فقط اینجا بررسی می‌شود
+    try:
+        config.admin_user_id
+    except ValueError as e:
+        logger.error(e)
+        return 1
+    workers = getattr(args, "workers", None) or config.worker_processes
+    if workers > 1:
+        # این پروسس فقط یادآوری‌ها را ارسال می‌کند و فقط سهم آنها از محدودیت نرخ سراسری را دارد
+        # (قبل از شروع زمان‌بندی تا صف خروجی با همین نرخ ساخته شود)
+        rate, burst = config.send_rate_share(workers, supervisor=True)
+        if rate:
+            config.send_global_rate, config.send_global_burst = rate, burst
+    # آپدیت‌های پردازش‌شده، آخرین آپدیت دریافت شده و (با SESSION_BACKEND=repository) وضعیت گفتگوها در مخزن داده
+    # هستند؛ پس با STORAGE_BACKEND=postgres بین همه نمونه‌های ربات مشترک‌اند
+    if config.storage_backend == "postgres" and config.session_backend != "repository":
+        logger.warning(
+            f"SESSION_BACKEND={config.session_backend} keeps conversation state local to this instance; "
+            "use SESSION_BACKEND=repository when running several instances"
+        )
+    # آپدیت‌هایی که اجرای قبلی همین نمونه پردازششان را تمام نکرده دوباره دریافت و پردازش می‌شوند
+    released = app.repository.release_updates(owner=config.node_id)
+    if released:
+        logger.info(f"Released {released} unfinished updates from the previous run")
     update_appointments_table()
-    last_update_id = 0
+    schedule_jobs()
+    scheduler.start()
+    if workers > 1:
+        dispatcher = ClusterSupervisor(
+            workers,
+            max_pending=config.dispatcher_max_pending,
+            release=lambda update_ids: app.repository.release_updates(update_ids=update_ids),
+        )
+        dispatcher.start()
+    else:
+        dispatcher = UpdateDispatcher(
+            process_update,
+            max_workers=config.dispatcher_workers,
+            max_pending=config.dispatcher_max_pending,
+        )
+    DISPATCHER_PENDING.set_function(lambda: dispatcher.stats()["pending"])
+    start_metrics_server(config)
+    if config.bot_mode == "webhook":
+        run_webhook(dispatcher)
+    else:
+        run_polling(dispatcher)
+    return 0
+
+
+# ساخت یا به‌روزرسانی اسکیمای پایگاه داده (دستور migrate)
+def run_migrate(args):
+    version = migrate(app.db.connection())
+    logger.info(f"Database {app.config.db_path} is at schema version {version}")
+    return 0
+
+
+# بروزرسانی آرایشگرها از فایل CSV بدون اجرای ربات (دستور import-barbers)
+def run_import_barbers(args):
+    try:
+        result = update_barbers_from_csv(
+            args.file or app.config.barbers_csv_path, remove_missing=args.remove_missing
+        )
+    except BarberImportError as e:
+        for error in e.errors:
+            logger.error(error)
+        return 1
+    logger.info(f"Barbers imported: {result}")
+    if result["missing"]:
+        logger.warning(
+            f"{result['missing']} barbers are not in the file and were kept; use --remove-missing to delete them"
+        )
+    return 0
 
-    while True:
-        updates = get_updates(last_update_id + 1)
-        if not updates["ok"] or not updates["result"]:
-            continue
 
-        for update in updates["result"]:
-            last_update_id = update["update_id"]
-            if "message" in update:
-                handle_message(update["message"])
-            elif "callback_query" in update:
-                handle_callback_query(update["callback_query"])
+# بنچمارک عملیات پایگاه داده (دستور bench)؛ به تنظیمات ربات نیازی ندارد
+def run_bench(args):
+    import bench
 
-        time.sleep(1)
+    return bench.run(args)
+
+
+# نقطه ورود خط فرمان؛ بدون دستور، ربات اجرا می‌شود (python main.py)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ربات نوبت‌دهی آرایشگاه")
+    parser.set_defaults(func=run_bot)
+    commands = parser.add_subparsers()
+    run_parser = commands.add_parser("run", help="اجرای ربات")
+    run_parser.add_argument("--workers", type=int, help="تعداد پروسس‌های کارگر (پیش‌فرض WORKER_PROCESSES)")
+    run_parser.set_defaults(func=run_bot)
+    commands.add_parser("migrate", help="به‌روزرسانی اسکیمای پایگاه داده").set_defaults(
+        func=run_migrate
+    )
+    import_parser = commands.add_parser("import-barbers", help="بروزرسانی آرایشگرها از فایل CSV")
+    import_parser.add_argument("file", nargs="?")
+    import_parser.add_argument(
+        "--remove-missing", action="store_true", help="حذف آرایشگرهایی که در فایل نیستند"
+    )
+    import_parser.set_defaults(func=run_import_barbers)
+    bench_parser = commands.add_parser("bench", help="بنچمارک عملیات پایگاه داده")
+    bench_parser.add_argument("--barbers", type=int, default=1000)
+    bench_parser.add_argument("--race", type=int, default=300)
+    bench_parser.set_defaults(func=run_bench)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        return args.func(args)
+    finally:
+        scheduler.stop()
+        app.close()
 
 
 def validate_phone_number(phone):
@@ -487,325 +696,356 @@ def validate_phone_number(phone):
     return re.match(r"^09\d{9}$", phone) is not None
 
 
-# تابع برای پردازش پیام‌های کاربر
-def handle_message(message):
+# مسیریاب‌های دستورات، مراحل گفتگو و callback_query ها
+message_routes = Router("message")
+state_routes = Router("state")
+callback_routes = Router("callback")
+
+# مراحل گفتگوی رزرو نوبت (user_data["state"])
+STATE_SLOT_SELECTION = "awaiting_slot_selection"
+STATE_NAME = "awaiting_name"
+STATE_PHONE = "awaiting_phone"
+# جلسه‌های ذخیره‌شده قدیمی به جای state پرچم‌های جداگانه داشتند (به ترتیب اولویت)
+LEGACY_STATE_FLAGS = (STATE_NAME, STATE_PHONE, STATE_SLOT_SELECTION)
+
+
+# تابع برای خواندن مرحله فعلی گفتگو (پرچم‌های قدیمی به state تبدیل می‌شوند)
+def conversation_state(user_data):
+    for flag in LEGACY_STATE_FLAGS:
+        if user_data.pop(flag, None) and "state" not in user_data:
+            user_data["state"] = flag
+    return user_data.get("state")
+
+
+def enter_state(user_data, state):
+    if state is None:
+        user_data.pop("state", None)
+    else:
+        user_data["state"] = state
+
+
+def is_admin(chat_id, user_id, *args):
+    return user_id == app.config.admin_user_id
+
+
+# ثبت زمان اجرای هندلرها در متریک‌ها و هندلرهای کند در لاگ
+def observe_route(route, duration, error):
+    HANDLER_LATENCY.observe(duration, route=route)
+    if error is not None:
+        ERRORS.inc(component="handler")
+    if duration >= app.config.slow_route_threshold:
+        log_event(logger, "slow_handler", level=logging.WARNING, route=route, ms=round(duration * 1000))
+
+
+for router in (message_routes, state_routes, callback_routes):
+    router.add_hook(observe_route)
+
+
+# تابع برای پردازش پیام‌های کاربر: ابتدا دستورات و سپس مرحله فعلی گفتگو
+def handle_message(message, user_data):
     chat_id = message["chat"]["id"]
+    user_id = message["from"]["id"]
     text = message.get("text", "")
+    if message_routes.dispatch(text, chat_id, user_id, text, user_data):
+        return
+    state_routes.dispatch(conversation_state(user_data), chat_id, user_id, text, user_data)
+
 
-    if text == "/start":
-        user_id = message["from"]["id"]
-        cursor.execute(
-            "SELECT date, time FROM appointments WHERE user_id=? ORDER BY date, time LIMIT 1",
-            (user_id,),
+# تابع برای پردازش callback_query
+# callback_query بدون message (مثلا دکمه پیام inline) چتی برای پاسخ ندارد و نادیده گرفته می‌شود
+def handle_callback_query(callback_query, user_data):
+    message = callback_query.get("message")
+    user_id = callback_query["from"]["id"]
+    data = callback_query.get("data")
+    if not message:
+        log_event(logger, "callback_without_message", app.config.log_sample_rate, data=data, user_id=user_id)
+        return
+    chat_id = message["chat"]["id"]
+    if not callback_routes.dispatch(data, chat_id, user_id, user_data):
+        log_event(logger, "unhandled_callback", app.config.log_sample_rate, data=data, user_id=user_id)
+
+
+# تابع برای نمایش صفحه اصلی: نوبت فعلی کاربر یا منوی انتخاب خدمت
+def show_home(chat_id, user_id):
+    appointment = app.repository.first_booked_slot(user_id)
+
+    if appointment:
+        date, time = appointment
+        send_message(
+            chat_id,
+            f"شما قبلاً نوبت گرفته‌اید. نوبت شما برای {date} ساعت {time} است.",
+            reply_markup=EXISTING_APPOINTMENT_KEYBOARD,
         )
-        appointment = cursor.fetchone()
-
-        if appointment:
-            date, time = appointment
-            keyboard = {
-                "inline_keyboard": [
-                    [
-                        {
-                            "text": "مشاهده نوبت من",
-                            "callback_data": "show_my_appointment",
-                        },
-                        {"text": "لغو نوبت", "callback_data": "cancel_appointment"},
-                    ],
-                    [{"text": "نوبت جدید", "callback_data": "new_appointment"}],
-                ]
-            }
-            send_message(
-                chat_id,
-                f"شما قبلاً نوبت گرفته‌اید. نوبت شما برای {date} ساعت {time} است.",
-                reply_markup=keyboard,
-            )
-        else:
-            keyboard = {
-                "inline_keyboard": [
-                    [{"text": "اصلاح", "callback_data": "service_haircut"}],
-                    [{"text": "خدمات VIP", "callback_data": "service_vip"}],
-                ]
-            }
-            send_message(
-                chat_id, "لطفا نوع خدمت را انتخاب کنید:", reply_markup=keyboard
-            )
-    elif text == "/admin" and message["from"]["id"] == ADMIN_USER_ID:
-        keyboard = {
-            "inline_keyboard": [
-                [{"text": "نمایش نوبت‌های خالی", "callback_data": "show_empty"}],
-                [{"text": "نمایش نوبت‌های رزرو شده", "callback_data": "show_booked"}],
-                [{"text": "بروزرسانی آرایشگرها", "callback_data": "update_barbers"}],
-            ]
-        }
-        send_message(chat_id, "لطفا نوع نوبت‌ها را انتخاب کنید:", reply_markup=keyboard)
-    elif text == "/update_barbers" and message["from"]["id"] == ADMIN_USER_ID:
-        update_barbers_from_csv("barbers.csv")
-        send_message(chat_id, "اطلاعات آرایشگرها با موفقیت بروزرسانی شد.")
-
-    elif "awaiting_name" in context["user_data"]:
-        context["user_data"]["name"] = text
-        context["user_data"]["awaiting_phone"] = True
-        del context["user_data"]["awaiting_name"]
-        send_message(chat_id, "📞 لطفا شماره تماس خود را وارد کنید:")
-
-    elif "awaiting_phone" in context["user_data"]:
-        if validate_phone_number(text):
-            user_id = message["from"]["id"]
-            barber_id = context["user_data"].get("selected_barber_id")
-            date = context["user_data"].get("selected_date")
-            time = context["user_data"].get("selected_time")
-            name = context["user_data"].get("name")
-            phone = text
-
-            if not (barber_id and date and time and name and phone):
-                send_message(chat_id, "⚠️ خطا در ثبت نوبت. لطفا دوباره تلاش کنید.")
-                return
-
-            # به‌روزرسانی اطلاعات نوبت در دیتابیس
-            cursor.execute(
-                """
-                UPDATE appointments
-                SET user_id=?, name=?, phone=?, status='رزرو'
-                WHERE date=? AND time=? AND barber_id=?
-                """,
-                (user_id, name, phone, date, time, barber_id),
-            )
-            conn.commit()
-
-            # ذخیره در جدول user_appointments برای مدیریت بهتر
-            cursor.execute(
-                """
-                INSERT INTO user_appointments (user_id, barber_id, date, time, service, name, phone, status, payment_status)
-                VALUES (?, ?, ?, ?, ?, ?, ?, 'رزرو', 'پرداخت نشده')
-                """,
-                (
-                    user_id,
-                    barber_id,
-                    date,
-                    time,
-                    context["user_data"].get("service", "service_haircut"),
-                    name,
-                    phone,
-                ),
-            )
-            conn.commit()
-
-            # حذف اطلاعات موقت
-            del context["user_data"]["awaiting_phone"]
-            del context["user_data"]["selected_date"]
-            del context["user_data"]["selected_time"]
-            del context["user_data"]["selected_barber_id"]
-            del context["user_data"]["name"]
-
-            # ارسال پیام تایید و نمایش دکمه پرداخت
-            keyboard = {
-                "inline_keyboard": [
-                    [{"text": "💳 پرداخت آنلاین", "callback_data": "pay_online"}],
-                    [{"text": "💵 پرداخت حضوری", "callback_data": "pay_in_person"}],
-                ]
-            }
-            send_message(
-                chat_id,
-                f"✅ نوبت شما برای {date} ساعت {time} ثبت شد.\n💈 لطفا روش پرداخت را انتخاب کنید:",
-                reply_markup=keyboard,
-            )
-        else:
-            send_message(
-                chat_id,
-                "❌ شماره تماس نامعتبر است. لطفا شماره صحیح وارد کنید (مثال: 09123456789).",
-            )
+    else:
+        send_message(chat_id, SERVICE_MENU)
 
-    elif "awaiting_slot_selection" in context["user_data"]:
-        try:
-            slot_number = int(text)
-            available_slots = context["user_data"]["available_slots"]
-            if 1 <= slot_number <= len(available_slots):
-                date_label, time = available_slots[slot_number - 1]
-                context["user_data"]["selected_date"] = date_label
-                context["user_data"]["selected_time"] = time
-                send_message(chat_id, "لطفا نام خود را وارد کنید:")
-                context["user_data"]["awaiting_name"] = True
-                del context["user_data"]["awaiting_slot_selection"]
-            else:
-                send_message(chat_id, "شماره ردیف نامعتبر است. لطفا دوباره وارد کنید.")
-        except ValueError:
-            send_message(chat_id, "لطفا یک عدد وارد کنید.")
 
+@message_routes.route("/start")
+def handle_start_command(chat_id, user_id, text, user_data):
+    show_home(chat_id, user_id)
 
-# تابع برای پردازش callback_query
-def handle_callback_query(callback_query):
-    chat_id = callback_query["message"]["chat"]["id"]
-    data = callback_query["data"]
-    user_id = callback_query["from"]["id"]
 
-    if data == "start":
-        handle_message(
-            {"chat": {"id": chat_id}, "from": {"id": user_id}, "text": "/start"}
+@message_routes.route("/admin", guard=is_admin)
+def handle_admin_command(chat_id, user_id, text, user_data):
+    send_message(chat_id, ADMIN_MENU)
+
+
+@message_routes.route("/update_barbers", guard=is_admin)
+def handle_update_barbers_command(chat_id, user_id, text, user_data):
+    start_barber_import(chat_id)
+
+
+@state_routes.route(STATE_SLOT_SELECTION)
+def handle_slot_selection(chat_id, user_id, text, user_data):
+    try:
+        slot_number = int(text)
+    except ValueError:
+        send_message(chat_id, "لطفا یک عدد وارد کنید.")
+        return
+    available_slots = user_data.get("available_slots", [])
+    if 1 <= slot_number <= len(available_slots):
+        date_label, time = available_slots[slot_number - 1]
+        user_data["selected_date"] = date_label
+        user_data["selected_time"] = time
+        enter_state(user_data, STATE_NAME)
+        send_message(chat_id, "لطفا نام خود را وارد کنید:")
+    else:
+        send_message(chat_id, "شماره ردیف نامعتبر است. لطفا دوباره وارد کنید.")
+
+
+@state_routes.route(STATE_NAME)
+def handle_name(chat_id, user_id, text, user_data):
+    user_data["name"] = text
+    enter_state(user_data, STATE_PHONE)
+    send_message(chat_id, "📞 لطفا شماره تماس خود را وارد کنید:")
+
+
+@state_routes.route(STATE_PHONE)
+def handle_phone(chat_id, user_id, text, user_data):
+    if not validate_phone_number(text):
+        send_message(
+            chat_id,
+            "❌ شماره تماس نامعتبر است. لطفا شماره صحیح وارد کنید (مثال: 09123456789).",
         )
         return
 
-    if data == "service_haircut" or data == "service_vip":
-        context["user_data"]["service"] = data
-        show_barbers(chat_id)
-    elif data.startswith("select_barber_"):
-        barber_id = int(data.split("_")[2])  # استخراج barber_id از callback_data
-        context["user_data"][
-            "selected_barber_id"
-        ] = barber_id  # ذخیره barber_id در context
+    barber_id = user_data.get("selected_barber_id")
+    date = user_data.get("selected_date")
+    time = user_data.get("selected_time")
+    name = user_data.get("name")
+    phone = text
 
-        keyboard = {
-            "inline_keyboard": [
-                [{"text": "📅 اولین نوبت خالی", "callback_data": "first_available"}],
-                [{"text": "📋 مشاهده جدول نوبت‌ها", "callback_data": "show_table"}],
-            ]
-        }
+    if not (barber_id and date and time and name and phone):
+        send_message(chat_id, "⚠️ خطا در ثبت نوبت. لطفا دوباره تلاش کنید.")
+        return
+
+    # رزرو اتمیک همه نوبت‌های لازم برای خدمت؛ اگر در این فاصله شخص دیگری
+    # یکی از آنها را گرفته باشد رزرو انجام نمی‌شود
+    service = user_data.get("service", "service_haircut")
+    times = app.schedules.for_barber(barber_id).block(
+        time, app.schedules.block_length(barber_id, service)
+    )
+    booked = times is not None and app.repository.book(
+        user_id, barber_id, date, times, service, name, phone
+    )
 
+    # حذف اطلاعات موقت
+    enter_state(user_data, None)
+    del user_data["selected_date"]
+    del user_data["selected_time"]
+    del user_data["selected_barber_id"]
+    del user_data["name"]
+
+    BOOKINGS.inc(result="booked" if booked else "conflict")
+    if not booked:
         send_message(
             chat_id,
-            "🔽 لطفا یکی از گزینه‌های زیر را انتخاب کنید:",
-            reply_markup=keyboard,
+            "⚠️ متاسفانه این نوبت همین حالا توسط شخص دیگری رزرو شد. لطفا نوبت دیگری انتخاب کنید.",
         )
+        return
 
-    elif data == "first_available":
-        barber_id = context["user_data"].get("selected_barber_id")
-        if not barber_id:
-            send_message(chat_id, "⚠️ لطفا ابتدا آرایشگر خود را انتخاب کنید.")
-            return
+    # ارسال پیام تایید و نمایش دکمه پرداخت
+    send_message(
+        chat_id,
+        f"✅ نوبت شما برای {date} ساعت {time} ثبت شد.\n💈 لطفا روش پرداخت را انتخاب کنید:",
+        reply_markup=PAYMENT_KEYBOARD,
+    )
 
-        # بررسی نوبت‌های خالی در ۳ روز آینده با استفاده از filter_past_times
-        for date_label, date_value in [
-            ("امروز", to_jalali(datetime.now(pytz.timezone(USER_TIMEZONE)).date())),
-            ("فردا", to_jalali((datetime.now(pytz.timezone(USER_TIMEZONE)) + timedelta(days=1)).date())),
-            ("پس‌فردا", to_jalali((datetime.now(pytz.timezone(USER_TIMEZONE)) + timedelta(days=2)).date())),
-        ]:
-            available_times = filter_past_times(date_value)  # استفاده از تابع موجود برای فیلتر زمان‌های گذشته
-            for time in available_times:
-                cursor.execute(
-                    "SELECT * FROM appointments WHERE date=? AND time=? AND status='خالی' AND barber_id=?",
-                    (date_value, time, barber_id),
-                )
-                if cursor.fetchone():
-                    context["user_data"]["selected_date"] = date_value
-                    context["user_data"]["selected_time"] = time
-                    keyboard = {
-                        "inline_keyboard": [
-                            [{"text": "✅ تایید", "callback_data": "confirm_first"}]
-                        ]
-                    }
-                    send_message(
-                        chat_id,
-                        f"📅 اولین نوبت خالی: {date_label} ساعت {time}. آیا تایید می‌کنید؟",
-                        reply_markup=keyboard,
-                    )
-                    return
-
-        send_message(chat_id, "❌ نوبت خالی یافت نشد!")
-
-    elif data == "confirm_first":
-        user_id = callback_query["from"]["id"]
-        barber_id = context["user_data"].get("selected_barber_id")
-        date = context["user_data"].get("selected_date")
-        time = context["user_data"].get("selected_time")
-
-        if not (barber_id and date and time):
-            send_message(chat_id, "⚠️ خطا در تایید نوبت. لطفا دوباره تلاش کنید.")
+
+@callback_routes.route("start")
+def handle_home(chat_id, user_id, user_data):
+    show_home(chat_id, user_id)
+
+
+@callback_routes.prefix("service_")
+def handle_service_selection(chat_id, user_id, user_data, service):
+    service = f"service_{service}"
+    if service not in app.schedules.service_minutes:
+        return
+    user_data["service"] = service
+    show_barbers(chat_id)
+
+
+@callback_routes.prefix("select_barber_", parse=int)
+def handle_barber_selection(chat_id, user_id, user_data, barber_id):
+    user_data["selected_barber_id"] = barber_id  # ذخیره barber_id در جلسه کاربر
+    send_message(chat_id, BARBER_OPTIONS_MENU)
+
+
+@callback_routes.route("first_available")
+def handle_first_available(chat_id, user_id, user_data):
+    barber_id = user_data.get("selected_barber_id")
+    if not barber_id:
+        send_message(chat_id, "⚠️ لطفا ابتدا آرایشگر خود را انتخاب کنید.")
+        return
+
+    # برای خدمات چند نوبتی (مثل VIP) اولین بلوک خالی پشت سر هم پیدا می‌شود
+    length = app.schedules.block_length(barber_id, user_data.get("service"))
+    for date_label, date_value, blocks in get_availability(barber_id, length):
+        if blocks:
+            time = blocks[0][0]
+            user_data["selected_date"] = date_value
+            user_data["selected_time"] = time
+            send_message(
+                chat_id,
+                f"📅 اولین نوبت خالی: {date_label} ساعت {time}. آیا تایید می‌کنید؟",
+                reply_markup=CONFIRM_FIRST_KEYBOARD,
+            )
             return
 
-        # ذخیره اطلاعات موقت برای ادامه روند
-        context["user_data"]["awaiting_name"] = True
-
-        send_message(chat_id, "👤 لطفا نام خود را وارد کنید:")
-
-    elif data == "show_table":
-        show_available_slots(chat_id, context["user_data"].get("selected_barber_id"))
-    elif data == "confirm":
-        if (
-            "selected_date" in context["user_data"]
-            and "selected_time" in context["user_data"]
-        ):
-            send_message(chat_id, "لطفا نام خود را وارد کنید:")
-            context["user_data"]["awaiting_name"] = True
-    elif data == "show_my_appointment":
-        # دریافت همه نوبت‌های کاربر از جدول user_appointments
-        cursor.execute(
-            """
-            SELECT date, time, service, barber_id, payment_status
-            FROM user_appointments
-            WHERE user_id=? AND status='رزرو'
-            ORDER BY date, time
-            """,
-            (user_id,),
-        )
-        appointments = cursor.fetchall()
+    send_message(chat_id, "❌ نوبت خالی یافت نشد!")
 
-        if not appointments:
-            send_message(chat_id, "شما هیچ نوبتی ندارید.")
-        else:
-            table = "📅 لیست نوبت‌های شما:\n"
-            for date, time, service, barber_id, payment_status in appointments:
-                # دریافت نام آرایشگر
-                cursor.execute("SELECT name FROM barbers WHERE id=?", (barber_id,))
-                barber = cursor.fetchone()
-                barber_name = barber[0] if barber else "نامشخص"
 
-                # تبدیل نوع سرویس به فارسی
-                service_fa = "اصلاح" if service == "service_haircut" else "خدمات VIP"
+@callback_routes.route("confirm_first")
+def handle_confirm_first(chat_id, user_id, user_data):
+    barber_id = user_data.get("selected_barber_id")
+    date = user_data.get("selected_date")
+    time = user_data.get("selected_time")
 
-                table += f"\n🕒 {date} ساعت {time}\n✂️ سرویس: {service_fa}\n💈 آرایشگر: {barber_name}\n💳 وضعیت پرداخت: {payment_status}\n"
-                table += "------------------------"
+    if not (barber_id and date and time):
+        send_message(chat_id, "⚠️ خطا در تایید نوبت. لطفا دوباره تلاش کنید.")
+        return
 
-            send_message(chat_id, table)
+    enter_state(user_data, STATE_NAME)
+    send_message(chat_id, "👤 لطفا نام خود را وارد کنید:")
 
-    elif data == "new_appointment":
-        keyboard = {
-            "inline_keyboard": [
-                [{"text": "اصلاح", "callback_data": "service_haircut"}],
-                [{"text": "خدمات VIP", "callback_data": "service_vip"}],
-            ]
-        }
-        send_message(chat_id, "لطفا نوع خدمت را انتخاب کنید:", reply_markup=keyboard)
-    elif data == "show_empty":
-        show_empty_appointments(chat_id)
-    elif data == "show_booked":
-        show_booked_appointments(chat_id)
-    elif data == "cancel_appointment":
-        user_id = callback_query["from"]["id"]
-        if cancel_appointment(user_id):
-            send_message(chat_id, "نوبت شما با موفقیت لغو شد.")
-        else:
-            send_message(chat_id, "شما هیچ نوبتی برای لغو ندارید.")
-    elif data == "pay_online":
-        # دریافت اطلاعات نوبت کاربر از دیتابیس
-        cursor.execute(
-            "SELECT barber_id FROM user_appointments WHERE user_id=? AND status='رزرو'",
-            (user_id,),
+
+@callback_routes.route("show_table")
+def handle_show_table(chat_id, user_id, user_data):
+    show_available_slots(chat_id, user_data.get("selected_barber_id"), user_data)
+
+
+@callback_routes.route("confirm")
+def handle_confirm(chat_id, user_id, user_data):
+    if "selected_date" in user_data and "selected_time" in user_data:
+        enter_state(user_data, STATE_NAME)
+        send_message(chat_id, "لطفا نام خود را وارد کنید:")
+
+
+@callback_routes.route("show_my_appointment")
+def handle_show_my_appointment(chat_id, user_id, user_data):
+    # دریافت همه نوبت‌های فعال کاربر
+    appointments = app.repository.active_bookings(user_id)
+
+    if not appointments:
+        send_message(chat_id, "شما هیچ نوبتی ندارید.")
+        return
+
+    table = "📅 لیست نوبت‌های شما:\n"
+    for appointment in appointments:
+        # تبدیل نوع سرویس به فارسی
+        service_fa = "اصلاح" if appointment["service"] == "service_haircut" else "خدمات VIP"
+
+        table += (
+            f"\n🕒 {appointment['date']} ساعت {appointment['time']}\n✂️ سرویس: {service_fa}\n"
+            f"💈 آرایشگر: {appointment['barber_name']}\n💳 وضعیت پرداخت: {appointment['payment_status']}\n"
         )
-        barber = cursor.fetchone()
+        table += "------------------------"
 
-        if not barber:
-            send_message(chat_id, "خطا در دریافت اطلاعات آرایشگر.")
-            return
+    send_message(chat_id, table)
+
+
+@callback_routes.route("new_appointment")
+def handle_new_appointment(chat_id, user_id, user_data):
+    send_message(chat_id, SERVICE_MENU)
+
+
+@callback_routes.route("cancel_appointment")
+def handle_cancel_appointment(chat_id, user_id, user_data):
+    if cancel_appointment(user_id):
+        CANCELLATIONS.inc(result="cancelled")
+        send_message(chat_id, "نوبت شما با موفقیت لغو شد.")
+    else:
+        CANCELLATIONS.inc(result="not_found")
+        send_message(chat_id, "شما هیچ نوبتی برای لغو ندارید.")
 
-        barber_id = barber[0]
-        amount = 1800000
-        description = "پرداخت هزینه خدمت آرایشگاه"
-        invoice_response = send_invoice(chat_id, amount, description, barber_id)
 
-        if invoice_response and invoice_response.get("ok"):
+@callback_routes.route("pay_online")
+def handle_pay_online(chat_id, user_id, user_data):
+    # دریافت اطلاعات نوبت کاربر
+    bookings = app.repository.active_bookings(user_id)
+
+    if not bookings:
+        send_message(chat_id, "خطا در دریافت اطلاعات آرایشگر.")
+        return
+
+    barber_id = bookings[0]["barber_id"]
+    amount = 1800000
+    description = "پرداخت هزینه خدمت آرایشگاه"
+    invoice_future = send_invoice(chat_id, amount, description, barber_id)
+    if invoice_future is None:
+        PAYMENTS.inc(method="online", result="no_card")
+        return
+
+    # نتیجه ارسال فاکتور بعد از تحویل آن بررسی می‌شود تا هندلر منتظر نماند
+    def on_invoice_sent(future):
+        if future.exception() is None and future.result().get("ok"):
+            PAYMENTS.inc(method="online", result="invoice_sent")
             send_message(chat_id, "لطفا پرداخت را از طریق فاکتور ارسال‌شده انجام دهید.")
         else:
+            PAYMENTS.inc(method="online", result="invoice_failed")
             send_message(chat_id, "خطا در ارسال فاکتور پرداخت. لطفا دوباره تلاش کنید.")
 
-    elif data == "pay_in_person":
-        keyboard = {
-            "inline_keyboard": [
-                [{"text": "مشاهده نوبت من", "callback_data": "show_my_appointment"}],
-                [{"text": "لغو نوبت", "callback_data": "cancel_appointment"}],
-            ]
-        }
-        send_message(chat_id, "به صفحه اصلی بازگشتید:", reply_markup=keyboard)
+    invoice_future.add_done_callback(on_invoice_sent)
+
+
+@callback_routes.route("pay_in_person")
+def handle_pay_in_person(chat_id, user_id, user_data):
+    PAYMENTS.inc(method="in_person", result="selected")
+    send_message(chat_id, HOME_MENU)
+
+
+@callback_routes.route("update_barbers", guard=is_admin)
+def handle_update_barbers(chat_id, user_id, user_data):
+    start_barber_import(chat_id)
+
+
+@callback_routes.route("update_barbers_remove", guard=is_admin)
+def handle_update_barbers_remove(chat_id, user_id, user_data):
+    start_barber_import(chat_id, remove_missing=True)
+
+
+@callback_routes.route("show_empty", guard=is_admin)
+def handle_show_empty(chat_id, user_id, user_data):
+    show_empty_appointments(chat_id)
+
+
+@callback_routes.route("show_booked", guard=is_admin)
+def handle_show_booked(chat_id, user_id, user_data):
+    show_booked_appointments(chat_id)
+
+
+@callback_routes.prefix("report_", parse=parse_report_callback, guard=is_admin)
+def handle_report_page(chat_id, user_id, user_data, report):
+    kind, barber_id, date, page = report
+    send_report(chat_id, kind, barber_id, date, page)
+
+
+@callback_routes.prefix("reportfilter_", parse=parse_report_filter_callback, guard=is_admin)
+def handle_report_filter(chat_id, user_id, user_data, params):
+    kind, field, other_filter, page = params
+    show_report_filter(chat_id, kind, field, other_filter, page)
 
 
 if __name__ == "__main__":
-    context = {"user_data": {}}
-    main()
+    raise SystemExit(main())
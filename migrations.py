@@ -0,0 +1,283 @@
+import logging
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+
+# مایگریشن ۲: نوبتی که چند ردیف غیر خالی (مثلا دو رزرو) دارد به صورت خودکار قابل اصلاح نیست
+# این نوبت‌ها در لاگ ثبت می‌شوند و مایگریشن متوقف می‌شود تا ادمین آنها را بررسی و اصلاح کند
+def check_duplicate_bookings(conn):
+    duplicates = conn.execute(
+        """
+        SELECT barber_id, date, time, GROUP_CONCAT(id) FROM appointments
+        WHERE status IS NOT 'خالی' AND barber_id IS NOT NULL AND date IS NOT NULL AND time IS NOT NULL
+        GROUP BY barber_id, date, time HAVING COUNT(*) > 1
+        """
+    ).fetchall()
+    for barber_id, date, time, ids in duplicates:
+        logger.error(f"Slot booked more than once: barber {barber_id}, {date} {time}, appointment ids {ids}")
+    if duplicates:
+        raise RuntimeError(
+            f"{len(duplicates)} نوبت بیش از یک بار رزرو شده است؛ ردیف‌های تکراری جدول appointments را اصلاح و دوباره migrate را اجرا کنید."
+        )
+
+
+# جدول وضعیت گفتگوی کاربران؛ در مایگریشن ۹ و در فایل جداگانه SESSION_DB_PATH (sessions.py) ساخته می‌شود
+SESSIONS_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS sessions (
+        chat_id INTEGER PRIMARY KEY,
+        data TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )
+    """,
+    # حذف جلسه‌های منقضی‌شده
+    "CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)",
+]
+
+
+# لیست مایگریشن‌ها به ترتیب نسخه؛ هر مایگریشن فقط یک بار روی هر پایگاه داده اجرا می‌شود
+# هر دستور یک کوئری SQL یا تابعی است که اتصال را می‌گیرد (برای بررسی‌هایی که SQL تنها کافی نیست)
+# دستورات باید روی پایگاه داده‌های قدیمی (ساخته‌شده قبل از سیستم مایگریشن) هم امن باشند
+MIGRATIONS = [
+    (
+        1,
+        "create base tables",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS appointments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                barber_id INTEGER,
+                date TEXT,
+                time TEXT,
+                service TEXT,
+                name TEXT,
+                phone TEXT,
+                status TEXT DEFAULT 'خالی',
+                payment_status TEXT DEFAULT 'پرداخت نشده',
+                tracking_code TEXT,
+                FOREIGN KEY(barber_id) REFERENCES barbers(id)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS barbers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT,
+                phone TEXT,
+                address TEXT,
+                user_id INTEGER UNIQUE,
+                card_number TEXT
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS user_appointments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                barber_id INTEGER,
+                date TEXT,
+                time TEXT,
+                service TEXT,
+                name TEXT,
+                phone TEXT,
+                status TEXT DEFAULT 'رزرو',
+                payment_status TEXT DEFAULT 'پرداخت نشده',
+                tracking_code TEXT
+            )
+            """,
+        ],
+    ),
+    (
+        2,
+        "unique slot per barber, date and time",
+        [
+            check_duplicate_bookings,
+            # حذف نوبت‌های خالی تکراری؛ نوبت غیر خالی (رزرو شده) یا قدیمی‌ترین نوبت خالی هر ساعت نگه داشته می‌شود
+            """
+            DELETE FROM appointments WHERE status='خالی' AND EXISTS (
+                SELECT 1 FROM appointments other
+                WHERE other.barber_id = appointments.barber_id
+                AND other.date = appointments.date
+                AND other.time = appointments.time
+                AND (other.status IS NOT 'خالی' OR other.id < appointments.id)
+            )
+            """,
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_appointments_slot ON appointments (barber_id, date, time)",
+        ],
+    ),
+    (
+        3,
+        "indexes for hot queries",
+        [
+            # نوبت‌های خالی یک آرایشگر (show_available_slots و first_available)
+            "CREATE INDEX IF NOT EXISTS idx_appointments_barber_status ON appointments (barber_id, status, date, time)",
+            # گزارش‌های ادمین بر اساس وضعیت، مرتب‌شده با تاریخ و ساعت
+            "CREATE INDEX IF NOT EXISTS idx_appointments_status_date ON appointments (status, date, time)",
+            # نوبت کاربر در /start
+            "CREATE INDEX IF NOT EXISTS idx_appointments_user ON appointments (user_id, date, time)",
+            # نوبت‌های فعال کاربر (لغو، نمایش نوبت من و پرداخت آنلاین)
+            "CREATE INDEX IF NOT EXISTS idx_user_appointments_user_status ON user_appointments (user_id, status, date, time)",
+        ],
+    ),
+    (
+        4,
+        "processed updates for deduplication",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS processed_updates (
+                update_id INTEGER PRIMARY KEY,
+                received_at REAL NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_processed_updates_received ON processed_updates (received_at)",
+        ],
+    ),
+    (
+        5,
+        "bot state key/value store",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS bot_state (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+            """,
+        ],
+    ),
+    (
+        6,
+        "user appointments archive",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS user_appointments_archive (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER,
+                barber_id INTEGER,
+                date TEXT,
+                time TEXT,
+                service TEXT,
+                name TEXT,
+                phone TEXT,
+                status TEXT,
+                payment_status TEXT,
+                tracking_code TEXT,
+                archived_at REAL
+            )
+            """,
+            # پیدا کردن نوبت‌های گذشته برای بایگانی
+            "CREATE INDEX IF NOT EXISTS idx_user_appointments_date ON user_appointments (date)",
+            "CREATE INDEX IF NOT EXISTS idx_appointments_date ON appointments (date)",
+        ],
+    ),
+    (
+        7,
+        "reminder outbox",
+        [
+            # یادآوری‌های صف‌شده؛ هر رزرو از هر نوع (مثلا 24h یا 1h) فقط یک یادآوری دارد
+            """
+            CREATE TABLE IF NOT EXISTS reminder_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                appointment_id INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                chat_id INTEGER NOT NULL,
+                due_at REAL NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                claimed_until REAL,
+                finished_at REAL,
+                UNIQUE (appointment_id, kind)
+            )
+            """,
+            # یادآوری‌های سررسید شده برای ارسال
+            "CREATE INDEX IF NOT EXISTS idx_reminder_outbox_due ON reminder_outbox (status, due_at)",
+            "CREATE INDEX IF NOT EXISTS idx_reminder_outbox_finished ON reminder_outbox (finished_at)",
+            # رزروهای فعال در یک بازه زمانی (برنامه‌ریزی یادآوری‌ها)
+            "CREATE INDEX IF NOT EXISTS idx_user_appointments_status_date ON user_appointments (status, date, time)",
+        ],
+    ),
+    (
+        8,
+        "data versions",
+        [
+            # نسخه داده‌های کش‌شده (مثلا barbers)؛ با هر تغییر یکی زیاد می‌شود
+            """
+            CREATE TABLE IF NOT EXISTS data_versions (
+                name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            )
+            """,
+        ],
+    ),
+    (
+        9,
+        "conversation sessions",
+        SESSIONS_SCHEMA,
+    ),
+    (
+        10,
+        "unfinished update claims",
+        [
+            # آپدیت‌هایی که finished_at ندارند شروع شده‌اند ولی پردازششان تمام نشده است
+            "ALTER TABLE processed_updates ADD COLUMN owner TEXT",
+            "ALTER TABLE processed_updates ADD COLUMN finished_at REAL",
+            "UPDATE processed_updates SET finished_at = received_at",
+        ],
+    ),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+# تابع برای خواندن نسخه فعلی اسکیمای پایگاه داده
+def get_schema_version(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT,
+            applied_at TEXT
+        )
+        """
+    )
+    row = conn.execute("SELECT MAX(version) FROM schema_migrations").fetchone()
+    return row[0] or 0
+
+
+# تابع برای اجرای مایگریشن‌های اجرا نشده؛ هر مایگریشن در یک تراکنش جداگانه اجرا می‌شود
+# BEGIN IMMEDIATE باعث می‌شود چند پروسس همزمان یک مایگریشن را دو بار اجرا نکنند
+# نسخه اسکیما در user_version هم نوشته می‌شود تا اجرای مجدد روی پایگاه داده به‌روز فقط یک PRAGMA بخواند
+def migrate(conn):
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= LATEST_VERSION:
+        return LATEST_VERSION
+    current = get_schema_version(conn)
+    conn.commit()
+    for version, name, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            current = conn.execute("SELECT MAX(version) FROM schema_migrations").fetchone()[0] or 0
+            if version <= current:
+                conn.commit()
+                continue
+            logger.info(f"Applying migration {version}: {name}")
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(statement)
+            conn.execute(
+                "INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+                (version, name, datetime.now(timezone.utc).isoformat()),
+            )
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.exception(f"Migration {version} failed")
+            raise
+        current = version
+    # پایگاه داده‌هایی که قبل از ثبت user_version مایگریت شده‌اند
+    if conn.execute("PRAGMA user_version").fetchone()[0] < current:
+        conn.execute(f"PRAGMA user_version = {current}")
+    return current
@@ -0,0 +1,170 @@
+import logging
+import threading
+import time
+from functools import partial
+
+from bale_client import is_retryable
+from keyboards import MY_APPOINTMENT_KEYBOARD, encode_message
+from send_queue import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+# تابع برای خواندن انواع یادآوری از رشته‌ای مثل "24h,1h" (h ساعت و m دقیقه قبل از نوبت)
+# خروجی: لیست (نوع، فاصله تا شروع نوبت به ثانیه)
+def parse_leads(spec):
+    leads = []
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        if item[-1] not in ("h", "m") or not item[:-1].isdigit() or not int(item[:-1]):
+            raise ValueError(f"مقدار نامعتبر در REMINDER_LEADS: {item}")
+        leads.append((item, int(item[:-1]) * (3600 if item[-1] == "h" else 60)))
+    return leads
+
+
+# موتور یادآوری نوبت‌ها
+# plan() رزروهای فعال پیش رو را با کوئری بازه زمانی روی ایندکس (status, date, time) پیدا می‌کند و
+# برای هر نوع یادآوری یک ردیف در جدول reminder_outbox می‌سازد (UNIQUE از ثبت تکراری جلوگیری می‌کند)
+# send_due() یادآوری‌های سررسید شده را دسته‌ای برمی‌دارد و با نرخ rate در ثانیه به صف خروجی می‌سپارد
+# (توکن فقط برای پیام‌هایی که واقعا ارسال می‌شوند برداشته می‌شود، نه یادآوری‌های لغو یا منقضی شده)؛
+# فقط وقتی صف خروجی خلوت است برداشته می‌شوند تا پاسخ به کاربران پشت یادآوری‌ها نماند
+# هر یادآوری بعد از تحویل پیام sent علامت می‌خورد و یادآوری برداشته‌شده‌ای که علامت نخورده
+# (مثلا به دلیل توقف ربات) بعد از lease ثانیه دوباره برداشته می‌شود
+# یادآوری تا وقتی ارسال می‌شود که بیش از نیمی از فاصله‌اش تا شروع نوبت باقی مانده باشد
+# observer(نوع، نتیجه) در صورت تعیین برای هر یادآوری تمام شده صدا زده می‌شود
+class ReminderService:
+    def __init__(
+        self,
+        repository,
+        calendar,
+        outbox,
+        leads,
+        rate=10,
+        batch_size=200,
+        lease=600,
+        max_attempts=3,
+        lookahead=600,
+        observer=None,
+    ):
+        self.repository = repository
+        self.calendar = calendar
+        self.outbox = outbox
+        self.leads = leads
+        self.batch_size = batch_size
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.lookahead = lookahead
+        self.observer = observer
+        self._lead_by_kind = dict(leads)
+        self._bucket = TokenBucket(rate, batch_size)
+        self._lock = threading.Lock()
+        self._settled = threading.Condition(self._lock)
+        self._in_flight = 0
+        self._results = {}
+
+    # صف کردن یادآوری رزروهایی که زمان یادآوری‌شان تا lookahead ثانیه بعد می‌رسد
+    # خروجی: تعداد یادآوری‌های اضافه شده
+    def plan(self, now=None):
+        now = time.time() if now is None else now
+        queued = 0
+        for kind, lead in self.leads:
+            start = self.calendar.slot_at(now + lead / 2)
+            end = self.calendar.slot_at(now + lead + self.lookahead)
+            while True:
+                bookings = self.repository.bookings_without_reminder(kind, start, end, self.batch_size)
+                queued += self.repository.queue_reminders(
+                    [
+                        (appointment_id, kind, user_id, self.calendar.timestamp(date, hour) - lead)
+                        for appointment_id, user_id, date, hour in bookings
+                    ]
+                )
+                if len(bookings) < self.batch_size:
+                    break
+        return queued
+
+    # ارسال یک دسته از یادآوری‌های سررسید شده؛ خروجی: تعداد پیام‌های سپرده شده به صف خروجی
+    def send_due(self, now=None):
+        now = time.time() if now is None else now
+        limit = min(self.batch_size - self.outbox.stats()["pending"], self._bucket.available())
+        if limit <= 0:
+            return 0
+        reminders = self.repository.claim_reminders(now, limit, self.lease)
+        submitted = 0
+        for reminder in reminders:
+            result = self._skip_reason(reminder, now)
+            if result is not None:
+                self.repository.finish_reminder(reminder["id"], "failed" if result == "failed" else "skipped")
+                self._record(reminder["kind"], result)
+                continue
+            self._bucket.consume()
+            with self._lock:
+                self._in_flight += 1
+            chat_id = reminder["chat_id"]
+            future = self.outbox.submit(
+                chat_id, "sendMessage", encode_message(chat_id, self.render(reminder), MY_APPOINTMENT_KEYBOARD)
+            )
+            future.add_done_callback(partial(self._on_sent, reminder))
+            submitted += 1
+        return submitted
+
+    # دلیل ارسال نکردن یادآوری (رزرو لغو یا بایگانی شده، دیر شده یا تلاش‌های زیاد) یا None
+    def _skip_reason(self, reminder, now):
+        if reminder["status"] != "رزرو":
+            return "cancelled"
+        lead = self._lead_by_kind.get(reminder["kind"], 0)
+        if now > self.calendar.timestamp(reminder["date"], reminder["time"]) - lead / 2:
+            return "expired"
+        if reminder["attempts"] > self.max_attempts:
+            return "failed"
+        return None
+
+    def render(self, reminder):
+        labels = {date: label for label, date in self.calendar.days()}
+        day = labels.get(reminder["date"], reminder["date"])
+        service_fa = "اصلاح" if reminder["service"] == "service_haircut" else "خدمات VIP"
+        return (
+            f"⏰ یادآوری نوبت\n\n🕒 {day} ({reminder['date']}) ساعت {reminder['time']}\n"
+            f"✂️ سرویس: {service_fa}\n💈 آرایشگر: {reminder['barber_name']}\n\n"
+            "در صورتی که امکان حضور ندارید لطفا نوبت خود را لغو کنید."
+        )
+
+    # ثبت نتیجه تحویل پیام (روی ترد ارسال صف خروجی اجرا می‌شود)
+    # بعد از خطای موقت (مثلا قطع بودن API) یادآوری pending می‌ماند و بعد از lease دوباره ارسال می‌شود
+    # بعد از تایم‌اوت خواندن پیام ممکن است تحویل شده باشد؛ پس دوباره ارسال نمی‌شود و failed ثبت می‌شود
+    def _on_sent(self, reminder, future):
+        try:
+            error = future.exception()
+            if error is not None and is_retryable(error):
+                logger.warning(f"Reminder {reminder['id']} not delivered: {error}, retrying after lease")
+                self._record(reminder["kind"], "retry")
+                return
+            status = "sent" if error is None and future.result().get("ok") else "failed"
+            self.repository.finish_reminder(reminder["id"], status)
+            self._record(reminder["kind"], status)
+        except Exception:
+            logger.exception(f"Error recording reminder {reminder['id']}")
+        finally:
+            with self._settled:
+                self._in_flight -= 1
+                self._settled.notify_all()
+
+    def _record(self, kind, result):
+        with self._lock:
+            self._results[(kind, result)] = self._results.get((kind, result), 0) + 1
+        if self.observer is not None:
+            self.observer(kind, result)
+
+    # انتظار تا ثبت نتیجه همه یادآوری‌های سپرده شده به صف خروجی
+    def join(self, timeout=None):
+        with self._settled:
+            return self._settled.wait_for(lambda: not self._in_flight, timeout)
+
+    # آمار یادآوری‌ها: تعداد در حال ارسال و تعداد هر نتیجه به تفکیک نوع
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "results": {f"{kind}:{result}": count for (kind, result), count in self._results.items()},
+            }
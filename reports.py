@@ -0,0 +1,124 @@
+REPORT_PAGE_SIZE = 20
+# تعداد گزینه‌های هر صفحه از کیبورد فیلتر گزارش
+FILTER_PAGE_SIZE = 10
+# حداکثر طول فیلدهای وارد شده توسط کاربر در گزارش (برای ماندن زیر محدودیت طول پیام)
+MAX_FIELD_LENGTH = 30
+
+# تعریف گزارش‌های ادمین
+REPORTS = {
+    "empty": {
+        "title": "لیست نوبت‌های خالی",
+        "status": "خالی",
+        "empty_text": "هیچ نوبت خالی وجود ندارد.",
+    },
+    "booked": {
+        "title": "لیست نوبت‌های رزرو شده",
+        "status": "رزرو",
+        "empty_text": "هیچ نوبت رزرو شده‌ای وجود ندارد.",
+    },
+}
+
+
+def _shorten(value):
+    value = str(value or "")
+    return value if len(value) <= MAX_FIELD_LENGTH else value[: MAX_FIELD_LENGTH - 1] + "…"
+
+
+# تابع برای تبدیل یک ردیف گزارش (خروجی slot_report مخزن داده) به متن
+def format_report_row(kind, row):
+    date, time, name, phone, service, payment_status, barber_name = row
+    if kind == "empty":
+        return f"{date} ساعت {time} - آرایشگر: {_shorten(barber_name)}"
+    service_fa = "اصلاح" if service == "service_haircut" else "خدمات VIP"
+    return (
+        f"{date} ساعت {time} - {_shorten(name)} ({_shorten(phone)}) - {service_fa}"
+        f" - {payment_status} - آرایشگر: {_shorten(barber_name)}"
+    )
+
+
+# تابع برای ساخت متن یک صفحه از گزارش
+# فقط ردیف‌های همان صفحه از مخزن داده خوانده می‌شوند
+# خروجی: (متن صفحه، تعداد کل صفحات)؛ اگر ردیفی نباشد متن None است
+def render_report_page(repository, kind, barber_id=None, date=None, page=0, page_size=REPORT_PAGE_SIZE):
+    report = REPORTS[kind]
+    page = max(page, 0)
+    total, rows = repository.slot_report(report["status"], barber_id, date, page_size, page * page_size)
+    if not total:
+        return None, 0
+    total_pages = (total + page_size - 1) // page_size
+    if page >= total_pages:
+        # صفحه خارج از محدوده (مثلا بعد از کم شدن ردیف‌ها) با آخرین صفحه جایگزین می‌شود
+        page = total_pages - 1
+        total, rows = repository.slot_report(report["status"], barber_id, date, page_size, page * page_size)
+    lines = [f"{report['title']} (صفحه {page + 1} از {total_pages}):"]
+    lines.extend(format_report_row(kind, row) for row in rows)
+    return "\n".join(lines), total_pages
+
+
+# callback_data صفحات گزارش: report_<kind>_<barber_id>_<date>_<page> (صفر یعنی بدون فیلتر)
+# parse_report_callback هم callback_data کامل و هم بخش بعد از report_ را می‌پذیرد
+def report_callback(kind, barber_id=None, date=None, page=0):
+    return f"report_{kind}_{barber_id or 0}_{date or 0}_{page}"
+
+
+def parse_report_callback(data):
+    kind, barber_id, date, page = data.split("_")[-4:]
+    return kind, int(barber_id) or None, None if date == "0" else date, int(page)
+
+
+# تابع برای ساخت کیبورد صفحه‌بندی و فیلترهای گزارش
+def report_keyboard(kind, barber_id, date, page, total_pages):
+    navigation = []
+    if page > 0:
+        navigation.append(
+            {"text": "⬅️ قبلی", "callback_data": report_callback(kind, barber_id, date, page - 1)}
+        )
+    if page < total_pages - 1:
+        navigation.append(
+            {"text": "بعدی ➡️", "callback_data": report_callback(kind, barber_id, date, page + 1)}
+        )
+    keyboard = [navigation] if navigation else []
+    keyboard.append(
+        [
+            {"text": "فیلتر آرایشگر", "callback_data": report_filter_callback(kind, "barber", date)},
+            {"text": "فیلتر تاریخ", "callback_data": report_filter_callback(kind, "date", barber_id)},
+        ]
+    )
+    return {"inline_keyboard": keyboard}
+
+
+# callback_data صفحات کیبورد فیلتر: reportfilter_<kind>_<field>_<other_filter>_<page>
+# other_filter فیلتر دیگر گزارش است که حفظ می‌شود (صفر یعنی بدون فیلتر)؛ parse_report_filter_callback بخش
+# بعد از reportfilter_ را می‌گیرد و callback_data قدیمی بدون شماره صفحه را هم می‌پذیرد
+def report_filter_callback(kind, field, other_filter=None, page=0):
+    return f"reportfilter_{kind}_{field}_{other_filter or 0}_{page}"
+
+
+def parse_report_filter_callback(params):
+    kind, field, other_filter, *page = params.split("_")
+    return kind, field, other_filter, int(page[0]) if page else 0
+
+
+# تابع برای ساخت یک صفحه از کیبورد انتخاب فیلتر گزارش
+# options لیست (متن، callback_data) گزینه‌هاست و clear_option (متن، callback_data) حذف فیلتر که در همه صفحات هست
+# خروجی: (کیبورد، شماره صفحه، تعداد کل صفحات)
+def report_filter_keyboard(kind, field, other_filter, options, clear_option, page=0, page_size=FILTER_PAGE_SIZE):
+    total_pages = max(1, (len(options) + page_size - 1) // page_size)
+    page = min(max(page, 0), total_pages - 1)
+    buttons = [
+        {"text": text, "callback_data": data} for text, data in options[page * page_size : (page + 1) * page_size]
+    ]
+    keyboard = [buttons[i : i + 2] for i in range(0, len(buttons), 2)]
+    navigation = []
+    if page > 0:
+        navigation.append(
+            {"text": "⬅️ قبلی", "callback_data": report_filter_callback(kind, field, other_filter, page - 1)}
+        )
+    if page < total_pages - 1:
+        navigation.append(
+            {"text": "بعدی ➡️", "callback_data": report_filter_callback(kind, field, other_filter, page + 1)}
+        )
+    if navigation:
+        keyboard.append(navigation)
+    keyboard.append([{"text": clear_option[0], "callback_data": clear_option[1]}])
+    return {"inline_keyboard": keyboard}, page, total_pages
@@ -0,0 +1,1211 @@
+import copy
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+from bot_state import claim_update, finish_update, release_updates, prune_processed_updates, get_state, set_state
+from slots import (
+    generate_schedule_slots,
+    fetch_free_slots,
+    book_slot,
+    delete_past_slots,
+    archive_user_appointments,
+    USER_APPOINTMENT_COLUMNS,
+)
+
+BARBER_COLUMNS = ("id", "name", "phone", "address", "card_number")
+BOOKING_COLUMNS = ("barber_id", "barber_name", "date", "time", "service", "payment_status")
+REMINDER_COLUMNS = ("id", "kind", "chat_id", "due_at", "attempts", "status", "barber_name", "date", "time", "service")
+
+
+# ساخت نوبت‌های خالی بر اساس برنامه کاری هر آرایشگر با تابع generate(dates, hours, barber_ids, exclude_ids)
+# (همان منطق generate_schedule_slots برای مخزن‌هایی که cursor ندارند)
+def _generate_schedule(generate, dates, schedules, barber_ids=None):
+    overrides = set(schedules.barbers)
+    created = generate(dates, schedules.default.times, barber_ids, overrides)
+    for barber_id, schedule in schedules.barbers.items():
+        if barber_ids is None or barber_id in barber_ids:
+            created += generate(dates, schedule.times, [barber_id], ())
+    return created
+
+
+# مخزن داده‌های ربات (آرایشگرها، نوبت‌ها، رزروها و وضعیت پرداخت) روی SQLite
+# همه مخزن‌ها رابط یکسانی دارند؛ transaction() تراکنشی باز می‌کند که همه فراخوانی‌های
+# همین ترد تا پایان آن بخشی از آن هستند (تراکنش‌های تو در تو به تراکنش بیرونی می‌پیوندند)
+class SQLiteRepository:
+    def __init__(self, db):
+        self.db = db
+
+    @contextmanager
+    def transaction(self):
+        with self.db.transaction():
+            yield
+
+    # همه آرایشگرها به ترتیب id (دیکشنری id، نام، تلفن، آدرس و شماره کارت)
+    def list_barbers(self):
+        cursor = self.db.cursor()
+        cursor.execute("SELECT id, name, phone, address, card_number FROM barbers ORDER BY id")
+        return [dict(zip(BARBER_COLUMNS, row)) for row in cursor.fetchall()]
+
+    # اطلاعات فعلی آرایشگرها برای مقایسه در ورود از CSV: user_id -> (نام، تلفن، آدرس، شماره کارت)
+    def barber_records(self):
+        cursor = self.db.cursor()
+        cursor.execute("SELECT name, phone, address, user_id, card_number FROM barbers")
+        return {row[3]: row[:3] + row[4:] for row in cursor.fetchall()}
+
+    # ثبت یا به‌روزرسانی دسته‌ای آرایشگرها؛ هر ردیف (نام، تلفن، آدرس، user_id، شماره کارت)
+    def upsert_barbers(self, rows):
+        self.db.cursor().executemany(
+            """
+            INSERT INTO barbers (name, phone, address, user_id, card_number)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+            name=excluded.name,
+            phone=excluded.phone,
+            address=excluded.address,
+            card_number=excluded.card_number
+            """,
+            rows,
+        )
+
+    # حذف آرایشگرها و نوبت‌های خالی آنها (نوبت‌های رزرو شده دست نمی‌خورند)
+    def remove_barbers(self, user_ids):
+        placeholders = ", ".join("?" for _ in user_ids)
+        cursor = self.db.cursor()
+        cursor.execute(
+            f"""
+            DELETE FROM appointments WHERE status='خالی'
+            AND barber_id IN (SELECT id FROM barbers WHERE user_id IN ({placeholders}))
+            """,
+            list(user_ids),
+        )
+        cursor.execute(f"DELETE FROM barbers WHERE user_id IN ({placeholders})", list(user_ids))
+
+    def barber_ids(self, user_ids):
+        placeholders = ", ".join("?" for _ in user_ids)
+        cursor = self.db.cursor()
+        cursor.execute(f"SELECT id FROM barbers WHERE user_id IN ({placeholders})", list(user_ids))
+        return [row[0] for row in cursor.fetchall()]
+
+    # نسخه اطلاعات آرایشگرها برای باطل کردن کش آنها در همه پروسس‌ها (صفر یعنی هنوز تغییری ثبت نشده)
+    def barbers_version(self):
+        cursor = self.db.cursor()
+        cursor.execute("SELECT version FROM data_versions WHERE name='barbers'")
+        row = cursor.fetchone()
+        return row[0] if row else 0
+
+    def bump_barbers_version(self):
+        self.db.cursor().execute(
+            """
+            INSERT INTO data_versions (name, version) VALUES ('barbers', 1)
+            ON CONFLICT(name) DO UPDATE SET version=data_versions.version + 1
+            """
+        )
+
+    # ساخت نوبت‌های خالی روزهای dates؛ خروجی: تعداد نوبت‌های ساخته شده
+    def generate_slots(self, dates, schedules, barber_ids=None):
+        return generate_schedule_slots(self.db.cursor(), dates, schedules, barber_ids)
+
+    def delete_past_slots(self, today):
+        return delete_past_slots(self.db.cursor(), today)
+
+    # نوبت‌های خالی یک آرایشگر: تاریخ -> مجموعه ساعت‌ها
+    def free_slots(self, barber_id, dates):
+        return fetch_free_slots(self.db.cursor(), barber_id, dates)
+
+    # رزرو اتمیک همه نوبت‌های times؛ اگر یکی از آنها خالی نباشد هیچ نوبتی رزرو نمی‌شود و False برمی‌گردد
+    def book(self, user_id, barber_id, date, times, service, name, phone):
+        return book_slot(self.db.connection(), user_id, barber_id, date, times, service, name, phone)
+
+    # اولین نوبت رزرو شده کاربر (تاریخ، ساعت) یا None
+    def first_booked_slot(self, user_id):
+        cursor = self.db.cursor()
+        cursor.execute(
+            "SELECT date, time FROM appointments WHERE user_id=? ORDER BY date, time LIMIT 1",
+            (user_id,),
+        )
+        return cursor.fetchone()
+
+    # رزروهای فعال کاربر به ترتیب زمان (دیکشنری‌هایی با کلیدهای BOOKING_COLUMNS)
+    def active_bookings(self, user_id):
+        cursor = self.db.cursor()
+        cursor.execute(
+            """
+            SELECT ua.barber_id, COALESCE(b.name, 'نامشخص'), ua.date, ua.time, ua.service, ua.payment_status
+            FROM user_appointments ua LEFT JOIN barbers b ON b.id = ua.barber_id
+            WHERE ua.user_id=? AND ua.status='رزرو'
+            ORDER BY ua.date, ua.time
+            """,
+            (user_id,),
+        )
+        return [dict(zip(BOOKING_COLUMNS, row)) for row in cursor.fetchall()]
+
+    # لغو رزرو فعال کاربر و آزاد کردن همه نوبت‌های آن
+    # block_times(barber_id, ساعت شروع، خدمت) ساعت‌های نوبت‌های پشت سر هم رزرو را برمی‌گرداند
+    def cancel_booking(self, user_id, block_times):
+        with self.db.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT barber_id, date, time, service FROM user_appointments WHERE user_id=? AND status='رزرو'",
+                (user_id,),
+            )
+            booking = cursor.fetchone()
+            if not booking:
+                return False
+            barber_id, date, start, service = booking
+            times = block_times(barber_id, start, service)
+            placeholders = ", ".join("?" for _ in times)
+            cursor.execute(
+                f"""
+                UPDATE appointments SET user_id=NULL, name=NULL, phone=NULL, service=NULL, status='خالی'
+                WHERE barber_id=? AND date=? AND user_id=? AND time IN ({placeholders})
+                """,
+                [barber_id, date, user_id, *times],
+            )
+            cursor.execute(
+                "UPDATE user_appointments SET status='لغو شده' WHERE user_id=? AND barber_id=? AND date=? AND time=?",
+                (user_id, barber_id, date, start),
+            )
+            return True
+
+    def set_payment_status(self, user_id, barber_id, date, time, payment_status):
+        cursor = self.db.cursor()
+        cursor.execute(
+            "UPDATE user_appointments SET payment_status=? WHERE user_id=? AND barber_id=? AND date=? AND time=?",
+            (payment_status, user_id, barber_id, date, time),
+        )
+        return cursor.rowcount > 0
+
+    # یک صفحه از نوبت‌های با وضعیت status (با فیلتر اختیاری آرایشگر و تاریخ)
+    # خروجی: (تعداد کل، ردیف‌های (تاریخ، ساعت، نام، تلفن، خدمت، وضعیت پرداخت، نام آرایشگر))
+    def slot_report(self, status, barber_id=None, date=None, limit=20, offset=0):
+        where = ["a.status=?"]
+        params = [status]
+        if barber_id:
+            where.append("a.barber_id=?")
+            params.append(barber_id)
+        if date:
+            where.append("a.date=?")
+            params.append(date)
+        where = " AND ".join(where)
+        cursor = self.db.cursor()
+        cursor.execute(f"SELECT COUNT(*) FROM appointments a WHERE {where}", params)
+        total = cursor.fetchone()[0]
+        if not total:
+            return 0, []
+        cursor.execute(
+            f"""
+            SELECT a.date, a.time, a.name, a.phone, a.service, a.payment_status, COALESCE(b.name, 'نامشخص')
+            FROM appointments a LEFT JOIN barbers b ON b.id = a.barber_id
+            WHERE {where}
+            ORDER BY a.date, a.time, a.id
+            LIMIT ? OFFSET ?
+            """,
+            params + [limit, offset],
+        )
+        return total, cursor.fetchall()
+
+    # انتقال رزروهای قبل از before_date به بایگانی؛ خروجی: تعداد رزروهای منتقل شده
+    def archive_bookings(self, before_date, batch_size=500):
+        return archive_user_appointments(self.db, before_date, batch_size)
+
+    # رزروهای فعال با شروع در بازه start تا end (هر دو (تاریخ، ساعت)) که یادآوری kind ندارند
+    # خروجی: حداکثر limit ردیف (id رزرو، user_id، تاریخ، ساعت) به ترتیب زمان
+    def bookings_without_reminder(self, kind, start, end, limit=500):
+        cursor = self.db.cursor()
+        cursor.execute(
+            """
+            SELECT ua.id, ua.user_id, ua.date, ua.time FROM user_appointments ua
+            WHERE ua.status='رزرو' AND (ua.date, ua.time) >= (?, ?) AND (ua.date, ua.time) <= (?, ?)
+            AND NOT EXISTS (SELECT 1 FROM reminder_outbox r WHERE r.appointment_id = ua.id AND r.kind = ?)
+            ORDER BY ua.date, ua.time LIMIT ?
+            """,
+            (*start, *end, kind, limit),
+        )
+        return cursor.fetchall()
+
+    # افزودن یادآوری‌ها به صف؛ هر ردیف (id رزرو، نوع، chat_id، زمان سررسید)
+    # یادآوری‌های تکراری نادیده گرفته می‌شوند؛ خروجی: تعداد یادآوری‌های اضافه شده
+    def queue_reminders(self, rows):
+        if not rows:
+            return 0
+        with self.db.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                "INSERT OR IGNORE INTO reminder_outbox (appointment_id, kind, chat_id, due_at) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            return cursor.rowcount
+
+    # برداشتن حداکثر limit یادآوری سررسید شده برای ارسال؛ هر یادآوری تا lease ثانیه به این فراخوان
+    # سپرده می‌شود و اگر تا آن زمان finish_reminder صدا زده نشود دوباره قابل برداشتن است
+    # خروجی: دیکشنری‌هایی با کلیدهای REMINDER_COLUMNS (status وضعیت فعلی رزرو است)
+    def claim_reminders(self, now, limit, lease):
+        with self.db.transaction() as conn:
+            rows = conn.execute(
+                """
+                SELECT r.id, r.kind, r.chat_id, r.due_at, r.attempts + 1, ua.status,
+                COALESCE(b.name, 'نامشخص'), ua.date, ua.time, ua.service
+                FROM reminder_outbox r
+                LEFT JOIN user_appointments ua ON ua.id = r.appointment_id
+                LEFT JOIN barbers b ON b.id = ua.barber_id
+                WHERE r.status='pending' AND r.due_at <= ? AND (r.claimed_until IS NULL OR r.claimed_until <= ?)
+                ORDER BY r.due_at LIMIT ?
+                """,
+                (now, now, limit),
+            ).fetchall()
+            if rows:
+                placeholders = ", ".join("?" for _ in rows)
+                conn.execute(
+                    f"UPDATE reminder_outbox SET claimed_until=?, attempts=attempts + 1 WHERE id IN ({placeholders})",
+                    [now + lease, *(row[0] for row in rows)],
+                )
+        return [dict(zip(REMINDER_COLUMNS, row)) for row in rows]
+
+    # ثبت نتیجه نهایی یادآوری (sent، skipped یا failed)
+    def finish_reminder(self, reminder_id, status):
+        cursor = self.db.cursor()
+        cursor.execute(
+            "UPDATE reminder_outbox SET status=?, finished_at=? WHERE id=?",
+            (status, time.time(), reminder_id),
+        )
+
+    # حذف یادآوری‌هایی که قبل از زمان before تمام شده‌اند
+    def prune_reminders(self, before):
+        cursor = self.db.cursor()
+        cursor.execute("DELETE FROM reminder_outbox WHERE finished_at < ?", (before,))
+        return cursor.rowcount
+
+    # شروع پردازش آپدیت توسط owner (شناسه نمونه ربات)؛ اگر پردازش آن تمام شده یا نمونه دیگری کمتر از
+    # lease ثانیه پیش آن را شروع کرده باشد False برمی‌گرداند (توضیحات در bot_state.claim_update)
+    def claim_update(self, update_id, owner, lease):
+        return claim_update(self.db.connection(), update_id, owner, lease)
+
+    def finish_update(self, update_id):
+        finish_update(self.db.connection(), update_id)
+
+    # آزاد کردن آپدیت‌هایی که پردازششان شروع شده ولی تمام نشده (همه، آپدیت‌های owner یا update_ids)
+    def release_updates(self, owner=None, update_ids=None):
+        return release_updates(self.db.connection(), owner, update_ids)
+
+    def prune_processed_updates(self, max_age):
+        return prune_processed_updates(self.db.connection(), max_age)
+
+    # وضعیت ربات (مثلا آخرین آپدیت دریافت شده)؛ مقدارها رشته ذخیره می‌شوند
+    def get_state(self, key, default=None):
+        return get_state(self.db.connection(), key, default)
+
+    def set_state(self, key, value):
+        set_state(self.db.connection(), key, value)
+
+    # وضعیت گفتگوی یک چت (متن JSON) اگر تا زمان now منقضی نشده باشد، وگرنه None
+    def load_session(self, chat_id, now):
+        cursor = self.db.cursor()
+        cursor.execute("SELECT data FROM sessions WHERE chat_id=? AND expires_at > ?", (chat_id, now))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def store_session(self, chat_id, data, expires_at):
+        self.db.cursor().execute(
+            "INSERT OR REPLACE INTO sessions (chat_id, data, expires_at) VALUES (?, ?, ?)",
+            (chat_id, data, expires_at),
+        )
+
+    def delete_session(self, chat_id):
+        self.db.cursor().execute("DELETE FROM sessions WHERE chat_id=?", (chat_id,))
+
+    # حذف جلسه‌هایی که تا زمان now منقضی شده‌اند
+    def purge_sessions(self, now):
+        cursor = self.db.cursor()
+        cursor.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+        return cursor.rowcount
+
+
+# اسکیمای پایگاه داده سرور (PostgreSQL)؛ همان جدول‌ها و ایندکس‌های مایگریشن‌های SQLite
+POSTGRES_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS barbers (
+        id SERIAL PRIMARY KEY,
+        name TEXT,
+        phone TEXT,
+        address TEXT,
+        user_id BIGINT UNIQUE,
+        card_number TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS appointments (
+        id BIGSERIAL PRIMARY KEY,
+        user_id BIGINT,
+        barber_id INTEGER,
+        date TEXT,
+        time TEXT,
+        service TEXT,
+        name TEXT,
+        phone TEXT,
+        status TEXT DEFAULT 'خالی',
+        payment_status TEXT DEFAULT 'پرداخت نشده',
+        tracking_code TEXT,
+        UNIQUE (barber_id, date, time)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS user_appointments (
+        id BIGSERIAL PRIMARY KEY,
+        user_id BIGINT,
+        barber_id INTEGER,
+        date TEXT,
+        time TEXT,
+        service TEXT,
+        name TEXT,
+        phone TEXT,
+        status TEXT DEFAULT 'رزرو',
+        payment_status TEXT DEFAULT 'پرداخت نشده',
+        tracking_code TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS user_appointments_archive (
+        id BIGINT PRIMARY KEY,
+        user_id BIGINT,
+        barber_id INTEGER,
+        date TEXT,
+        time TEXT,
+        service TEXT,
+        name TEXT,
+        phone TEXT,
+        status TEXT,
+        payment_status TEXT,
+        tracking_code TEXT,
+        archived_at DOUBLE PRECISION
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_appointments_barber_status ON appointments (barber_id, status, date, time)",
+    "CREATE INDEX IF NOT EXISTS idx_appointments_status_date ON appointments (status, date, time)",
+    "CREATE INDEX IF NOT EXISTS idx_appointments_user ON appointments (user_id, date, time)",
+    "CREATE INDEX IF NOT EXISTS idx_appointments_date ON appointments (date)",
+    "CREATE INDEX IF NOT EXISTS idx_user_appointments_user_status ON user_appointments (user_id, status, date, time)",
+    "CREATE INDEX IF NOT EXISTS idx_user_appointments_date ON user_appointments (date)",
+    """
+    CREATE TABLE IF NOT EXISTS reminder_outbox (
+        id BIGSERIAL PRIMARY KEY,
+        appointment_id BIGINT NOT NULL,
+        kind TEXT NOT NULL,
+        chat_id BIGINT NOT NULL,
+        due_at DOUBLE PRECISION NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        claimed_until DOUBLE PRECISION,
+        finished_at DOUBLE PRECISION,
+        UNIQUE (appointment_id, kind)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_reminder_outbox_due ON reminder_outbox (status, due_at)",
+    "CREATE INDEX IF NOT EXISTS idx_reminder_outbox_finished ON reminder_outbox (finished_at)",
+    "CREATE INDEX IF NOT EXISTS idx_user_appointments_status_date ON user_appointments (status, date, time)",
+    """
+    CREATE TABLE IF NOT EXISTS data_versions (
+        name TEXT PRIMARY KEY,
+        version BIGINT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS processed_updates (
+        update_id BIGINT PRIMARY KEY,
+        received_at DOUBLE PRECISION NOT NULL,
+        owner TEXT,
+        finished_at DOUBLE PRECISION
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_processed_updates_received ON processed_updates (received_at)",
+    """
+    CREATE TABLE IF NOT EXISTS bot_state (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS sessions (
+        chat_id BIGINT PRIMARY KEY,
+        data TEXT NOT NULL,
+        expires_at DOUBLE PRECISION NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)",
+]
+
+# رزرو ناموفق؛ برای برگرداندن تراکنش رزرو در PostgreSQL
+class _BookingConflict(Exception):
+    pass
+
+
+# مخزن روی پایگاه داده سرور (PostgreSQL) برای اجرای چند نمونه ربات روی چند سرور با داده مشترک
+# اتصال‌ها از یک ConnectionPool گرفته می‌شوند و همه کوئری‌ها با prepare=True به صورت
+# prepared statement اجرا می‌شوند؛ لیست‌ها با ANY(%s) ارسال می‌شوند تا متن هر کوئری ثابت بماند
+# به بسته‌های اختیاری psycopg و psycopg_pool نیاز دارد (pip install -r requirements-postgres.txt)
+class PostgresRepository:
+    def __init__(self, dsn, min_size=1, max_size=10):
+        try:
+            from psycopg_pool import ConnectionPool
+        except ImportError as e:
+            raise RuntimeError(
+                'برای STORAGE_BACKEND=postgres بسته‌های psycopg و psycopg_pool لازم است: pip install -r requirements-postgres.txt'
+            ) from e
+        self.pool = ConnectionPool(dsn, min_size=min_size, max_size=max_size, open=True)
+        self._local = threading.local()
+        with self.transaction():
+            for statement in POSTGRES_SCHEMA:
+                self._execute(statement, prepare=False)
+
+    # اتصال تراکنش فعلی این ترد یا یک اتصال از pool (در پایان commit و به pool برگردانده می‌شود)
+    @contextmanager
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            yield conn
+            return
+        with self.pool.connection() as conn:
+            yield conn
+
+    # تراکنش بیرونی با conn.transaction() باز می‌شود تا conn.transaction() های داخلی (مثلا در book) savepoint باشند
+    @contextmanager
+    def transaction(self):
+        if getattr(self._local, "conn", None) is not None:
+            yield
+            return
+        with self.pool.connection() as conn, conn.transaction():
+            self._local.conn = conn
+            try:
+                yield
+            finally:
+                self._local.conn = None
+
+    def _execute(self, sql, params=None, prepare=True):
+        with self._connection() as conn:
+            return conn.execute(sql, params, prepare=prepare).rowcount
+
+    def _fetchall(self, sql, params=None):
+        with self._connection() as conn:
+            return conn.execute(sql, params, prepare=True).fetchall()
+
+    def close(self):
+        self.pool.close()
+
+    def list_barbers(self):
+        rows = self._fetchall("SELECT id, name, phone, address, card_number FROM barbers ORDER BY id")
+        return [dict(zip(BARBER_COLUMNS, row)) for row in rows]
+
+    def barber_records(self):
+        rows = self._fetchall("SELECT name, phone, address, user_id, card_number FROM barbers")
+        return {row[3]: tuple(row[:3]) + tuple(row[4:]) for row in rows}
+
+    def upsert_barbers(self, rows):
+        with self._connection() as conn:
+            conn.cursor().executemany(
+                """
+                INSERT INTO barbers (name, phone, address, user_id, card_number)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (user_id) DO UPDATE SET
+                name=excluded.name,
+                phone=excluded.phone,
+                address=excluded.address,
+                card_number=excluded.card_number
+                """,
+                rows,
+            )
+
+    def remove_barbers(self, user_ids):
+        user_ids = list(user_ids)
+        with self.transaction():
+            self._execute(
+                """
+                DELETE FROM appointments WHERE status='خالی'
+                AND barber_id IN (SELECT id FROM barbers WHERE user_id = ANY(%s))
+                """,
+                (user_ids,),
+            )
+            self._execute("DELETE FROM barbers WHERE user_id = ANY(%s)", (user_ids,))
+
+    def barber_ids(self, user_ids):
+        rows = self._fetchall("SELECT id FROM barbers WHERE user_id = ANY(%s) ORDER BY id", (list(user_ids),))
+        return [row[0] for row in rows]
+
+    def barbers_version(self):
+        rows = self._fetchall("SELECT version FROM data_versions WHERE name='barbers'")
+        return rows[0][0] if rows else 0
+
+    def bump_barbers_version(self):
+        self._execute(
+            """
+            INSERT INTO data_versions (name, version) VALUES ('barbers', 1)
+            ON CONFLICT (name) DO UPDATE SET version=data_versions.version + 1
+            """
+        )
+
+    def _generate(self, dates, hours, barber_ids, exclude_ids):
+        if barber_ids is not None and not barber_ids:
+            return 0
+        return self._execute(
+            """
+            INSERT INTO appointments (date, time, status, barber_id)
+            SELECT d, h, 'خالی', b.id
+            FROM barbers b CROSS JOIN unnest(%s::text[]) d CROSS JOIN unnest(%s::text[]) h
+            WHERE (%s::int[] IS NULL OR b.id = ANY(%s::int[])) AND NOT (b.id = ANY(%s::int[]))
+            ON CONFLICT (barber_id, date, time) DO NOTHING
+            """,
+            (
+                list(dates),
+                list(hours),
+                None if barber_ids is None else list(barber_ids),
+                None if barber_ids is None else list(barber_ids),
+                list(exclude_ids),
+            ),
+        )
+
+    def generate_slots(self, dates, schedules, barber_ids=None):
+        with self.transaction():
+            return _generate_schedule(self._generate, dates, schedules, barber_ids)
+
+    def delete_past_slots(self, today):
+        return self._execute("DELETE FROM appointments WHERE date < %s", (today,))
+
+    def free_slots(self, barber_id, dates):
+        rows = self._fetchall(
+            "SELECT date, time FROM appointments WHERE barber_id=%s AND status='خالی' AND date = ANY(%s)",
+            (barber_id, list(dates)),
+        )
+        free = {date: set() for date in dates}
+        for date, hour in rows:
+            free[date].add(hour)
+        return free
+
+    # رزرو در یک savepoint انجام می‌شود؛ رزرو ناموفق فقط تغییرات خودش را برمی‌گرداند
+    def book(self, user_id, barber_id, date, times, service, name, phone):
+        try:
+            with self.transaction(), self._connection() as conn, conn.transaction():
+                updated = self._execute(
+                    """
+                    UPDATE appointments
+                    SET user_id=%s, name=%s, phone=%s, service=%s, status='رزرو'
+                    WHERE barber_id=%s AND date=%s AND time = ANY(%s) AND status='خالی'
+                    """,
+                    (user_id, name, phone, service, barber_id, date, list(times)),
+                )
+                if updated != len(times):
+                    raise _BookingConflict()
+                self._execute(
+                    """
+                    INSERT INTO user_appointments (user_id, barber_id, date, time, service, name, phone, status, payment_status)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, 'رزرو', 'پرداخت نشده')
+                    """,
+                    (user_id, barber_id, date, times[0], service, name, phone),
+                )
+        except _BookingConflict:
+            return False
+        return True
+
+    def first_booked_slot(self, user_id):
+        rows = self._fetchall(
+            "SELECT date, time FROM appointments WHERE user_id=%s ORDER BY date, time LIMIT 1",
+            (user_id,),
+        )
+        return tuple(rows[0]) if rows else None
+
+    def active_bookings(self, user_id):
+        rows = self._fetchall(
+            """
+            SELECT ua.barber_id, COALESCE(b.name, 'نامشخص'), ua.date, ua.time, ua.service, ua.payment_status
+            FROM user_appointments ua LEFT JOIN barbers b ON b.id = ua.barber_id
+            WHERE ua.user_id=%s AND ua.status='رزرو'
+            ORDER BY ua.date, ua.time
+            """,
+            (user_id,),
+        )
+        return [dict(zip(BOOKING_COLUMNS, row)) for row in rows]
+
+    def cancel_booking(self, user_id, block_times):
+        with self.transaction():
+            rows = self._fetchall(
+                """
+                SELECT barber_id, date, time, service FROM user_appointments
+                WHERE user_id=%s AND status='رزرو' LIMIT 1 FOR UPDATE
+                """,
+                (user_id,),
+            )
+            if not rows:
+                return False
+            barber_id, date, start, service = rows[0]
+            self._execute(
+                """
+                UPDATE appointments SET user_id=NULL, name=NULL, phone=NULL, service=NULL, status='خالی'
+                WHERE barber_id=%s AND date=%s AND user_id=%s AND time = ANY(%s)
+                """,
+                (barber_id, date, user_id, list(block_times(barber_id, start, service))),
+            )
+            self._execute(
+                "UPDATE user_appointments SET status='لغو شده' WHERE user_id=%s AND barber_id=%s AND date=%s AND time=%s",
+                (user_id, barber_id, date, start),
+            )
+            return True
+
+    def set_payment_status(self, user_id, barber_id, date, time, payment_status):
+        return (
+            self._execute(
+                "UPDATE user_appointments SET payment_status=%s WHERE user_id=%s AND barber_id=%s AND date=%s AND time=%s",
+                (payment_status, user_id, barber_id, date, time),
+            )
+            > 0
+        )
+
+    def slot_report(self, status, barber_id=None, date=None, limit=20, offset=0):
+        # فیلترهای خالی با شرط IS NULL خنثی می‌شوند تا متن کوئری (و prepared statement) ثابت بماند
+        where = "a.status=%s AND (%s::int IS NULL OR a.barber_id=%s) AND (%s::text IS NULL OR a.date=%s)"
+        barber_id = barber_id or None
+        date = date or None
+        params = (status, barber_id, barber_id, date, date)
+        total = self._fetchall(f"SELECT COUNT(*) FROM appointments a WHERE {where}", params)[0][0]
+        if not total:
+            return 0, []
+        rows = self._fetchall(
+            f"""
+            SELECT a.date, a.time, a.name, a.phone, a.service, a.payment_status, COALESCE(b.name, 'نامشخص')
+            FROM appointments a LEFT JOIN barbers b ON b.id = a.barber_id
+            WHERE {where}
+            ORDER BY a.date, a.time, a.id
+            LIMIT %s OFFSET %s
+            """,
+            params + (limit, offset),
+        )
+        return total, [tuple(row) for row in rows]
+
+    def archive_bookings(self, before_date, batch_size=500):
+        archived = 0
+        while True:
+            moved = self._execute(
+                f"""
+                WITH moved AS (
+                    DELETE FROM user_appointments WHERE id IN (
+                        SELECT id FROM user_appointments WHERE date < %s LIMIT %s
+                    )
+                    RETURNING {USER_APPOINTMENT_COLUMNS}
+                )
+                INSERT INTO user_appointments_archive ({USER_APPOINTMENT_COLUMNS}, archived_at)
+                SELECT {USER_APPOINTMENT_COLUMNS}, %s FROM moved
+                ON CONFLICT (id) DO NOTHING
+                """,
+                (before_date, batch_size, time.time()),
+            )
+            if not moved:
+                return archived
+            archived += moved
+
+    def bookings_without_reminder(self, kind, start, end, limit=500):
+        rows = self._fetchall(
+            """
+            SELECT ua.id, ua.user_id, ua.date, ua.time FROM user_appointments ua
+            WHERE ua.status='رزرو' AND (ua.date, ua.time) >= (%s, %s) AND (ua.date, ua.time) <= (%s, %s)
+            AND NOT EXISTS (SELECT 1 FROM reminder_outbox r WHERE r.appointment_id = ua.id AND r.kind = %s)
+            ORDER BY ua.date, ua.time LIMIT %s
+            """,
+            (*start, *end, kind, limit),
+        )
+        return [tuple(row) for row in rows]
+
+    def queue_reminders(self, rows):
+        if not rows:
+            return 0
+        appointment_ids, kinds, chat_ids, due_ats = (list(column) for column in zip(*rows))
+        return self._execute(
+            """
+            INSERT INTO reminder_outbox (appointment_id, kind, chat_id, due_at)
+            SELECT * FROM unnest(%s::bigint[], %s::text[], %s::bigint[], %s::float8[])
+            ON CONFLICT (appointment_id, kind) DO NOTHING
+            """,
+            (appointment_ids, kinds, chat_ids, due_ats),
+        )
+
+    # SKIP LOCKED باعث می‌شود چند نمونه ربات همزمان یادآوری‌های متفاوتی بردارند
+    def claim_reminders(self, now, limit, lease):
+        rows = self._fetchall(
+            """
+            WITH claimed AS (
+                UPDATE reminder_outbox SET claimed_until=%s, attempts=attempts + 1
+                WHERE id IN (
+                    SELECT id FROM reminder_outbox
+                    WHERE status='pending' AND due_at <= %s AND (claimed_until IS NULL OR claimed_until <= %s)
+                    ORDER BY due_at LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, appointment_id, kind, chat_id, due_at, attempts
+            )
+            SELECT c.id, c.kind, c.chat_id, c.due_at, c.attempts, ua.status,
+            COALESCE(b.name, 'نامشخص'), ua.date, ua.time, ua.service
+            FROM claimed c
+            LEFT JOIN user_appointments ua ON ua.id = c.appointment_id
+            LEFT JOIN barbers b ON b.id = ua.barber_id
+            ORDER BY c.due_at
+            """,
+            (now + lease, now, now, limit),
+        )
+        return [dict(zip(REMINDER_COLUMNS, row)) for row in rows]
+
+    def finish_reminder(self, reminder_id, status):
+        self._execute(
+            "UPDATE reminder_outbox SET status=%s, finished_at=%s WHERE id=%s",
+            (status, time.time(), reminder_id),
+        )
+
+    def prune_reminders(self, before):
+        return self._execute("DELETE FROM reminder_outbox WHERE finished_at < %s", (before,))
+
+    def claim_update(self, update_id, owner, lease):
+        now = time.time()
+        return self._execute(
+            """
+            INSERT INTO processed_updates (update_id, received_at, owner) VALUES (%s, %s, %s)
+            ON CONFLICT (update_id) DO UPDATE SET received_at=excluded.received_at, owner=excluded.owner
+            WHERE processed_updates.finished_at IS NULL AND processed_updates.received_at < %s
+            """,
+            (update_id, now, owner, now - lease),
+        ) == 1
+
+    def finish_update(self, update_id):
+        self._execute("UPDATE processed_updates SET finished_at=%s WHERE update_id=%s", (time.time(), update_id))
+
+    def release_updates(self, owner=None, update_ids=None):
+        return self._execute(
+            """
+            DELETE FROM processed_updates WHERE finished_at IS NULL
+            AND (%s::text IS NULL OR owner = %s) AND (%s::bigint[] IS NULL OR update_id = ANY(%s))
+            """,
+            (owner, owner, update_ids, update_ids),
+        )
+
+    def prune_processed_updates(self, max_age):
+        return self._execute("DELETE FROM processed_updates WHERE received_at < %s", (time.time() - max_age,))
+
+    def get_state(self, key, default=None):
+        rows = self._fetchall("SELECT value FROM bot_state WHERE key=%s", (key,))
+        return rows[0][0] if rows else default
+
+    def set_state(self, key, value):
+        self._execute(
+            "INSERT INTO bot_state (key, value) VALUES (%s, %s) ON CONFLICT (key) DO UPDATE SET value=excluded.value",
+            (key, str(value)),
+        )
+
+    def load_session(self, chat_id, now):
+        rows = self._fetchall("SELECT data FROM sessions WHERE chat_id=%s AND expires_at > %s", (chat_id, now))
+        return rows[0][0] if rows else None
+
+    def store_session(self, chat_id, data, expires_at):
+        self._execute(
+            """
+            INSERT INTO sessions (chat_id, data, expires_at) VALUES (%s, %s, %s)
+            ON CONFLICT (chat_id) DO UPDATE SET data=excluded.data, expires_at=excluded.expires_at
+            """,
+            (chat_id, data, expires_at),
+        )
+
+    def delete_session(self, chat_id):
+        self._execute("DELETE FROM sessions WHERE chat_id=%s", (chat_id,))
+
+    def purge_sessions(self, now):
+        return self._execute("DELETE FROM sessions WHERE expires_at <= %s", (now,))
+
+
+# مخزن درون‌حافظه‌ای با همان رفتار مخزن‌های پایگاه داده؛ جایگزین پایگاه داده سرور در تست‌ها و اجرای محلی
+# همه عملیات با یک قفل سراسری انجام می‌شوند؛ تراکنش قفل را تا پایان نگه می‌دارد و در صورت خطا
+# وضعیت قبلی را برمی‌گرداند
+class MemoryRepository:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._ids = {"barbers": itertools.count(1), "bookings": itertools.count(1), "reminders": itertools.count(1)}
+        self._barbers = {}  # id -> دیکشنری آرایشگر (با user_id)
+        self._slots = {}  # (barber_id, date, time) -> دیکشنری نوبت
+        self._bookings = {}  # id -> دیکشنری رزرو
+        self._archive = {}
+        self._reminders = {}  # id -> دیکشنری یادآوری
+        self._barbers_version = 0
+        # آپدیت‌ها، وضعیت ربات و جلسه‌ها جزو داده‌هایی نیستند که تراکنش برمی‌گرداند
+        self._updates = {}  # update_id -> [received_at، owner، finished_at]
+        self._state = {}
+        self._sessions = {}  # chat_id -> (data، expires_at)
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            state = copy.deepcopy(
+                (self._barbers, self._slots, self._bookings, self._archive, self._reminders, self._barbers_version)
+            )
+            try:
+                yield
+            except BaseException:
+                (
+                    self._barbers,
+                    self._slots,
+                    self._bookings,
+                    self._archive,
+                    self._reminders,
+                    self._barbers_version,
+                ) = state
+                raise
+
+    def list_barbers(self):
+        with self._lock:
+            return [
+                {column: barber[column] for column in BARBER_COLUMNS}
+                for _, barber in sorted(self._barbers.items())
+            ]
+
+    def barber_records(self):
+        with self._lock:
+            return {
+                barber["user_id"]: (barber["name"], barber["phone"], barber["address"], barber["card_number"])
+                for barber in self._barbers.values()
+            }
+
+    def upsert_barbers(self, rows):
+        with self._lock:
+            by_user = {barber["user_id"]: barber for barber in self._barbers.values()}
+            for name, phone, address, user_id, card_number in rows:
+                barber = by_user.get(user_id)
+                if barber is None:
+                    barber_id = next(self._ids["barbers"])
+                    barber = self._barbers[barber_id] = by_user[user_id] = {"id": barber_id, "user_id": user_id}
+                barber.update(name=name, phone=phone, address=address, card_number=card_number)
+
+    def remove_barbers(self, user_ids):
+        with self._lock:
+            removed = set(self.barber_ids(user_ids))
+            for key, slot in list(self._slots.items()):
+                if key[0] in removed and slot["status"] == "خالی":
+                    del self._slots[key]
+            for barber_id in removed:
+                del self._barbers[barber_id]
+
+    def barber_ids(self, user_ids):
+        user_ids = set(user_ids)
+        with self._lock:
+            return sorted(barber_id for barber_id, barber in self._barbers.items() if barber["user_id"] in user_ids)
+
+    def barbers_version(self):
+        with self._lock:
+            return self._barbers_version
+
+    def bump_barbers_version(self):
+        with self._lock:
+            self._barbers_version += 1
+
+    def _generate(self, dates, hours, barber_ids, exclude_ids):
+        created = 0
+        for barber_id in self._barbers:
+            if barber_ids is not None and barber_id not in barber_ids or barber_id in exclude_ids:
+                continue
+            for date in dates:
+                for hour in hours:
+                    key = (barber_id, date, hour)
+                    if key not in self._slots:
+                        self._slots[key] = {
+                            "status": "خالی",
+                            "user_id": None,
+                            "name": None,
+                            "phone": None,
+                            "service": None,
+                            "payment_status": "پرداخت نشده",
+                        }
+                        created += 1
+        return created
+
+    def generate_slots(self, dates, schedules, barber_ids=None):
+        with self._lock:
+            return _generate_schedule(self._generate, dates, schedules, barber_ids)
+
+    def delete_past_slots(self, today):
+        with self._lock:
+            past = [key for key in self._slots if key[1] < today]
+            for key in past:
+                del self._slots[key]
+            return len(past)
+
+    def free_slots(self, barber_id, dates):
+        free = {date: set() for date in dates}
+        with self._lock:
+            for (slot_barber_id, date, hour), slot in self._slots.items():
+                if slot_barber_id == barber_id and date in free and slot["status"] == "خالی":
+                    free[date].add(hour)
+        return free
+
+    def book(self, user_id, barber_id, date, times, service, name, phone):
+        with self._lock:
+            slots = [self._slots.get((barber_id, date, hour)) for hour in times]
+            if not all(slot is not None and slot["status"] == "خالی" for slot in slots):
+                return False
+            for slot in slots:
+                slot.update(status="رزرو", user_id=user_id, name=name, phone=phone, service=service)
+            booking_id = next(self._ids["bookings"])
+            self._bookings[booking_id] = {
+                "id": booking_id,
+                "user_id": user_id,
+                "barber_id": barber_id,
+                "date": date,
+                "time": times[0],
+                "service": service,
+                "name": name,
+                "phone": phone,
+                "status": "رزرو",
+                "payment_status": "پرداخت نشده",
+                "tracking_code": None,
+            }
+            return True
+
+    def first_booked_slot(self, user_id):
+        with self._lock:
+            booked = sorted((date, hour) for (_, date, hour), slot in self._slots.items() if slot["user_id"] == user_id)
+        return booked[0] if booked else None
+
+    def _active(self, user_id):
+        return sorted(
+            (
+                booking
+                for booking in self._bookings.values()
+                if booking["user_id"] == user_id and booking["status"] == "رزرو"
+            ),
+            key=lambda booking: (booking["date"], booking["time"]),
+        )
+
+    def active_bookings(self, user_id):
+        with self._lock:
+            return [
+                {
+                    "barber_id": booking["barber_id"],
+                    "barber_name": self._barbers.get(booking["barber_id"], {}).get("name", "نامشخص"),
+                    "date": booking["date"],
+                    "time": booking["time"],
+                    "service": booking["service"],
+                    "payment_status": booking["payment_status"],
+                }
+                for booking in self._active(user_id)
+            ]
+
+    def cancel_booking(self, user_id, block_times):
+        with self._lock:
+            active = self._active(user_id)
+            if not active:
+                return False
+            booking = active[0]
+            barber_id, date = booking["barber_id"], booking["date"]
+            for hour in block_times(barber_id, booking["time"], booking["service"]):
+                slot = self._slots.get((barber_id, date, hour))
+                if slot is not None and slot["user_id"] == user_id:
+                    slot.update(status="خالی", user_id=None, name=None, phone=None, service=None)
+            booking["status"] = "لغو شده"
+            return True
+
+    def set_payment_status(self, user_id, barber_id, date, time, payment_status):
+        updated = False
+        with self._lock:
+            for booking in self._bookings.values():
+                if (booking["user_id"], booking["barber_id"], booking["date"], booking["time"]) == (
+                    user_id,
+                    barber_id,
+                    date,
+                    time,
+                ):
+                    booking["payment_status"] = payment_status
+                    updated = True
+        return updated
+
+    def slot_report(self, status, barber_id=None, date=None, limit=20, offset=0):
+        with self._lock:
+            rows = sorted(
+                (
+                    slot_date,
+                    hour,
+                    slot["name"],
+                    slot["phone"],
+                    slot["service"],
+                    slot["payment_status"],
+                    self._barbers.get(slot_barber_id, {}).get("name", "نامشخص"),
+                )
+                for (slot_barber_id, slot_date, hour), slot in self._slots.items()
+                if slot["status"] == status
+                and (not barber_id or slot_barber_id == barber_id)
+                and (not date or slot_date == date)
+            )
+        return len(rows), rows[offset : offset + limit]
+
+    def archive_bookings(self, before_date, batch_size=500):
+        with self._lock:
+            past = [booking_id for booking_id, booking in self._bookings.items() if booking["date"] < before_date]
+            for booking_id in past:
+                self._archive[booking_id] = dict(self._bookings.pop(booking_id), archived_at=time.time())
+            return len(past)
+
+    def bookings_without_reminder(self, kind, start, end, limit=500):
+        with self._lock:
+            reminded = {
+                reminder["appointment_id"] for reminder in self._reminders.values() if reminder["kind"] == kind
+            }
+            rows = sorted(
+                (
+                    (booking["id"], booking["user_id"], booking["date"], booking["time"])
+                    for booking in self._bookings.values()
+                    if booking["status"] == "رزرو"
+                    and start <= (booking["date"], booking["time"]) <= end
+                    and booking["id"] not in reminded
+                ),
+                key=lambda row: (row[2], row[3]),
+            )
+        return rows[:limit]
+
+    def queue_reminders(self, rows):
+        queued = 0
+        with self._lock:
+            existing = {(reminder["appointment_id"], reminder["kind"]) for reminder in self._reminders.values()}
+            for appointment_id, kind, chat_id, due_at in rows:
+                if (appointment_id, kind) in existing:
+                    continue
+                existing.add((appointment_id, kind))
+                reminder_id = next(self._ids["reminders"])
+                self._reminders[reminder_id] = {
+                    "id": reminder_id,
+                    "appointment_id": appointment_id,
+                    "kind": kind,
+                    "chat_id": chat_id,
+                    "due_at": due_at,
+                    "status": "pending",
+                    "attempts": 0,
+                    "claimed_until": None,
+                    "finished_at": None,
+                }
+                queued += 1
+        return queued
+
+    def claim_reminders(self, now, limit, lease):
+        with self._lock:
+            due = sorted(
+                (
+                    reminder
+                    for reminder in self._reminders.values()
+                    if reminder["status"] == "pending"
+                    and reminder["due_at"] <= now
+                    and (reminder["claimed_until"] is None or reminder["claimed_until"] <= now)
+                ),
+                key=lambda reminder: reminder["due_at"],
+            )[:limit]
+            claimed = []
+            for reminder in due:
+                reminder["claimed_until"] = now + lease
+                reminder["attempts"] += 1
+                booking = self._bookings.get(reminder["appointment_id"], {})
+                claimed.append(
+                    {
+                        "id": reminder["id"],
+                        "kind": reminder["kind"],
+                        "chat_id": reminder["chat_id"],
+                        "due_at": reminder["due_at"],
+                        "attempts": reminder["attempts"],
+                        "status": booking.get("status"),
+                        "barber_name": self._barbers.get(booking.get("barber_id"), {}).get("name", "نامشخص"),
+                        "date": booking.get("date"),
+                        "time": booking.get("time"),
+                        "service": booking.get("service"),
+                    }
+                )
+        return claimed
+
+    def finish_reminder(self, reminder_id, status):
+        with self._lock:
+            reminder = self._reminders.get(reminder_id)
+            if reminder is not None:
+                reminder.update(status=status, finished_at=time.time())
+
+    def prune_reminders(self, before):
+        with self._lock:
+            finished = [
+                reminder_id
+                for reminder_id, reminder in self._reminders.items()
+                if reminder["finished_at"] is not None and reminder["finished_at"] < before
+            ]
+            for reminder_id in finished:
+                del self._reminders[reminder_id]
+            return len(finished)
+
+    def claim_update(self, update_id, owner, lease):
+        now = time.time()
+        with self._lock:
+            claim = self._updates.get(update_id)
+            if claim is not None and (claim[2] is not None or claim[0] >= now - lease):
+                return False
+            self._updates[update_id] = [now, owner, None]
+            return True
+
+    def finish_update(self, update_id):
+        with self._lock:
+            claim = self._updates.get(update_id)
+            if claim is not None:
+                claim[2] = time.time()
+
+    def release_updates(self, owner=None, update_ids=None):
+        with self._lock:
+            released = [
+                update_id
+                for update_id, (_, claim_owner, finished_at) in self._updates.items()
+                if finished_at is None
+                and (owner is None or claim_owner == owner)
+                and (update_ids is None or update_id in update_ids)
+            ]
+            for update_id in released:
+                del self._updates[update_id]
+            return len(released)
+
+    def prune_processed_updates(self, max_age):
+        before = time.time() - max_age
+        with self._lock:
+            old = [update_id for update_id, claim in self._updates.items() if claim[0] < before]
+            for update_id in old:
+                del self._updates[update_id]
+            return len(old)
+
+    def get_state(self, key, default=None):
+        with self._lock:
+            return self._state.get(key, default)
+
+    def set_state(self, key, value):
+        with self._lock:
+            self._state[key] = str(value)
+
+    def load_session(self, chat_id, now):
+        with self._lock:
+            data, expires_at = self._sessions.get(chat_id, (None, 0))
+        return data if expires_at > now else None
+
+    def store_session(self, chat_id, data, expires_at):
+        with self._lock:
+            self._sessions[chat_id] = (data, expires_at)
+
+    def delete_session(self, chat_id):
+        with self._lock:
+            self._sessions.pop(chat_id, None)
+
+    def purge_sessions(self, now):
+        with self._lock:
+            expired = [chat_id for chat_id, (_, expires_at) in self._sessions.items() if expires_at <= now]
+            for chat_id in expired:
+                del self._sessions[chat_id]
+            return len(expired)
+
+
+# ساخت مخزن داده بر اساس تنظیمات (sqlite، postgres یا memory)
+def create_repository(backend, db=None, dsn=None, pool_size=10):
+    if backend == "sqlite":
+        return SQLiteRepository(db)
+    if backend == "postgres":
+        if not dsn:
+            raise ValueError("متغیر محیطی DATABASE_URL برای STORAGE_BACKEND=postgres تعریف نشده است.")
+        return PostgresRepository(dsn, max_size=pool_size)
+    if backend == "memory":
+        return MemoryRepository()
+    raise ValueError(f"نوع مخزن داده نامعتبر است: {backend}")
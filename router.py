@@ -0,0 +1,110 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# مسیریاب جدولی هندلرها
+# مسیرهای دقیق با یک جستجوی دیکشنری پیدا می‌شوند؛ برای مسیرهای پیشوندی (مثل select_barber_<id>)
+# فقط پیشوندهای ممکن خود کلید (تا هر "_") جستجو می‌شوند، پس زمان پیدا کردن مسیر به تعداد مسیرها بستگی ندارد
+# hook(نام مسیر، مدت اجرا، خطا) بعد از اجرای هر هندلر صدا زده می‌شود
+class Router:
+    def __init__(self, name):
+        self.name = name
+        self._exact = {}
+        self._prefixes = {}
+        self._hooks = []
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    # ثبت مسیر دقیق؛ guard(*args) در صورت False بودن مسیر را نادیده می‌گیرد
+    def route(self, key, guard=None):
+        def decorator(handler):
+            self._exact[key] = (key, handler, guard, None)
+            return handler
+
+        return decorator
+
+    # ثبت مسیر پیشوندی؛ باقی کلید بعد از پیشوند با parse تبدیل و به عنوان آخرین آرگومان به هندلر داده می‌شود
+    # پیشوند باید به "_" ختم شود
+    def prefix(self, prefix, parse=str, guard=None):
+        if not prefix.endswith("_"):
+            raise ValueError(f"پیشوند مسیر باید به _ ختم شود: {prefix}")
+
+        def decorator(handler):
+            self._prefixes[prefix] = (prefix + "*", handler, guard, parse)
+            return handler
+
+        return decorator
+
+    def add_hook(self, hook):
+        self._hooks.append(hook)
+
+    def _match(self, key):
+        entry = self._exact.get(key)
+        if entry is not None:
+            return entry, None
+        end = key.find("_") if self._prefixes else -1
+        while end != -1:
+            entry = self._prefixes.get(key[: end + 1])
+            if entry is not None:
+                return entry, key[end + 1 :]
+            end = key.find("_", end + 1)
+        return None, None
+
+    # اجرای هندلر مسیر key؛ اگر مسیری پیدا نشود False برمی‌گردد
+    def dispatch(self, key, *args):
+        if key is None:
+            return False
+        entry, rest = self._match(key)
+        if entry is None:
+            return False
+        name, handler, guard, parse = entry
+        if guard is not None and not guard(*args):
+            return False
+        if parse is not None:
+            try:
+                args = (*args, parse(rest))
+            except ValueError:
+                logger.warning(f"{self.name}: invalid parameter in {key}")
+                return False
+
+        start = time.monotonic()
+        error = None
+        try:
+            handler(*args)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._record(name, time.monotonic() - start, error)
+        return True
+
+    def _record(self, name, duration, error):
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = {"calls": 0, "errors": 0, "total": 0.0, "max": 0.0}
+            stats["calls"] += 1
+            stats["errors"] += error is not None
+            stats["total"] += duration
+            stats["max"] = max(stats["max"], duration)
+        for hook in self._hooks:
+            try:
+                hook(f"{self.name}:{name}", duration, error)
+            except Exception:
+                logger.exception(f"{self.name}: route hook failed")
+
+    # آمار هر مسیر: تعداد اجرا، خطا، میانگین و بیشترین زمان اجرا (میلی‌ثانیه)
+    def stats(self):
+        with self._lock:
+            return {
+                name: {
+                    "calls": stats["calls"],
+                    "errors": stats["errors"],
+                    "avg_ms": round(stats["total"] / stats["calls"] * 1000, 2),
+                    "max_ms": round(stats["max"] * 1000, 2),
+                }
+                for name, stats in self._stats.items()
+            }
@@ -0,0 +1,119 @@
+import bisect
+import json
+
+# برنامه کاری پیش‌فرض: دو شیفت با استراحت ظهر از ۱۴ تا ۱۶ و نوبت‌های یک ساعته
+DEFAULT_SHIFTS = (("08:00", "14:00"), ("16:00", "21:00"))
+DEFAULT_SLOT_MINUTES = 60
+# مدت هر خدمت به دقیقه؛ تعداد نوبت لازم بر اساس طول نوبت هر آرایشگر حساب می‌شود
+DEFAULT_SERVICE_MINUTES = {"service_haircut": 60, "service_vip": 120}
+DEFAULT_HORIZON_DAYS = 3
+
+
+def _to_minutes(value):
+    hour, minute = value.split(":")
+    return int(hour) * 60 + int(minute)
+
+
+def _to_time(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+# برنامه کاری یک آرایشگر: شیفت‌ها و طول هر نوبت
+# نوبت‌های دو شیفت مختلف (دو طرف استراحت) هیچ وقت پشت سر هم حساب نمی‌شوند
+class BarberSchedule:
+    def __init__(self, shifts=DEFAULT_SHIFTS, slot_minutes=DEFAULT_SLOT_MINUTES):
+        if slot_minutes <= 0:
+            raise ValueError(f"طول نوبت نامعتبر است: {slot_minutes}")
+        self.slot_minutes = slot_minutes
+        self.times = []
+        self._shift = []  # شماره شیفت هر نوبت
+        for shift_index, (start, end) in enumerate(sorted(shifts, key=lambda shift: _to_minutes(shift[0]))):
+            start, end = _to_minutes(start), _to_minutes(end)
+            if start >= end or (self.times and start < _to_minutes(self.times[-1]) + slot_minutes):
+                raise ValueError(f"شیفت نامعتبر است: {_to_time(start)}-{_to_time(end)}")
+            for minute in range(start, end - slot_minutes + 1, slot_minutes):
+                self.times.append(_to_time(minute))
+                self._shift.append(shift_index)
+        self._position = {time: i for i, time in enumerate(self.times)}
+
+    # تعداد نوبت پشت سر همی که یک خدمت با این مدت لازم دارد
+    def slots_needed(self, minutes):
+        return max(1, -(-minutes // self.slot_minutes))
+
+    # ساعت‌های نوبت‌های یک بلوک از start؛ اگر بلوک از برنامه یا شیفت بیرون بزند None برمی‌گردد
+    def block(self, start, length):
+        position = self._position.get(start)
+        if position is None or position + length > len(self.times):
+            return None
+        if self._shift[position] != self._shift[position + length - 1]:
+            return None
+        return self.times[position : position + length]
+
+    # همه بلوک‌های length نوبتی خالی و پشت سر هم، به ترتیب زمان شروع
+    # earliest: زودترین ساعت شروع مجاز (برای حذف ساعت‌های گذشته امروز)
+    # فقط روی نوبت‌های خالی یک بار پیمایش می‌شود و طول هر بازه پیوسته نگه داشته می‌شود
+    def free_blocks(self, free_times, length, earliest=None):
+        positions = sorted(self._position[time] for time in free_times if time in self._position)
+        if earliest is not None:
+            cutoff = bisect.bisect_left(self.times, earliest)
+            positions = positions[bisect.bisect_left(positions, cutoff) :]
+        blocks = []
+        run_start = 0
+        for i, position in enumerate(positions):
+            previous = positions[i - 1] if i else None
+            if previous != position - 1 or self._shift[previous] != self._shift[position]:
+                run_start = i
+            if i - run_start + 1 >= length:
+                start = positions[i - length + 1]
+                blocks.append(self.times[start : start + length])
+        return blocks
+
+
+# برنامه کاری همه آرایشگرها، مدت خدمات و تعداد روزهای قابل رزرو
+class ScheduleBook:
+    def __init__(self, default=None, barbers=None, service_minutes=None, horizon=DEFAULT_HORIZON_DAYS):
+        if horizon < 1:
+            raise ValueError(f"تعداد روزهای قابل رزرو نامعتبر است: {horizon}")
+        self.default = default or BarberSchedule()
+        self.barbers = barbers or {}  # barber_id -> BarberSchedule
+        self.service_minutes = dict(DEFAULT_SERVICE_MINUTES, **(service_minutes or {}))
+        self.horizon = horizon
+
+    def for_barber(self, barber_id):
+        return self.barbers.get(barber_id, self.default)
+
+    # تعداد نوبت پشت سر همی که خدمت service نزد این آرایشگر لازم دارد
+    def block_length(self, barber_id, service):
+        schedule = self.for_barber(barber_id)
+        return schedule.slots_needed(self.service_minutes.get(service, schedule.slot_minutes))
+
+
+def _parse_schedule(config, fallback):
+    return BarberSchedule(
+        config.get("shifts", fallback["shifts"]),
+        int(config.get("slot_minutes", fallback["slot_minutes"])),
+    )
+
+
+# تابع برای ساخت برنامه کاری از فایل JSON (در صورت وجود) و تنظیمات محیطی
+# نمونه فایل:
+# {"horizon_days": 14, "slot_minutes": 60, "shifts": [["08:00", "14:00"], ["16:00", "21:00"]],
+#  "services": {"service_vip": 120}, "barbers": {"3": {"shifts": [["10:00", "18:00"]], "slot_minutes": 30}}}
+def load_schedule_book(path=None, horizon=None):
+    config = {}
+    if path:
+        with open(path, encoding="utf-8") as file:
+            config = json.load(file)
+    fallback = {"shifts": DEFAULT_SHIFTS, "slot_minutes": DEFAULT_SLOT_MINUTES}
+    default = _parse_schedule(config, fallback)
+    fallback = {"shifts": config.get("shifts", DEFAULT_SHIFTS), "slot_minutes": default.slot_minutes}
+    barbers = {
+        int(barber_id): _parse_schedule(barber_config, fallback)
+        for barber_id, barber_config in config.get("barbers", {}).items()
+    }
+    service_minutes = {service: int(minutes) for service, minutes in config.get("services", {}).items()}
+    if any(minutes <= 0 for minutes in service_minutes.values()):
+        raise ValueError(f"مدت خدمت نامعتبر است: {service_minutes}")
+    if horizon is None:
+        horizon = config.get("horizon_days", DEFAULT_HORIZON_DAYS)
+    return ScheduleBook(default, barbers, service_minutes, int(horizon))
@@ -0,0 +1,132 @@
+import logging
+import threading
+import time
+from datetime import datetime, time as dtime, timedelta
+
+logger = logging.getLogger(__name__)
+
+
+# زمان‌بند کارهای پس‌زمینه؛ هر اجرای کار روی ترد جداگانه خودش انجام می‌شود تا پردازش آپدیت‌ها و
+# کارهای دیگر (مثلا جابجایی نوبت‌ها در نیمه‌شب پشت یک بایگانی طولانی) منتظر آن نمانند
+# یک کار هیچ وقت همزمان با خودش اجرا نمی‌شود؛ اجرای بعدی از پایان اجرای قبلی حساب می‌شود
+# observer(نام کار، مدت، خطا) در صورت تعیین بعد از هر اجرا صدا زده می‌شود (برای متریک‌ها)
+class Scheduler:
+    def __init__(self, observer=None):
+        self.observer = observer
+        self._jobs = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    # اجرای کار هر interval ثانیه یک بار؛ برای کارهای پرتکرار با log=False پایان هر اجرا در لاگ ثبت نمی‌شود
+    def every(self, name, interval, func, log=True):
+        self._add(name, func, lambda now: now + interval, log)
+
+    # اجرای کار هر روز در ساعت مشخص به وقت منطقه زمانی tz (شی pytz)
+    def daily(self, name, tz, hour, minute, func):
+        def next_run(now):
+            local_now = datetime.fromtimestamp(now, tz)
+            day = local_now.date()
+            while True:
+                candidate = tz.localize(datetime.combine(day, dtime(hour, minute)))
+                if candidate.timestamp() > now:
+                    return candidate.timestamp()
+                day += timedelta(days=1)
+
+        self._add(name, func, next_run)
+
+    def _add(self, name, func, next_run, log=True):
+        job = {
+            "name": name,
+            "func": func,
+            "log": log,
+            "next_run_func": next_run,
+            "next_run": next_run(time.time()),
+            "runs": 0,
+            "failures": 0,
+            "last_duration": None,
+            "total_duration": 0.0,
+            "last_run": None,
+            "thread": None,
+        }
+        with self._lock:
+            self._jobs.append(job)
+        self._wake.set()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+        self._thread.start()
+
+    # توقف زمان‌بند؛ کارهای در حال اجرا تا timeout ثانیه فرصت دارند تمام شوند
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+        with self._lock:
+            threads = [job["thread"] for job in self._jobs if job["thread"]]
+        for thread in threads:
+            thread.join(timeout)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            now = time.time()
+            with self._lock:
+                idle = [job for job in self._jobs if job["thread"] is None]
+                due = [job for job in idle if job["next_run"] <= now]
+                for job in due:
+                    job["thread"] = threading.Thread(
+                        target=self._run, args=(job,), name=f"scheduler-{job['name']}", daemon=True
+                    )
+                next_run = min((job["next_run"] for job in idle if job not in due), default=None)
+            for job in due:
+                job["thread"].start()
+            if due:
+                continue
+            # حداکثر یک دقیقه صبر می‌کند تا تغییر ساعت سیستم دیده شود؛ کار جدید یا پایان یک اجرا زودتر بیدارش می‌کند
+            delay = 60 if next_run is None else next_run - now
+            self._wake.wait(min(max(delay, 0), 60))
+
+    def _run(self, job):
+        start = time.monotonic()
+        error = None
+        try:
+            job["func"]()
+        except Exception as e:
+            error = e
+            logger.exception(f"Scheduled job {job['name']} failed")
+        duration = time.monotonic() - start
+        with self._lock:
+            job["runs"] += 1
+            if error is not None:
+                job["failures"] += 1
+            job["last_duration"] = duration
+            job["total_duration"] += duration
+            job["last_run"] = time.time()
+            job["next_run"] = job["next_run_func"](time.time())
+            job["thread"] = None
+        self._wake.set()
+        if job["log"]:
+            logger.info(f"Scheduled job {job['name']} finished in {duration:.3f}s")
+        if self.observer:
+            try:
+                self.observer(job["name"], duration, error)
+            except Exception:
+                logger.exception(f"Scheduler observer failed for {job['name']}")
+
+    # آمار اجرای کارها (تعداد، خطا و مدت اجرا)
+    def stats(self):
+        with self._lock:
+            return {
+                job["name"]: {
+                    "runs": job["runs"],
+                    "failures": job["failures"],
+                    "last_duration": job["last_duration"],
+                    "avg_duration": job["total_duration"] / job["runs"] if job["runs"] else None,
+                    "next_run": job["next_run"],
+                    "running": job["thread"] is not None,
+                }
+                for job in self._jobs
+            }
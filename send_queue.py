@@ -0,0 +1,236 @@
+import heapq
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from queue import Queue
+
+from bale_client import is_retryable
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+# سطل توکن برای محدود کردن نرخ ارسال
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # مدت زمان لازم تا آزاد شدن یک توکن (صفر یعنی همین حالا)
+    def delay(self):
+        with self._lock:
+            self._refill()
+            return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self, count=1):
+        with self._lock:
+            self._refill()
+            self.tokens -= count
+
+    # تعداد توکن‌هایی که همین حالا بدون انتظار قابل برداشتن هستند
+    def available(self):
+        with self._lock:
+            self._refill()
+            return max(0, int(self.tokens))
+
+    # انتظار تا گرفتن یک توکن
+    def acquire(self):
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def is_full(self):
+        with self._lock:
+            self._refill()
+            return self.tokens >= self.capacity
+
+
+# صف ارسال پیام‌ها با محدودیت نرخ سراسری و محدودیت نرخ هر چت
+# پیام‌های هر چت به ترتیب ارسال می‌شوند و ارسال ناموفق از همین صف دوباره تلاش می‌شود
+# (همه درخواست‌های صف POST هستند؛ بعد از تایم‌اوت خواندن دوباره ارسال نمی‌شوند)
+class SendQueue:
+    def __init__(
+        self,
+        send_func,
+        workers=4,
+        global_rate=30,
+        global_burst=30,
+        chat_rate=1,
+        chat_burst=3,
+        max_attempts=5,
+        retry_delay=1,
+    ):
+        self.send_func = send_func
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._global_bucket = TokenBucket(global_rate, global_burst)
+        self._chat_buckets = {}
+        self._chats = {}  # chat_id -> deque پیام‌های در انتظار
+        self._ready = Queue()
+        self._delayed = []  # heap of (ready_at, seq, chat_id)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._delayed_cond = threading.Condition(self._lock)
+        self._idle = threading.Condition(self._lock)
+        self._pending = 0
+        self._sent = 0
+        self._failed = 0
+        self._retried = 0
+        self._throttled = 0
+        self._running = True
+
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"send-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+        self._timer = threading.Thread(target=self._timer_loop, name="send-timer", daemon=True)
+        self._timer.start()
+
+    # افزودن پیام به صف؛ بدون انتظار یک Future برمی‌گرداند
+    def submit(self, chat_id, method, payload):
+        future = Future()
+        job = {"method": method, "payload": payload, "future": future, "attempts": 0}
+        with self._lock:
+            self._pending += 1
+            queue = self._chats.get(chat_id)
+            if queue is not None:
+                queue.append(job)
+                return future
+            self._chats[chat_id] = deque([job])
+        self._ready.put(chat_id)
+        return future
+
+    def _bucket(self, chat_id):
+        with self._lock:
+            bucket = self._chat_buckets.get(chat_id)
+            if bucket is None:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+                self._chat_buckets[chat_id] = bucket
+            return bucket
+
+    # چت را بعد از مدت مشخص دوباره در صف آماده قرار می‌دهد
+    def _schedule(self, chat_id, delay):
+        with self._delayed_cond:
+            self._seq += 1
+            heapq.heappush(self._delayed, (time.monotonic() + delay, self._seq, chat_id))
+            self._delayed_cond.notify()
+
+    def _timer_loop(self):
+        last_prune = time.monotonic()
+        with self._delayed_cond:
+            while self._running:
+                now = time.monotonic()
+                while self._delayed and self._delayed[0][0] <= now:
+                    _, _, chat_id = heapq.heappop(self._delayed)
+                    self._ready.put(chat_id)
+                if now - last_prune >= 60:
+                    self._prune_buckets()
+                    last_prune = now
+                timeout = self._delayed[0][0] - now if self._delayed else 1
+                self._delayed_cond.wait(min(timeout, 1))
+
+    # حذف سطل‌های چت‌هایی که پیامی در صف ندارند و سطلشان پر است
+    def _prune_buckets(self):
+        for chat_id in list(self._chat_buckets):
+            if chat_id not in self._chats and self._chat_buckets[chat_id].is_full():
+                del self._chat_buckets[chat_id]
+
+    def _worker(self):
+        while True:
+            chat_id = self._ready.get()
+            if chat_id is _STOP:
+                return
+
+            bucket = self._bucket(chat_id)
+            wait = bucket.delay()
+            if wait > 0:
+                with self._lock:
+                    self._throttled += 1
+                self._schedule(chat_id, wait)
+                continue
+            self._global_bucket.acquire()
+            bucket.consume()
+
+            with self._lock:
+                job = self._chats[chat_id][0]
+            job["attempts"] += 1
+            try:
+                result = self.send_func(job["method"], job["payload"])
+            except Exception as e:
+                if is_retryable(e) and job["attempts"] < self.max_attempts:
+                    # پیام در ابتدای صف چت می‌ماند تا ترتیب حفظ شود
+                    delay = self.retry_delay * 2 ** (job["attempts"] - 1)
+                    logger.warning(
+                        f"Error sending {job['method']} to {chat_id}: {e}, retrying in {delay}s"
+                    )
+                    with self._lock:
+                        self._retried += 1
+                    self._schedule(chat_id, delay)
+                    continue
+                logger.error(f"Error sending {job['method']} to {chat_id}: {e}")
+                self._finish(chat_id, failed=True)
+                job["future"].set_exception(e)
+            else:
+                self._finish(chat_id)
+                job["future"].set_result(result)
+
+    def _finish(self, chat_id, failed=False):
+        with self._lock:
+            queue = self._chats[chat_id]
+            queue.popleft()
+            self._pending -= 1
+            if failed:
+                self._failed += 1
+            else:
+                self._sent += 1
+            if queue:
+                self._ready.put(chat_id)
+            else:
+                del self._chats[chat_id]
+                if not self._chats:
+                    self._idle.notify_all()
+
+    # آمار صف ارسال
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": self._pending,
+                "active_chats": len(self._chats),
+                "sent": self._sent,
+                "failed": self._failed,
+                "retried": self._retried,
+                "throttled": self._throttled,
+            }
+
+    # انتظار تا ارسال همه پیام‌های صف
+    def join(self, timeout=None):
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._chats, timeout)
+
+    def stop(self, timeout=None):
+        self.join(timeout)
+        with self._delayed_cond:
+            self._running = False
+            self._delayed_cond.notify()
+        for _ in self._workers:
+            self._ready.put(_STOP)
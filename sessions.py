@@ -0,0 +1,101 @@
+import copy
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from db import Database
+from migrations import SESSIONS_SCHEMA
+from repositories import SQLiteRepository
+
+logger = logging.getLogger(__name__)
+
+
+# ذخیره‌ساز وضعیت گفتگو در حافظه با انقضای زمانی (TTL) و حذف قدیمی‌ترین‌ها (LRU)
+# هر get انقضا را تمدید می‌کند و یک کپی برمی‌گرداند؛ تغییرات فقط با save ذخیره می‌شوند
+class MemorySessionStore:
+    def __init__(self, ttl=21600, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()  # chat_id -> (expires_at, data)
+
+    def get(self, chat_id):
+        with self._lock:
+            entry = self._sessions.get(chat_id)
+            if entry is None:
+                return {}
+            expires_at, data = entry
+            if expires_at <= time.monotonic():
+                del self._sessions[chat_id]
+                return {}
+            self._sessions[chat_id] = (time.monotonic() + self.ttl, data)
+            self._sessions.move_to_end(chat_id)
+            return copy.deepcopy(data)
+
+    def save(self, chat_id, data):
+        with self._lock:
+            if not data:
+                self._sessions.pop(chat_id, None)
+                return
+            self._sessions[chat_id] = (time.monotonic() + self.ttl, copy.deepcopy(data))
+            self._sessions.move_to_end(chat_id)
+            while len(self._sessions) > self.max_size:
+                evicted, _ = self._sessions.popitem(last=False)
+                logger.info(f"Session evicted for {evicted}")
+
+    def delete(self, chat_id):
+        with self._lock:
+            self._sessions.pop(chat_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+# ذخیره‌ساز وضعیت گفتگو در مخزن داده (جدول sessions)؛ با STORAGE_BACKEND=postgres بین همه نمونه‌های ربات
+# مشترک است و بعد از ری‌استارت باقی می‌ماند
+class RepositorySessionStore:
+    def __init__(self, repository, ttl=21600):
+        self.repository = repository
+        self.ttl = ttl
+
+    def get(self, chat_id):
+        data = self.repository.load_session(chat_id, time.time())
+        return json.loads(data) if data else {}
+
+    def save(self, chat_id, data):
+        if not data:
+            self.repository.delete_session(chat_id)
+        else:
+            self.repository.store_session(chat_id, json.dumps(data, ensure_ascii=False), time.time() + self.ttl)
+
+    def delete(self, chat_id):
+        self.repository.delete_session(chat_id)
+
+    # حذف جلسه‌های منقضی‌شده
+    def purge_expired(self):
+        return self.repository.purge_sessions(time.time())
+
+
+# ذخیره‌ساز وضعیت گفتگو در فایل SQLite جداگانه (SESSION_DB_PATH) تا بعد از ری‌استارت باقی بماند و بین پروسس‌های
+# یک سرور مشترک باشد
+# در این فایل فقط جدول sessions ساخته می‌شود (بقیه جدول‌های ربات با migrate روی DB_PATH ساخته می‌شوند)
+class SQLiteSessionStore(RepositorySessionStore):
+    def __init__(self, path, ttl=21600):
+        self.db = Database(path)
+        with self.db.transaction() as conn:
+            for statement in SESSIONS_SCHEMA:
+                conn.execute(statement)
+        super().__init__(SQLiteRepository(self.db), ttl)
+
+
+# تابع برای ساخت ذخیره‌ساز جلسه بر اساس تنظیمات (repository همان مخزن داده ربات است)
+def create_session_store(backend, ttl, max_size, db_path, repository=None):
+    if backend == "repository":
+        return RepositorySessionStore(repository, ttl=ttl)
+    if backend == "sqlite":
+        return SQLiteSessionStore(db_path, ttl=ttl)
+    if backend == "memory":
+        return MemorySessionStore(ttl=ttl, max_size=max_size)
+    raise ValueError(f"نوع ذخیره‌ساز جلسه نامعتبر است: {backend}")
@@ -0,0 +1,139 @@
+import time
+
+USER_APPOINTMENT_COLUMNS = (
+    "id, user_id, barber_id, date, time, service, name, phone, status, payment_status, tracking_code"
+)
+
+
+# تابع برای ساخت یکجای نوبت‌های خالی همه آرایشگرها (یا آرایشگرهای مشخص‌شده)
+# نوبت‌های موجود به خاطر UNIQUE(barber_id, date, time) و INSERT OR IGNORE دست نمی‌خورند
+# exclude_ids: آرایشگرهایی که برنامه کاری جداگانه دارند و اینجا ساخته نمی‌شوند
+def generate_slots(cursor, dates, hours, barber_ids=None, exclude_ids=None):
+    if barber_ids is not None and not barber_ids:
+        return 0
+    dates_values = ", ".join("(?)" for _ in dates)
+    hours_values = ", ".join("(?)" for _ in hours)
+    params = list(dates) + list(hours)
+    query = f"""
+        INSERT OR IGNORE INTO appointments (date, time, status, barber_id)
+        SELECT d.column1, h.column1, 'خالی', b.id
+        FROM barbers b
+        CROSS JOIN (VALUES {dates_values}) d
+        CROSS JOIN (VALUES {hours_values}) h
+    """
+    where = []
+    if barber_ids is not None:
+        where.append(f"b.id IN ({', '.join('?' for _ in barber_ids)})")
+        params += list(barber_ids)
+    if exclude_ids:
+        where.append(f"b.id NOT IN ({', '.join('?' for _ in exclude_ids)})")
+        params += list(exclude_ids)
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    cursor.execute(query, params)
+    return cursor.rowcount
+
+
+# تابع برای ساخت نوبت‌های خالی بر اساس برنامه کاری هر آرایشگر (ScheduleBook)
+def generate_schedule_slots(cursor, dates, schedules, barber_ids=None):
+    overrides = set(schedules.barbers)
+    created = generate_slots(cursor, dates, schedules.default.times, barber_ids, exclude_ids=overrides)
+    for barber_id, schedule in schedules.barbers.items():
+        if barber_ids is None or barber_id in barber_ids:
+            created += generate_slots(cursor, dates, schedule.times, [barber_id])
+    return created
+
+
+# تابع برای دریافت نوبت‌های خالی یک آرایشگر در چند تاریخ با یک کوئری
+# خروجی: دیکشنری تاریخ -> مجموعه ساعت‌های خالی
+def fetch_free_slots(cursor, barber_id, dates):
+    placeholders = ", ".join("?" for _ in dates)
+    cursor.execute(
+        f"SELECT date, time FROM appointments WHERE barber_id=? AND status='خالی' AND date IN ({placeholders})",
+        [barber_id, *dates],
+    )
+    free = {date: set() for date in dates}
+    for date, hour in cursor.fetchall():
+        free[date].add(hour)
+    return free
+
+
+# تابع برای رزرو اتمیک نوبت؛ نوبت فقط در صورتی گرفته می‌شود که هنوز خالی باشد
+# به‌روزرسانی appointments و ثبت در user_appointments در یک تراکنش انجام می‌شوند
+# اگر تراکنشی از قبل باز باشد رزرو در یک savepoint انجام می‌شود تا رزرو ناموفق فقط تغییرات خودش را
+# برگرداند و commit یا rollback تراکنش بیرونی با صدا زننده بماند
+# خروجی: True در صورت موفقیت و False اگر نوبت قبلا توسط شخص دیگری گرفته شده باشد
+def book_slot(conn, user_id, barber_id, date, times, service, name, phone):
+    cursor = conn.cursor()
+    placeholders = ", ".join("?" for _ in times)
+    nested = conn.in_transaction
+    cursor.execute("SAVEPOINT book_slot" if nested else "BEGIN IMMEDIATE")
+
+    def undo():
+        if nested:
+            cursor.execute("ROLLBACK TO book_slot")
+            cursor.execute("RELEASE book_slot")
+        else:
+            conn.rollback()
+
+    try:
+        cursor.execute(
+            f"""
+            UPDATE appointments
+            SET user_id=?, name=?, phone=?, service=?, status='رزرو'
+            WHERE barber_id=? AND date=? AND time IN ({placeholders}) AND status='خالی'
+            """,
+            [user_id, name, phone, service, barber_id, date, *times],
+        )
+        booked = cursor.rowcount == len(times)
+        if booked:
+            cursor.execute(
+                """
+                INSERT INTO user_appointments (user_id, barber_id, date, time, service, name, phone, status, payment_status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, 'رزرو', 'پرداخت نشده')
+                """,
+                (user_id, barber_id, date, times[0], service, name, phone),
+            )
+    except Exception:
+        undo()
+        raise
+    if not booked:
+        undo()
+    elif nested:
+        cursor.execute("RELEASE book_slot")
+    else:
+        conn.commit()
+    return booked
+
+
+# تابع برای حذف نوبت‌های روزهای گذشته از جدول appointments
+def delete_past_slots(cursor, today):
+    cursor.execute("DELETE FROM appointments WHERE date < ?", (today,))
+    return cursor.rowcount
+
+
+# تابع برای انتقال نوبت‌های گذشته user_appointments به جدول بایگانی
+# هر دسته در یک تراکنش کوتاه جداگانه منتقل می‌شود تا قفل نوشتن طولانی نگه داشته نشود
+def archive_user_appointments(db, before_date, batch_size=500):
+    archived = 0
+    while True:
+        with db.transaction() as conn:
+            ids = [
+                row[0]
+                for row in conn.execute(
+                    "SELECT id FROM user_appointments WHERE date < ? LIMIT ?",
+                    (before_date, batch_size),
+                )
+            ]
+            if not ids:
+                return archived
+            placeholders = ", ".join("?" for _ in ids)
+            conn.execute(
+                f"""
+                INSERT OR REPLACE INTO user_appointments_archive ({USER_APPOINTMENT_COLUMNS}, archived_at)
+                SELECT {USER_APPOINTMENT_COLUMNS}, ? FROM user_appointments WHERE id IN ({placeholders})
+                """,
+                [time.time(), *ids],
+            )
+            conn.execute(f"DELETE FROM user_appointments WHERE id IN ({placeholders})", ids)
+        archived += len(ids)
@@ -0,0 +1,49 @@
+import os
+import sys
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import Database  # noqa: E402
+from migrations import migrate  # noqa: E402
+from repositories import MemoryRepository, PostgresRepository, SQLiteRepository  # noqa: E402
+
+
+# پایگاه داده SQLite مایگریت‌شده در یک پوشه موقت
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / "test.db"))
+    migrate(database.connection())
+    yield database
+    database.close_all()
+
+
+# هر تست PostgreSQL در یک schema موقت روی پایگاه داده TEST_DATABASE_URL اجرا می‌شود
+@pytest.fixture
+def postgres_dsn():
+    psycopg = pytest.importorskip("psycopg")
+    pytest.importorskip("psycopg_pool")
+    dsn = os.environ.get("TEST_DATABASE_URL")
+    if not dsn:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    schema = f"test_{uuid.uuid4().hex}"
+    with psycopg.connect(dsn, autocommit=True) as conn:
+        conn.execute(f"CREATE SCHEMA {schema}")
+    yield psycopg.conninfo.make_conninfo(dsn, options=f"-c search_path={schema}")
+    with psycopg.connect(dsn, autocommit=True) as conn:
+        conn.execute(f"DROP SCHEMA {schema} CASCADE")
+
+
+# مخزن خالی از هر سه نوع؛ تست‌هایی که از آن استفاده می‌کنند روی همه مخزن‌ها اجرا می‌شوند
+@pytest.fixture(params=["sqlite", "memory", "postgres"])
+def repository(request):
+    if request.param == "sqlite":
+        yield SQLiteRepository(request.getfixturevalue("db"))
+    elif request.param == "memory":
+        yield MemoryRepository()
+    else:
+        repository = PostgresRepository(request.getfixturevalue("postgres_dsn"), max_size=20)
+        yield repository
+        repository.close()
@@ -0,0 +1,65 @@
+import csv
+
+import pytest
+
+from barber_import import CSV_COLUMNS, BarberImportError, import_barbers
+from schedule import BarberSchedule, ScheduleBook
+
+DATES = ["1403-01-01"]
+SCHEDULES = ScheduleBook(BarberSchedule((("08:00", "10:00"),), 60), {}, {"service_haircut": 60}, 3)
+
+
+def barber_row(user_id, phone="09120000001"):
+    return {
+        "name": f"barber {user_id}",
+        "phone": phone,
+        "address": "Tehran",
+        "user_id": str(user_id),
+        "card_number": "6037000000000001",
+    }
+
+
+def write_csv(path, rows):
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=CSV_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return str(path)
+
+
+def run_import(repository, path, **kwargs):
+    return import_barbers(repository, path, DATES, SCHEDULES, chunk_size=2, **kwargs)
+
+
+def test_import_keeps_missing_barbers_unless_asked(repository, tmp_path):
+    run_import(repository, write_csv(tmp_path / "a.csv", [barber_row(1), barber_row(2), barber_row(3)]))
+    path = write_csv(tmp_path / "b.csv", [barber_row(1, "09120000009"), barber_row(2)])
+
+    result = run_import(repository, path)
+    assert (result["changed"], result["unchanged"], result["removed"], result["missing"]) == (1, 1, 0, 1)
+    assert set(repository.barber_records()) == {1, 2, 3}
+
+    result = run_import(repository, path, remove_missing=True)
+    assert (result["removed"], result["missing"]) == (1, 0)
+    assert set(repository.barber_records()) == {1, 2}
+
+
+def test_invalid_file_changes_nothing(repository, tmp_path):
+    run_import(repository, write_csv(tmp_path / "a.csv", [barber_row(1)]))
+    version = repository.barbers_version()
+    path = write_csv(tmp_path / "bad.csv", [barber_row(1, "123"), barber_row(2), barber_row(2)])
+
+    with pytest.raises(BarberImportError) as error:
+        run_import(repository, path)
+    assert len(error.value.errors) == 2
+    assert set(repository.barber_records()) == {1}
+    assert repository.barbers_version() == version
+
+
+def test_progress_is_reported_while_reading(repository, tmp_path):
+    path = write_csv(tmp_path / "a.csv", [barber_row(user_id) for user_id in range(1, 6)])
+    reported = []
+    result = run_import(repository, path, progress=reported.append)
+    assert reported == [2, 4, 5]
+    assert result["added"] == 5
+    assert result["slots_created"] == 10
@@ -0,0 +1,60 @@
+import threading
+
+from bench import bench_booking_race
+from slots import book_slot, generate_slots
+
+DATE = "1403-01-01"
+
+
+def booked_rows(db):
+    return db.connection().execute("SELECT user_id, time FROM user_appointments").fetchall()
+
+
+def free_hours(db):
+    rows = db.connection().execute("SELECT time FROM appointments WHERE status='خالی'").fetchall()
+    return {row[0] for row in rows}
+
+
+def add_barber(db, hours):
+    conn = db.connection()
+    conn.execute("INSERT INTO barbers (name, user_id) VALUES ('barber', 1)")
+    generate_slots(conn.cursor(), [DATE], hours)
+
+
+# ۳۰۰ ترد با اتصال‌های جداگانه همزمان یک نوبت را رزرو می‌کنند: دقیقا یک رزرو موفق و یک ردیف user_appointments
+def test_booking_race():
+    race = bench_booking_race(300)
+    assert race["errors"] == 0
+    assert race["succeeded"] == 1
+    assert race["conflicts"] == 299
+    assert race["bookings"] == 1
+
+
+# رزرو همزمان بلوک‌های هم‌پوشان (خدمات VIP): فقط یکی موفق است و نوبت‌های برنده همه به نام اوست
+def test_overlapping_blocks_race(db):
+    add_barber(db, ["08:00", "09:00", "10:00"])
+    blocks = {user_id: times for user_id, times in ((1, ["08:00", "09:00"]), (2, ["09:00", "10:00"]))}
+    barrier = threading.Barrier(len(blocks) * 10)
+    winners = []
+
+    def book(user_id):
+        barrier.wait()
+        if book_slot(db.connection(), user_id, 1, DATE, blocks[user_id], "service_vip", "N", "0912"):
+            winners.append(user_id)
+
+    threads = [threading.Thread(target=book, args=(user_id,)) for user_id in blocks for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(winners) == 1
+    assert booked_rows(db) == [(winners[0], blocks[winners[0]][0])]
+    assert free_hours(db) == {"08:00", "09:00", "10:00"} - set(blocks[winners[0]])
+
+
+# رزرو بلوکی که یکی از نوبت‌هایش وجود ندارد هیچ تغییری نمی‌دهد
+def test_failed_booking_changes_nothing(db):
+    add_barber(db, ["08:00", "09:00"])
+    assert not book_slot(db.connection(), 1, 1, DATE, ["08:00", "21:00"], "service_vip", "N", "0912")
+    assert booked_rows(db) == []
+    assert free_hours(db) == {"08:00", "09:00"}
@@ -0,0 +1,17 @@
+import threading
+
+from dispatcher import UpdateDispatcher, get_update_chat_id
+
+
+def test_chat_id_of_callback_without_message():
+    assert get_update_chat_id({"message": {"chat": {"id": 5}}}) == 5
+    assert get_update_chat_id({"callback_query": {"message": {"chat": {"id": 7}}, "data": "x"}}) == 7
+    assert get_update_chat_id({"callback_query": {"inline_message_id": "abc", "from": {"id": 9}}}) is None
+
+
+def test_callback_without_message_is_dispatched():
+    handled = threading.Event()
+    dispatcher = UpdateDispatcher(lambda update: handled.set(), max_workers=1)
+    dispatcher.submit({"update_id": 1, "callback_query": {"inline_message_id": "abc", "from": {"id": 9}}})
+    assert handled.wait(5)
+    dispatcher.shutdown()
@@ -0,0 +1,58 @@
+import sqlite3
+
+import pytest
+
+from migrations import LATEST_VERSION, MIGRATIONS, get_schema_version, migrate
+
+
+# پایگاه داده در نسخه ۱ اسکیما (قبل از ایندکس یکتای نوبت‌ها) با ردیف‌های appointments داده شده
+# هر ردیف: (id، آرایشگر، تاریخ، ساعت، وضعیت)
+def legacy_db(rows):
+    conn = sqlite3.connect(":memory:", isolation_level=None)
+    for statement in MIGRATIONS[0][2]:
+        conn.execute(statement)
+    get_schema_version(conn)
+    conn.execute("INSERT INTO schema_migrations (version, name) VALUES (1, 'create base tables')")
+    conn.executemany("INSERT INTO appointments (id, barber_id, date, time, status) VALUES (?, ?, ?, ?, ?)", rows)
+    return conn
+
+
+def appointment_ids(conn):
+    return [row[0] for row in conn.execute("SELECT id FROM appointments ORDER BY id")]
+
+
+def test_migrate_fresh_database():
+    conn = sqlite3.connect(":memory:", isolation_level=None)
+    assert migrate(conn) == LATEST_VERSION
+    assert migrate(conn) == LATEST_VERSION
+
+
+# از نوبت‌های تکراری فقط نوبت‌های خالی حذف می‌شوند؛ نوبت رزرو شده یا قدیمی‌ترین نوبت خالی می‌ماند
+def test_duplicate_free_slots_removed():
+    conn = legacy_db(
+        [
+            (1, 1, "1403-01-01", "08:00", "خالی"),
+            (2, 1, "1403-01-01", "08:00", "رزرو"),
+            (3, 1, "1403-01-01", "08:00", "خالی"),
+            (4, 1, "1403-01-01", "09:00", "خالی"),
+            (5, 1, "1403-01-01", "09:00", "خالی"),
+            (6, 2, "1403-01-01", "08:00", "خالی"),
+        ]
+    )
+    assert migrate(conn) == LATEST_VERSION
+    assert appointment_ids(conn) == [2, 4, 6]
+
+
+# نوبتی که دو بار رزرو شده حذف نمی‌شود و مایگریشن متوقف می‌شود
+def test_duplicate_bookings_stop_migration():
+    conn = legacy_db(
+        [
+            (1, 1, "1403-01-01", "08:00", "رزرو"),
+            (2, 1, "1403-01-01", "08:00", "رزرو"),
+            (3, 1, "1403-01-01", "08:00", "خالی"),
+        ]
+    )
+    with pytest.raises(RuntimeError):
+        migrate(conn)
+    assert appointment_ids(conn) == [1, 2, 3]
+    assert get_schema_version(conn) == 1
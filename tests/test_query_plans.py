@@ -0,0 +1,20 @@
+import pytest
+
+from bench import BENCH_DATES, BENCH_HOURS, HOT_QUERIES, create_bench_db, query_plan
+from slots import generate_slots
+
+
+# پایگاه داده با تعداد زیادی آرایشگر و نوبت و آمار ANALYZE تا برنامه اجرای کوئری‌ها واقعی باشد
+@pytest.fixture(scope="module")
+def conn():
+    conn = create_bench_db(200)
+    generate_slots(conn.cursor(), BENCH_DATES, BENCH_HOURS)
+    conn.execute("ANALYZE")
+    yield conn
+    conn.close()
+
+
+# هر کوئری پرتکرار باید از ایندکس تعیین‌شده برای آن استفاده کند
+@pytest.mark.parametrize("name, query, params, index", HOT_QUERIES, ids=[query[0] for query in HOT_QUERIES])
+def test_hot_query_uses_index(conn, name, query, params, index):
+    assert f"INDEX {index}" in query_plan(conn, query, params)
@@ -0,0 +1,65 @@
+from concurrent.futures import Future
+
+from reminders import ReminderService
+
+NOW = 1_000_000.0
+
+
+class FakeCalendar:
+    def timestamp(self, date, hour):
+        return NOW + 24 * 3600
+
+    def days(self):
+        return []
+
+
+class FakeOutbox:
+    def __init__(self):
+        self.sent = []
+
+    def stats(self):
+        return {"pending": 0}
+
+    def submit(self, chat_id, method, payload):
+        self.sent.append(chat_id)
+        future = Future()
+        future.set_result({"ok": True})
+        return future
+
+
+class FakeRepository:
+    def __init__(self, reminders):
+        self.reminders = reminders
+        self.finished = {}
+
+    def claim_reminders(self, now, limit, lease):
+        return [reminder for reminder in self.reminders if reminder["id"] not in self.finished][:limit]
+
+    def finish_reminder(self, reminder_id, status):
+        self.finished[reminder_id] = status
+
+
+def reminder(reminder_id, status="رزرو"):
+    return {
+        "id": reminder_id,
+        "kind": "1h",
+        "chat_id": reminder_id,
+        "status": status,
+        "date": "1403-01-01",
+        "time": "08:00",
+        "attempts": 1,
+        "service": "service_haircut",
+        "barber_name": "Ali",
+    }
+
+
+def test_skipped_reminders_do_not_take_send_tokens():
+    repository = FakeRepository([reminder(1, "لغو شده"), reminder(2, "لغو شده"), reminder(3), reminder(4)])
+    outbox = FakeOutbox()
+    service = ReminderService(repository, FakeCalendar(), outbox, [("1h", 3600)], rate=0.001, batch_size=2)
+
+    assert service.send_due(NOW) == 0
+    assert service.send_due(NOW) == 2
+    assert outbox.sent == [3, 4]
+    assert service.send_due(NOW) == 0
+    assert repository.finished == {1: "skipped", 2: "skipped", 3: "sent", 4: "sent"}
@@ -0,0 +1,261 @@
+import threading
+import time
+
+import pytest
+
+from repositories import BARBER_COLUMNS, REMINDER_COLUMNS
+from schedule import BarberSchedule, ScheduleBook
+
+# همه پیاده‌سازی‌های مخزن (sqlite، memory و postgres) باید این تست‌ها را پاس کنند
+DATES = ["1403-01-01", "1403-01-02", "1403-01-03"]
+SCHEDULE = BarberSchedule((("08:00", "12:00"),), 60)
+SCHEDULES = ScheduleBook(SCHEDULE, {}, {"service_haircut": 60, "service_vip": 120}, 3)
+ALL_HOURS = {"08:00", "09:00", "10:00", "11:00"}
+
+
+def block_times(barber_id, start, service):
+    return SCHEDULE.block(start, SCHEDULES.block_length(barber_id, service))
+
+
+# دو آرایشگر با نوبت‌های خالی DATES؛ خروجی: id آرایشگرها
+@pytest.fixture
+def barbers(repository):
+    repository.upsert_barbers(
+        [
+            ("Ali Karimi", "09120000001", "Tehran", 101, "6037000000000001"),
+            ("Reza", "09120000002", "Karaj", 102, "6037000000000002"),
+        ]
+    )
+    repository.generate_slots(DATES, SCHEDULES)
+    return repository.barber_ids([101, 102])
+
+
+def test_barbers(repository):
+    repository.upsert_barbers(
+        [
+            ("Ali", "09120000001", "Tehran", 101, "6037000000000001"),
+            ("Reza", "09120000002", "Karaj", 102, "6037000000000002"),
+        ]
+    )
+    repository.upsert_barbers([("Ali Karimi", "09120000001", "Tehran", 101, "6037000000000001")])
+    barbers = repository.list_barbers()
+    assert [barber["name"] for barber in barbers] == ["Ali Karimi", "Reza"]
+    assert sorted(barbers[0]) == sorted(BARBER_COLUMNS)
+    assert repository.barber_records() == {
+        101: ("Ali Karimi", "09120000001", "Tehran", "6037000000000001"),
+        102: ("Reza", "09120000002", "Karaj", "6037000000000002"),
+    }
+    assert repository.barber_ids([101, 102]) == [barber["id"] for barber in barbers]
+
+
+def test_barbers_version(repository):
+    assert repository.barbers_version() == 0
+    repository.bump_barbers_version()
+    repository.bump_barbers_version()
+    assert repository.barbers_version() == 2
+
+
+def test_generate_slots(repository, barbers):
+    ali, reza = barbers
+    assert repository.generate_slots(DATES, SCHEDULES) == 0
+    assert repository.generate_slots(["1403-01-04"], SCHEDULES, [reza]) == 4
+    assert repository.free_slots(ali, DATES[:2]) == {date: ALL_HOURS for date in DATES[:2]}
+
+
+def test_book(repository, barbers):
+    ali, _ = barbers
+    assert repository.book(7, ali, DATES[0], ["09:00", "10:00"], "service_vip", "N", "0912")
+    assert not repository.book(8, ali, DATES[0], ["09:00"], "service_haircut", "M", "0913")
+    assert not repository.book(8, ali, DATES[0], ["10:00", "11:00"], "service_vip", "M", "0913")
+    assert not repository.book(8, ali, DATES[0], ["21:00"], "service_haircut", "M", "0913")
+    assert repository.free_slots(ali, [DATES[0]]) == {DATES[0]: {"08:00", "11:00"}}
+    assert tuple(repository.first_booked_slot(7)) == (DATES[0], "09:00")
+    assert repository.first_booked_slot(8) is None
+    assert repository.active_bookings(7) == [
+        {
+            "barber_id": ali,
+            "barber_name": "Ali Karimi",
+            "date": DATES[0],
+            "time": "09:00",
+            "service": "service_vip",
+            "payment_status": "پرداخت نشده",
+        }
+    ]
+
+
+def test_payment_and_reports(repository, barbers):
+    ali, reza = barbers
+    repository.book(7, ali, DATES[0], ["09:00", "10:00"], "service_vip", "N", "0912")
+    assert repository.set_payment_status(7, ali, DATES[0], "09:00", "پرداخت شده")
+    assert not repository.set_payment_status(8, ali, DATES[0], "09:00", "پرداخت شده")
+    assert repository.active_bookings(7)[0]["payment_status"] == "پرداخت شده"
+    total, rows = repository.slot_report("رزرو")
+    assert total == 2
+    assert [row[:5] + row[6:] for row in rows] == [
+        (DATES[0], "09:00", "N", "0912", "service_vip", "Ali Karimi"),
+        (DATES[0], "10:00", "N", "0912", "service_vip", "Ali Karimi"),
+    ]
+    assert repository.slot_report("خالی")[0] == 2 * 3 * 4 - 2
+    assert repository.slot_report("خالی", reza, DATES[1])[0] == 4
+    total, rows = repository.slot_report("خالی", ali, None, limit=3, offset=3)
+    assert [row[:2] for row in rows] == [(DATES[1], "09:00"), (DATES[1], "10:00"), (DATES[1], "11:00")]
+
+
+def test_cancel(repository, barbers):
+    ali, _ = barbers
+    repository.book(7, ali, DATES[0], ["09:00", "10:00"], "service_vip", "N", "0912")
+    assert repository.cancel_booking(7, block_times)
+    assert not repository.cancel_booking(7, block_times)
+    assert repository.free_slots(ali, [DATES[0]])[DATES[0]] == ALL_HOURS
+    assert repository.active_bookings(7) == []
+
+
+# در صورت خطا هیچ تغییری از تراکنش ذخیره نمی‌شود
+def test_transaction_rollback(repository):
+    with pytest.raises(RuntimeError):
+        with repository.transaction():
+            repository.upsert_barbers([("Temp", "09120000003", "", 103, "6037000000000003")])
+            repository.bump_barbers_version()
+            raise RuntimeError("rollback")
+    assert 103 not in repository.barber_records()
+    assert repository.barbers_version() == 0
+
+
+# رزرو ناموفق داخل تراکنش بیرونی فقط تغییرات خودش را برمی‌گرداند و commit یا rollback با تراکنش بیرونی است
+def test_book_inside_transaction(repository, barbers):
+    ali, _ = barbers
+    with pytest.raises(RuntimeError):
+        with repository.transaction():
+            repository.upsert_barbers([("Temp", "09120000004", "", 104, "6037000000000004")])
+            assert not repository.book(11, ali, DATES[1], ["08:00", "21:00"], "service_vip", "U", "0917")
+            assert "08:00" in repository.free_slots(ali, [DATES[1]])[DATES[1]]
+            assert 104 in repository.barber_records()
+            assert repository.book(11, ali, DATES[1], ["08:00"], "service_haircut", "U", "0917")
+            raise RuntimeError("rollback")
+    assert 104 not in repository.barber_records()
+    assert repository.active_bookings(11) == []
+    assert "08:00" in repository.free_slots(ali, [DATES[1]])[DATES[1]]
+
+
+# رزرو همزمان یک نوبت: فقط یک رزرو موفق است
+def test_booking_race(repository, barbers):
+    _, reza = barbers
+    winners = []
+    start = threading.Barrier(20)
+
+    def race(user_id):
+        start.wait()
+        if repository.book(user_id, reza, DATES[2], ["08:00"], "service_haircut", "R", "0914"):
+            winners.append(user_id)
+
+    threads = [threading.Thread(target=race, args=(1000 + i,)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(winners) == 1
+    assert repository.slot_report("رزرو", reza)[0] == 1
+
+
+# حذف آرایشگر: نوبت‌های خالی حذف و نوبت‌های رزرو شده حفظ می‌شوند
+def test_remove_barbers(repository, barbers):
+    _, reza = barbers
+    repository.book(5, reza, DATES[2], ["08:00"], "service_haircut", "R", "0914")
+    repository.remove_barbers([102])
+    assert [barber["name"] for barber in repository.list_barbers()] == ["Ali Karimi"]
+    assert repository.free_slots(reza, DATES) == {date: set() for date in DATES}
+    assert repository.slot_report("رزرو", reza)[0] == 1
+
+
+# هر رزرو از هر نوع یک یادآوری دارد و هر یادآوری تا پایان lease فقط یک بار برداشته می‌شود
+def test_reminders(repository, barbers):
+    ali, _ = barbers
+    assert repository.book(9, ali, DATES[2], ["10:00"], "service_haircut", "S", "0915")
+    assert repository.book(10, ali, DATES[2], ["11:00"], "service_haircut", "T", "0916")
+    window = ((DATES[2], "09:00"), (DATES[2], "12:00"))
+    upcoming = repository.bookings_without_reminder("1h", *window)
+    assert [tuple(row[1:]) for row in upcoming] == [(9, DATES[2], "10:00"), (10, DATES[2], "11:00")]
+    assert len(repository.bookings_without_reminder("1h", *window, limit=1)) == 1
+
+    now = 1_000_000.0
+    rows = [(row[0], "1h", row[1], now + i) for i, row in enumerate(upcoming)]
+    assert repository.queue_reminders(rows) == 2
+    assert repository.queue_reminders(rows) == 0
+    assert repository.bookings_without_reminder("1h", *window) == []
+    assert len(repository.bookings_without_reminder("24h", *window)) == 2
+
+    assert repository.claim_reminders(now - 1, 10, 60) == []
+    claimed = repository.claim_reminders(now, 10, 60)
+    assert [{key: reminder[key] for key in REMINDER_COLUMNS if key != "id"} for reminder in claimed] == [
+        {
+            "kind": "1h",
+            "chat_id": 9,
+            "due_at": now,
+            "attempts": 1,
+            "status": "رزرو",
+            "barber_name": "Ali Karimi",
+            "date": DATES[2],
+            "time": "10:00",
+            "service": "service_haircut",
+        }
+    ]
+    assert repository.claim_reminders(now + 30, 10, 60)[0]["chat_id"] == 10
+    reclaimed = repository.claim_reminders(now + 60, 10, 60)
+    assert [(reminder["chat_id"], reminder["attempts"]) for reminder in reclaimed] == [(9, 2)]
+    repository.finish_reminder(reclaimed[0]["id"], "sent")
+
+    assert repository.cancel_booking(10, block_times)
+    cancelled = repository.claim_reminders(now + 120, 10, 60)
+    assert [(reminder["chat_id"], reminder["status"]) for reminder in cancelled] == [(10, "لغو شده")]
+    repository.finish_reminder(cancelled[0]["id"], "skipped")
+    assert repository.claim_reminders(now + 1000, 10, 60) == []
+    assert repository.prune_reminders(time.time() + 1) == 2
+
+
+# پاکسازی روزهای گذشته و بایگانی رزروهای گذشته
+def test_cleanup_and_archive(repository, barbers):
+    ali, reza = barbers
+    repository.book(5, ali, DATES[0], ["08:00"], "service_haircut", "P", "0911")
+    repository.book(6, reza, DATES[2], ["08:00"], "service_haircut", "R", "0914")
+    assert repository.delete_past_slots(DATES[1]) == 2 * 4
+    assert repository.archive_bookings(DATES[2], batch_size=1) == 1
+    assert repository.archive_bookings(DATES[2], batch_size=1) == 0
+    assert repository.active_bookings(5) == []
+    assert len(repository.active_bookings(6)) == 1
+
+
+# هر آپدیت فقط یک بار پردازش می‌شود؛ پردازشی که تمام نشده بعد از آزاد شدن یا پایان lease دوباره شروع می‌شود
+def test_update_claims(repository):
+    assert repository.claim_update(1, "node-a", 300)
+    assert not repository.claim_update(1, "node-b", 300)
+    assert repository.claim_update(1, "node-b", -1)
+    repository.finish_update(1)
+    assert not repository.claim_update(1, "node-a", -1)
+    assert repository.release_updates(update_ids=[1]) == 0
+
+    assert repository.claim_update(2, "node-a", 300)
+    assert repository.claim_update(3, "node-b", 300)
+    assert repository.release_updates(update_ids=[2, 4]) == 1
+    assert repository.claim_update(2, "node-a", 300)
+    assert repository.release_updates(owner="node-b") == 1
+    assert repository.claim_update(3, "node-a", 300)
+    assert repository.prune_processed_updates(-1) == 3
+    assert repository.claim_update(1, "node-a", 300)
+
+
+def test_state(repository):
+    assert repository.get_state("last_update_id", 0) == 0
+    repository.set_state("last_update_id", 41)
+    repository.set_state("last_update_id", 42)
+    assert int(repository.get_state("last_update_id", 0)) == 42
+
+
+def test_sessions(repository):
+    assert repository.load_session(5, 100.0) is None
+    repository.store_session(5, '{"state": "a"}', 200.0)
+    repository.store_session(6, '{"state": "b"}', 300.0)
+    assert repository.load_session(5, 100.0) == '{"state": "a"}'
+    assert repository.load_session(5, 200.0) is None
+    assert repository.purge_sessions(250.0) == 1
+    repository.delete_session(6)
+    assert repository.load_session(6, 100.0) is None
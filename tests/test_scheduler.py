@@ -0,0 +1,57 @@
+import threading
+import time
+
+from metrics import Registry
+from scheduler import Scheduler
+
+
+def test_slow_job_does_not_delay_other_jobs():
+    release = threading.Event()
+    fast_runs = []
+    scheduler = Scheduler()
+    scheduler.every("slow", 0.01, lambda: release.wait(5))
+    scheduler.every("fast", 0.01, lambda: fast_runs.append(time.monotonic()))
+    scheduler.start()
+    try:
+        deadline = time.monotonic() + 5
+        while len(fast_runs) < 5 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        stats = scheduler.stats()
+        assert len(fast_runs) >= 5
+        assert stats["slow"]["running"] and stats["slow"]["runs"] == 0
+    finally:
+        release.set()
+        scheduler.stop(5)
+
+
+def test_job_runs_and_failures_are_exported():
+    registry = Registry()
+    latency = registry.histogram("job_duration_seconds", "Job run time", ["job"])
+    failures = registry.counter("job_failures_total", "Job failures", ["job"])
+
+    def observe(name, duration, error):
+        latency.observe(duration, job=name)
+        if error:
+            failures.inc(job=name)
+
+    def fail():
+        raise RuntimeError("boom")
+
+    done = threading.Event()
+    scheduler = Scheduler(observer=observe)
+    scheduler.every("broken", 0.01, fail)
+    scheduler.every("ok", 0.01, done.set)
+    scheduler.start()
+    try:
+        assert done.wait(5)
+        deadline = time.monotonic() + 5
+        while scheduler.stats()["broken"]["failures"] < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        scheduler.stop(5)
+
+    text = registry.render()
+    assert 'job_duration_seconds_count{job="ok"}' in text
+    assert 'job_duration_seconds_count{job="broken"}' in text
+    assert 'job_failures_total{job="broken"}' in text
+    assert 'job_failures_total{job="ok"}' not in text
@@ -0,0 +1,38 @@
+import sqlite3
+
+from sessions import MemorySessionStore, SQLiteSessionStore
+
+
+def test_memory_get_returns_a_copy():
+    store = MemorySessionStore(ttl=60)
+    store.save(1, {"state": "a", "items": [1]})
+    data = store.get(1)
+    data["state"] = "b"
+    data["items"].append(2)
+    assert store.get(1) == {"state": "a", "items": [1]}
+
+
+def test_memory_get_refreshes_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("sessions.time.monotonic", lambda: now[0])
+    store = MemorySessionStore(ttl=60)
+    store.save(1, {"state": "a"})
+    for _ in range(3):
+        now[0] += 50
+        assert store.get(1) == {"state": "a"}
+    now[0] += 61
+    assert store.get(1) == {}
+
+
+def test_sqlite_store_creates_only_sessions_table(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = SQLiteSessionStore(path, ttl=60)
+    store.save(1, {"state": "a"})
+    assert store.get(1) == {"state": "a"}
+    store.db.close_all()
+
+    conn = sqlite3.connect(path)
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    conn.close()
+    assert tables == {"sessions"}
+    assert SQLiteSessionStore(path, ttl=60).get(1) == {"state": "a"}
@@ -0,0 +1,57 @@
+import hmac
+import json
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+# سرور وب‌هوک: آپدیت‌های ارسالی با POST را دریافت و به on_update تحویل می‌دهد
+class WebhookServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host, port, path, secret, on_update):
+        self.webhook_path = path
+        self.secret = secret
+        self.on_update = on_update
+        super().__init__((host, port), WebhookHandler)
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _respond(self, status, body=b""):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+
+        if self.path != server.webhook_path:
+            self._respond(404)
+            return
+        # مقایسه با زمان ثابت برای جلوگیری از حمله زمانی
+        token = self.headers.get(SECRET_HEADER, "")
+        if server.secret and not hmac.compare_digest(token.encode(), server.secret.encode()):
+            logger.warning(f"Webhook request with invalid secret from {self.client_address[0]}")
+            self._respond(403)
+            return
+        try:
+            update = json.loads(body)
+            update["update_id"]
+        except (ValueError, KeyError, TypeError):
+            self._respond(400)
+            return
+
+        server.on_update(update)
+        self._respond(200, b'{"ok":true}')
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)